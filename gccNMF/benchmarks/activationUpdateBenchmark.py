@@ -0,0 +1,159 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import logging
+import argparse
+import numpy as np
+from numpy.fft import rfft
+from collections import OrderedDict
+
+from gccNMF.realtime.defs import COMPUTE_BACKEND_FUSED
+from gccNMF.realtime.gccNMFFunctions import performKLNMFActivations
+from gccNMF.realtime.gccNMFKernels import computeMixtureMagnitude, warmStartActivations, updateKLActivations, ACTIVATION_EPSILON
+from gccNMF.realtime.gccNMFPretraining import getDictionariesW
+from gccNMF.realtime.wavfile import wavread
+from gccNMF.benchmarks.benchmarkUtils import timeFunction, getTimingSummary, saveResults
+from gccNMF.benchmarks.processFramesBenchmark import createProcessor, getSyntheticSamples
+
+# Online activation updates (numHUpdates): the per-block cost of GCCNMFProcessor.processFrames for each
+# numHUpdates and dictionary size, and how well the warm-started activations fit the mixture compared to fitting
+# each block from a random start (performKLNMFActivations). The fit is the KL divergence D(V || W H) relative to
+# sum(V), averaged over blocks, with the pretrained dictionaries. The input is a WAV file (--inputPath) or a
+# synthetic stereo source of gliding harmonics with a syllable-rate envelope.
+
+DEFAULT_NUM_H_UPDATES = [0, 1, 2, 4, 8]
+DEFAULT_DICTIONARY_SIZES = [64, 128, 256, 512, 1024]
+DEFAULT_COLD_START_ITERATIONS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+def getHarmonicSamples(numSamples, sampleRate, delayInSamples=3, seedValue=0):
+    randomState = np.random.RandomState(seedValue)
+    times = np.arange(numSamples + delayInSamples) / float(sampleRate)
+    fundamentalInHz = 140 + 40 * np.sin(2 * np.pi * 0.7 * times)
+    phases = 2 * np.pi * np.cumsum(fundamentalInHz) / sampleRate
+    source = sum( np.sin(harmonic * phases) / harmonic for harmonic in range(1, 20) if harmonic * 180 < sampleRate / 2 )
+    source *= np.maximum( np.sin(2 * np.pi * 4 * times), 0 ) ** 2
+    source += randomState.randn(len(source)) * 0.01
+    source = (source * 0.1 / np.max(np.abs(source))).astype(np.float32)
+    return np.array( [source[delayInSamples:], source[:numSamples]] )
+
+def getInputSamples(inputPath, numSamples, sampleRate):
+    if inputPath is None:
+        return getHarmonicSamples(numSamples, sampleRate)
+    samples, _ = wavread(inputPath)
+    return samples[:, :numSamples].astype(np.float32)
+
+def getMagnitudeBlocks(samples, windowSize, windowsPerBlock):
+    # (freq, time) channel-averaged magnitudes of consecutive blocks, as GCCNMFProcessor.fitActivations computes them
+    hopSize = windowSize // 2
+    windowFunction = np.sqrt( np.hamming(windowSize).astype(np.float32) )[:, np.newaxis]
+    numBlocks = (samples.shape[1] - windowSize) // (hopSize * windowsPerBlock)
+    magnitudeBlocks = []
+    for blockIndex in range(numBlocks):
+        startIndex = blockIndex * windowsPerBlock * hopSize
+        windowedSamples = np.stack( [samples[:, startIndex + timeIndex * hopSize : startIndex + timeIndex * hopSize + windowSize]
+                                     for timeIndex in range(windowsPerBlock)], axis=-1 )
+        complexSpectrogram = rfft(windowedSamples * windowFunction, axis=1).astype(np.complex64)
+        magnitudeBlocks.append( computeMixtureMagnitude(complexSpectrogram, out=np.zeros(complexSpectrogram.shape[1:], np.float32)) )
+    return magnitudeBlocks
+
+def getRelativeKLDivergence(V, WH):
+    WH = WH + ACTIVATION_EPSILON
+    return float( np.sum( V * np.log( (V + ACTIVATION_EPSILON) / WH ) - V + WH ) / (np.sum(V) + ACTIVATION_EPSILON) )
+
+def getWarmStartDivergence(magnitudeBlocks, W, numHUpdates):
+    WSum = np.sum(W, axis=0, dtype=np.float32)[:, np.newaxis] + np.float32(ACTIVATION_EPSILON)
+    H = np.ones( (W.shape[1], magnitudeBlocks[0].shape[1]), np.float32 )
+    WH = np.zeros_like(magnitudeBlocks[0])
+    ratio = np.zeros_like(magnitudeBlocks[0])
+    divergences = []
+    for V in magnitudeBlocks:
+        warmStartActivations(V, W, H, WH)
+        updateKLActivations(V, W, H, WH, WSum, numHUpdates, ratio)
+        divergences.append( getRelativeKLDivergence(V, np.dot(W, H)) )
+    return float( np.mean(divergences) )
+
+def getColdStartDivergence(magnitudeBlocks, W, numIterations):
+    return float( np.mean( [ getRelativeKLDivergence( V, np.dot(W, performKLNMFActivations(V, W, numIterations, 0)) ) for V in magnitudeBlocks ] ) )
+
+def getEquivalentColdStartIterations(divergence, coldStartDivergences):
+    # fewest cold start iterations reaching the divergence, None if none of them do
+    for numIterations, coldStartDivergence in coldStartDivergences.items():
+        if coldStartDivergence <= divergence:
+            return numIterations
+    return None
+
+def benchmarkDictionarySize(dictionarySize, numHUpdatesList, coldStartIterations, numRepetitions, sampleRate, windowSize, windowsPerBlock, numTDOAs,
+                            magnitudeBlocks):
+    processor = createProcessor(sampleRate, windowSize, windowsPerBlock, dictionarySize, numTDOAs, COMPUTE_BACKEND_FUSED)
+    windowedSamples = getSyntheticSamples(2, windowSize * windowsPerBlock).reshape(2, windowsPerBlock, windowSize).transpose(0, 2, 1).copy()
+    W = np.ascontiguousarray( getDictionariesW(windowSize, [dictionarySize], ordered=True)['Pretrained'][dictionarySize] )
+    coldStartDivergences = OrderedDict( (numIterations, getColdStartDivergence(magnitudeBlocks, W, numIterations)) for numIterations in coldStartIterations )
+    
+    results = []
+    for numHUpdates in numHUpdatesList:
+        processor.numHUpdates = numHUpdates
+        result = OrderedDict( [('processFrames', getTimingSummary( timeFunction(lambda: processor.processFrames(windowedSamples), numRepetitions) ))] )
+        if numHUpdates > 0:
+            result['divergence'] = getWarmStartDivergence(magnitudeBlocks, W, numHUpdates)
+            result['equivalentColdStartIterations'] = getEquivalentColdStartIterations(result['divergence'], coldStartDivergences)
+        results.append( (numHUpdates, result) )
+    return results, coldStartDivergences
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Per-block cost (microseconds) and fit of warm-started activation updates')
+    parser.add_argument('--numHUpdates', type=int, nargs='+', default=DEFAULT_NUM_H_UPDATES)
+    parser.add_argument('--dictionarySizes', type=int, nargs='+', default=DEFAULT_DICTIONARY_SIZES)
+    parser.add_argument('--coldStartIterations', type=int, nargs='+', default=DEFAULT_COLD_START_ITERATIONS)
+    parser.add_argument('--inputPath', default=None, help='stereo WAV file, defaults to a synthetic harmonic source')
+    parser.add_argument('--numSeconds', type=float, default=4.0)
+    parser.add_argument('--numRepetitions', type=int, default=200)
+    parser.add_argument('--sampleRate', type=int, default=8000)
+    parser.add_argument('--windowSize', type=int, default=1024)
+    parser.add_argument('--windowsPerBlock', type=int, default=1)
+    parser.add_argument('--numTDOAs', type=int, default=64)
+    parser.add_argument('--output', default='activationUpdateBenchmark.json')
+    arguments = parser.parse_args()
+    
+    samples = getInputSamples(arguments.inputPath, int(arguments.numSeconds * arguments.sampleRate), arguments.sampleRate)
+    magnitudeBlocks = getMagnitudeBlocks(samples, arguments.windowSize, arguments.windowsPerBlock)
+    
+    results = []
+    for dictionarySize in arguments.dictionarySizes:
+        dictionaryResults, coldStartDivergences = benchmarkDictionarySize(dictionarySize, arguments.numHUpdates, arguments.coldStartIterations,
+                                                                          arguments.numRepetitions, arguments.sampleRate, arguments.windowSize,
+                                                                          arguments.windowsPerBlock, arguments.numTDOAs, magnitudeBlocks)
+        logging.info( 'ActivationUpdateBenchmark: dictionarySize %d, cold start divergence by iterations: %s' %
+                      (dictionarySize, ', '.join( '%d: %.4f' % item for item in coldStartDivergences.items() )) )
+        for numHUpdates, result in dictionaryResults:
+            config = OrderedDict( [('dictionarySize', dictionarySize), ('numHUpdates', numHUpdates), ('windowSize', arguments.windowSize),
+                                   ('windowsPerBlock', arguments.windowsPerBlock), ('numTDOAs', arguments.numTDOAs)] )
+            results.append( OrderedDict( [('config', config), ('results', result), ('coldStartDivergences', coldStartDivergences)] ) )
+            fitDescription = ', divergence %.4f (cold start: %s iterations)' % (result['divergence'], result['equivalentColdStartIterations']) if numHUpdates else ''
+            logging.info( 'ActivationUpdateBenchmark: dictionarySize %d, numHUpdates %d: processFrames %.0f us%s' %
+                          (dictionarySize, numHUpdates, result['processFrames']['p50'], fitDescription) )
+    saveResults(results, arguments.output)
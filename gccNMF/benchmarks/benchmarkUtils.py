@@ -0,0 +1,89 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import json
+import logging
+import platform
+import numpy as np
+from time import perf_counter
+from collections import OrderedDict
+
+PERCENTILES = [50, 90, 99]
+DEFAULT_REGRESSION_THRESHOLD = 0.1
+
+def timeFunction(function, numRepetitions, numWarmup=5):
+    for _ in range(numWarmup):
+        function()
+    timesInSeconds = np.empty(numRepetitions)
+    for repetitionIndex in range(numRepetitions):
+        startTime = perf_counter()
+        function()
+        timesInSeconds[repetitionIndex] = perf_counter() - startTime
+    return timesInSeconds
+
+def getTimingSummary(timesInSeconds):
+    timesInMicroseconds = np.asarray(timesInSeconds) * 1e6
+    summary = OrderedDict()
+    for percentile in PERCENTILES:
+        summary['p%d' % percentile] = float( np.percentile(timesInMicroseconds, percentile) )
+    summary['mean'] = float( np.mean(timesInMicroseconds) )
+    summary['min'] = float( np.min(timesInMicroseconds) )
+    summary['max'] = float( np.max(timesInMicroseconds) )
+    summary['count'] = len(timesInMicroseconds)
+    return summary
+
+def getEnvironment():
+    return OrderedDict( [('python', platform.python_version()), ('numpy', np.__version__),
+                         ('machine', platform.machine()), ('processor', platform.processor()), ('system', platform.system())] )
+
+def getConfigKey(config):
+    return json.dumps(config, sort_keys=True)
+
+def saveResults(results, filePath, units='microseconds'):
+    with open(filePath, 'w') as resultsFile:
+        json.dump( OrderedDict( [('units', units), ('environment', getEnvironment()), ('results', results)] ), resultsFile, indent=2 )
+    logging.info('Benchmark: saved %d results to %s' % (len(results), filePath))
+
+def loadResults(filePath):
+    with open(filePath) as resultsFile:
+        return json.load(resultsFile)['results']
+
+def compareResults(results, baselineResults, threshold=DEFAULT_REGRESSION_THRESHOLD, statistic='p50'):
+    # results: list of {'config': {...}, 'stages': {stageName: summary}}, returns a list of regression descriptions
+    baselineStages = dict( (getConfigKey(result['config']), result['stages']) for result in baselineResults )
+    regressions = []
+    for result in results:
+        baseline = baselineStages.get( getConfigKey(result['config']) )
+        if baseline is None:
+            continue
+        for stageName, summary in result['stages'].items():
+            if stageName not in baseline:
+                continue
+            baselineValue, currentValue = baseline[stageName][statistic], summary[statistic]
+            if baselineValue > 0 and currentValue > baselineValue * (1 + threshold):
+                regressions.append( '%s %s: %s %.1f us -> %.1f us (+%.0f%%)' % (getConfigKey(result['config']), stageName, statistic,
+                                                                               baselineValue, currentValue, (currentValue / baselineValue - 1) * 100) )
+    return regressions
@@ -0,0 +1,131 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import logging
+import argparse
+import numpy as np
+from collections import OrderedDict
+
+from gccNMF.realtime.gccNMFFunctions import getExpJOmegaTau, getFrequenciesInHz, getTargetTDOAGCCNMFs, getTargetCoefficientMasks, \
+    getTargetSpectrogramEstimates
+from gccNMF.realtime.gccNMFPretraining import getDictionariesW
+from gccNMF.benchmarks.benchmarkUtils import timeFunction, getTimingSummary, saveResults
+
+# Offline GCC-NMF reconstruction (gccNMFFunctions, as used by batchSeparation): the time of the batched
+# getTargetTDOAGCCNMFs, getTargetCoefficientMasks and getTargetSpectrogramEstimates against the per-target loops
+# they replaced, for each number of targets and file length, and the largest difference between their outputs.
+# Inputs are random stereo spectrograms and activations of the given length; the timings only depend on the shapes.
+
+DEFAULT_NUM_TARGETS = [1, 2, 4, 8]
+DEFAULT_DURATIONS_IN_SECONDS = [10, 30, 60]
+STAGE_NAMES = ['targetTDOAGCCNMFs', 'targetCoefficientMasks', 'targetSpectrogramEstimates']
+
+def getLoopTargetTDOAGCCNMFs(coherenceV, microphoneSeparationInMetres, numTDOAs, frequenciesInHz, targetTDOAIndexes, W, stereoH):
+    expJOmegaTau = getExpJOmegaTau(frequenciesInHz, microphoneSeparationInMetres, numTDOAs)
+    TIME, FREQ, ATOM = range(3)
+    targetTDOAGCCNMFs = np.empty( (len(targetTDOAIndexes), stereoH.shape[1], coherenceV.shape[1]), np.float32 )
+    for targetIndex, targetTDOAIndex in enumerate(targetTDOAIndexes):
+        gccChunk = np.einsum( coherenceV, [FREQ, TIME], expJOmegaTau[:, targetTDOAIndex], [FREQ], [FREQ, TIME] )
+        targetTDOAGCCNMFs[targetIndex] = np.einsum( W, [FREQ, ATOM], gccChunk, [FREQ, TIME], [ATOM, TIME] ).real
+    return targetTDOAGCCNMFs
+
+def getLoopTargetCoefficientMasks(targetTDOAGCCNMFs, numTargets):
+    nanArgMax = np.nanargmax(targetTDOAGCCNMFs, axis=0)
+    targetCoefficientMasks = np.zeros_like(targetTDOAGCCNMFs)
+    for targetIndex in range(numTargets):
+        targetCoefficientMasks[targetIndex][np.where(nanArgMax==targetIndex)] = 1
+    return targetCoefficientMasks
+
+def getLoopTargetSpectrogramEstimates(targetCoefficientMasks, complexMixtureSpectrogram, W, stereoH):
+    targetSpectrogramEstimates = np.zeros( (targetCoefficientMasks.shape[0],) + complexMixtureSpectrogram.shape, np.complex64 )
+    for targetIndex, targetCoefficientMask in enumerate(targetCoefficientMasks):
+        for channelIndex, coefficients in enumerate(stereoH):
+            targetSpectrogramEstimates[targetIndex, channelIndex] = np.dot(W, coefficients * targetCoefficientMask)
+    return targetSpectrogramEstimates * np.exp( 1j * np.angle(complexMixtureSpectrogram) )
+
+def getRandomInputs(numTime, numFrequencies, dictionarySize, seedValue=0):
+    randomState = np.random.RandomState(seedValue)
+    complexMixtureSpectrogram = ( randomState.randn(2, numFrequencies, numTime) + 1j * randomState.randn(2, numFrequencies, numTime) ).astype(np.complex64)
+    coherenceV = complexMixtureSpectrogram[0] * complexMixtureSpectrogram[1].conj() / np.abs(complexMixtureSpectrogram[0]) / np.abs(complexMixtureSpectrogram[1])
+    stereoH = randomState.rand(2, dictionarySize, numTime).astype(np.float32)
+    return complexMixtureSpectrogram, coherenceV, stereoH
+
+def getRelativeError(referenceValues, values):
+    return float( np.max( np.abs(referenceValues - values) ) / np.max( np.abs(referenceValues) ) )
+
+def benchmarkConfig(numTargets, durationInSeconds, numRepetitions, sampleRate, windowSize, hopSize, dictionarySize, numTDOAs, microphoneSeparationInMetres):
+    numFrequencies = windowSize // 2 + 1
+    numTime = int(durationInSeconds * sampleRate) // hopSize
+    W = np.asarray( getDictionariesW(windowSize, [dictionarySize])['Pretrained'][dictionarySize] )
+    complexMixtureSpectrogram, coherenceV, stereoH = getRandomInputs(numTime, numFrequencies, dictionarySize)
+    frequenciesInHz = getFrequenciesInHz(sampleRate, numFrequencies)
+    targetTDOAIndexes = list( np.linspace(0, numTDOAs-1, numTargets + 2).astype(int)[1:-1] )
+    
+    # both versions get the same inputs at every stage: the reference GCC-NMFs and masks
+    targetTDOAGCCNMFs = getLoopTargetTDOAGCCNMFs(coherenceV, microphoneSeparationInMetres, numTDOAs, frequenciesInHz, targetTDOAIndexes, W, stereoH)
+    targetCoefficientMasks = getLoopTargetCoefficientMasks(targetTDOAGCCNMFs, numTargets)
+    stageFunctions = OrderedDict( [('targetTDOAGCCNMFs', (getLoopTargetTDOAGCCNMFs, getTargetTDOAGCCNMFs,
+                                                          (coherenceV, microphoneSeparationInMetres, numTDOAs, frequenciesInHz, targetTDOAIndexes, W, stereoH))),
+                                   ('targetCoefficientMasks', (getLoopTargetCoefficientMasks, getTargetCoefficientMasks, (targetTDOAGCCNMFs, numTargets))),
+                                   ('targetSpectrogramEstimates', (getLoopTargetSpectrogramEstimates, getTargetSpectrogramEstimates,
+                                                                   (targetCoefficientMasks, complexMixtureSpectrogram, W, stereoH)))] )
+    
+    results = OrderedDict( [('numTime', numTime)] )
+    for stageName, (loopFunction, batchedFunction, arguments) in stageFunctions.items():
+        results[stageName] = OrderedDict( [('loop', getTimingSummary( timeFunction(lambda: loopFunction(*arguments), numRepetitions, numWarmup=1) )),
+                                           ('batched', getTimingSummary( timeFunction(lambda: batchedFunction(*arguments), numRepetitions, numWarmup=1) )),
+                                           ('relativeError', getRelativeError( loopFunction(*arguments), batchedFunction(*arguments) ))] )
+    return results
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Loop vs. batched offline GCC-NMF reconstruction timings (microseconds)')
+    parser.add_argument('--numTargets', type=int, nargs='+', default=DEFAULT_NUM_TARGETS)
+    parser.add_argument('--durationsInSeconds', type=float, nargs='+', default=DEFAULT_DURATIONS_IN_SECONDS)
+    parser.add_argument('--numRepetitions', type=int, default=3)
+    parser.add_argument('--sampleRate', type=int, default=16000)
+    parser.add_argument('--windowSize', type=int, default=1024)
+    parser.add_argument('--hopSize', type=int, default=512)
+    parser.add_argument('--dictionarySize', type=int, default=256)
+    parser.add_argument('--numTDOAs', type=int, default=64)
+    parser.add_argument('--microphoneSeparationInMetres', type=float, default=0.1)
+    parser.add_argument('--output', default='offlineReconstructionBenchmark.json')
+    arguments = parser.parse_args()
+    
+    results = []
+    for durationInSeconds in arguments.durationsInSeconds:
+        for numTargets in arguments.numTargets:
+            config = OrderedDict( [('numTargets', numTargets), ('durationInSeconds', durationInSeconds), ('sampleRate', arguments.sampleRate),
+                                   ('windowSize', arguments.windowSize), ('hopSize', arguments.hopSize), ('dictionarySize', arguments.dictionarySize)] )
+            result = benchmarkConfig(numTargets, durationInSeconds, arguments.numRepetitions, arguments.sampleRate, arguments.windowSize,
+                                     arguments.hopSize, arguments.dictionarySize, arguments.numTDOAs, arguments.microphoneSeparationInMetres)
+            results.append( OrderedDict( [('config', config), ('results', result)] ) )
+            logging.info( 'OfflineReconstructionBenchmark: %d targets, %.0f s: %s' % (numTargets, durationInSeconds,
+                          ', '.join( '%s %.1f -> %.1f ms (error %.1e)' % (stageName, result[stageName]['loop']['p50'] / 1e3,
+                                                                          result[stageName]['batched']['p50'] / 1e3, result[stageName]['relativeError'])
+                                     for stageName in STAGE_NAMES ) ) )
+    saveResults(results, arguments.output)
@@ -0,0 +1,180 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import sys
+import logging
+import argparse
+import itertools
+import numpy as np
+from numpy.fft import rfft
+from collections import OrderedDict
+
+from gccNMF.realtime.defs import COMPUTE_BACKEND_FUSED, COMPUTE_BACKEND_NUMPY
+from gccNMF.realtime.utils import OverlapAddProcessor
+from gccNMF.realtime.gccNMFProcessor import GCCNMFProcessor
+from gccNMF.realtime.gccNMFKernels import computeCoherence, computeStackedCoherence, computeFusedGCCPHAT, computeFusedGCCNMF, computeRealGCC, \
+    computeGCCNMF, getAtomTDOAIndexes, computeHMask, computeTFMask
+from gccNMF.benchmarks.benchmarkUtils import timeFunction, getTimingSummary, saveResults, loadResults, compareResults, DEFAULT_REGRESSION_THRESHOLD
+
+# Per-stage timings of the realtime path: GCCNMFProcessor.processFrames split into the stages it runs for the
+# Fused and NumPy backends, OverlapAddProcessor.processFrames with a pass-through processFramesFunction, and the
+# full block (OLA + processFrames) as the audio worker runs it. Inputs are synthetic stereo noise with a fixed
+# inter-channel delay and W is random, since timings do not depend on the dictionary contents.
+
+STAGES = ['rfft', 'coherence', 'gcc', 'nmfProjection', 'mask', 'irfft', 'ola', 'processFrames', 'block']
+
+DEFAULT_DICTIONARY_SIZES = [64, 128, 256, 512, 1024]
+DEFAULT_NUM_TDOAS = [32, 64, 128]
+DEFAULT_WINDOW_SIZES = [512, 1024, 2048]
+DEFAULT_WINDOWS_PER_BLOCK = [1, 2, 4]
+
+def getSyntheticSamples(numChannels, numSamples, delayInSamples=3, seedValue=0):
+    source = np.random.RandomState(seedValue).randn(numSamples + delayInSamples).astype(np.float32) * 0.1
+    samples = np.zeros( (numChannels, numSamples), np.float32 )
+    samples[0] = source[delayInSamples:]
+    samples[1] = source[:numSamples]
+    return samples
+
+def createProcessor(sampleRate, windowSize, windowsPerBlock, dictionarySize, numTDOAs, computeBackend, microphoneSeparationInMetres=0.05):
+    numFrequencies = windowSize // 2 + 1
+    W = np.random.RandomState(1).rand(numFrequencies, dictionarySize).astype(np.float32) + 1e-3
+    W /= np.sum(W, axis=0)
+    dictionariesW = {'Pretrained': {dictionarySize: W}}
+    
+    processor = GCCNMFProcessor(sampleRate, windowSize, windowsPerBlock, dictionariesW, 'Pretrained', dictionarySize, 0,
+                                microphoneSeparationInMetres, False, 6, computeBackend=computeBackend)
+    processor.numTDOAs = numTDOAs
+    processor.reset()
+    processor.setTargetTDOARange(numTDOAs / 2.0, 3.2, 2.0, 0.0)
+    return processor
+
+def getStageFunctions(processor, windowedSamples):
+    # closures running one stage each on the state left by the previous stage, in processFrames order
+    state = {}
+    def stageRFFT():
+        processor.complexMixtureSpectrogram[:] = rfft(windowedSamples * processor.windowFunction, axis=1).astype(np.complex64)
+    def stageMask():
+        HMask = computeHMask(getAtomTDOAIndexes(state['gccNMF']), processor.targetMode, processor.targetTDOAIndex,
+                             processor.targetTDOAEpsilon, processor.targetTDOABeta, processor.targetTDOANoiseFloor)
+        state['inputMask'] = computeTFMask(processor.W, HMask, processor.recV)
+    def stageIRFFT():
+        return np.fft.irfft(state['inputMask'] * processor.complexMixtureSpectrogram, axis=1) * processor.synthesisWindowFunction
+    
+    if processor.computeBackend == COMPUTE_BACKEND_FUSED:
+        def stageCoherence():
+            state['numValidFrequencies'] = computeStackedCoherence(processor.complexMixtureSpectrogram, out=processor.stackedCoherence)
+        def stageGCC():
+            computeFusedGCCPHAT(processor.steeringMatrix, processor.stackedCoherence, state['numValidFrequencies'])
+        def stageNMFProjection():
+            state['gccNMF'] = computeFusedGCCNMF(processor.steeringMatrix, processor.stackedCoherence, processor.W, processor.gccScratch, out=processor.gccNMF)
+    elif processor.computeBackend == COMPUTE_BACKEND_NUMPY:
+        def stageCoherence():
+            state['coherenceV'] = computeCoherence(processor.complexMixtureSpectrogram)
+        def stageGCC():
+            state['realGCC'] = computeRealGCC(state['coherenceV'], processor.expJOmegaTau)
+            np.nanmean(state['realGCC'], axis=0)
+        def stageNMFProjection():
+            state['gccNMF'] = computeGCCNMF(state['realGCC'], processor.W)
+    else:
+        raise ValueError('ProcessFramesBenchmark: per-stage timings are not available for the %s backend' % processor.computeBackend)
+    
+    return OrderedDict( [('rfft', stageRFFT), ('coherence', stageCoherence), ('gcc', stageGCC),
+                         ('nmfProjection', stageNMFProjection), ('mask', stageMask), ('irfft', stageIRFFT)] )
+
+def benchmarkConfig(config, numRepetitions, sampleRate=16000, numChannels=2):
+    windowSize, windowsPerBlock = config['windowSize'], config['windowsPerBlock']
+    hopSize = windowSize // 2
+    blockSize = hopSize * windowsPerBlock
+    
+    processor = createProcessor(sampleRate, windowSize, windowsPerBlock, config['dictionarySize'], config['numTDOAs'], config['computeBackend'])
+    oladProcessor = OverlapAddProcessor(numChannels, windowSize, hopSize, blockSize, windowsPerBlock)
+    
+    numBlocks = oladProcessor.numBlocksPerBuffer * 2
+    inputBlocks = getSyntheticSamples(numChannels, numBlocks * blockSize).T.reshape(numBlocks, -1).copy()
+    outputSamples = np.zeros(numChannels * blockSize, np.float32)
+    
+    blockIndexes = itertools.cycle( range(numBlocks) )
+    def processBlock(processFramesFunction):
+        oladProcessor.processFrames(processFramesFunction, inputBlocks[next(blockIndexes)], outputSamples)
+    for _ in range(numBlocks):
+        processBlock(processor.processFrames)
+    
+    windowedSamples = np.ascontiguousarray(oladProcessor.windowedSampleViews[oladProcessor.headBlockIndex - 1])
+    passThroughFrames = np.zeros( (numChannels, windowSize, windowsPerBlock), np.float32 )
+    
+    stageTimes = OrderedDict()
+    for stageName, stageFunction in getStageFunctions(processor, windowedSamples).items():
+        stageFunction()
+        stageTimes[stageName] = timeFunction(stageFunction, numRepetitions)
+    stageTimes['ola'] = timeFunction(lambda: processBlock(lambda frames: passThroughFrames), numRepetitions)
+    stageTimes['processFrames'] = timeFunction(lambda: processor.processFrames(windowedSamples), numRepetitions)
+    stageTimes['block'] = timeFunction(lambda: processBlock(processor.processFrames), numRepetitions)
+    
+    stages = OrderedDict( (stageName, getTimingSummary(times)) for stageName, times in stageTimes.items() )
+    stages['block']['budgetFraction'] = stages['block']['p99'] / (1e6 * blockSize / float(sampleRate))
+    return stages
+
+def getConfigs(dictionarySizes, numTDOAs, windowSizes, windowsPerBlocks, computeBackends):
+    return [ OrderedDict( [('computeBackend', computeBackend), ('windowSize', windowSize), ('windowsPerBlock', windowsPerBlock),
+                           ('numTDOAs', numTDOA), ('dictionarySize', dictionarySize)] )
+             for computeBackend, windowSize, windowsPerBlock, numTDOA, dictionarySize in
+             itertools.product(computeBackends, windowSizes, windowsPerBlocks, numTDOAs, dictionarySizes) ]
+
+def runBenchmark(configs, numRepetitions=200, sampleRate=16000):
+    results = []
+    for configIndex, config in enumerate(configs):
+        stages = benchmarkConfig(config, numRepetitions, sampleRate)
+        results.append( OrderedDict( [('config', config), ('stages', stages)] ) )
+        logging.info( 'ProcessFramesBenchmark: %d/%d %s: %s' % (configIndex+1, len(configs), dict(config),
+                      ', '.join('%s %.0f' % (stageName, summary['p50']) for stageName, summary in stages.items())) )
+    return results
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Per-stage timings (microseconds) of the realtime GCC-NMF processFrames path')
+    parser.add_argument('--dictionarySizes', type=int, nargs='+', default=DEFAULT_DICTIONARY_SIZES)
+    parser.add_argument('--numTDOAs', type=int, nargs='+', default=DEFAULT_NUM_TDOAS)
+    parser.add_argument('--windowSizes', type=int, nargs='+', default=DEFAULT_WINDOW_SIZES)
+    parser.add_argument('--windowsPerBlock', type=int, nargs='+', default=DEFAULT_WINDOWS_PER_BLOCK)
+    parser.add_argument('--computeBackends', nargs='+', default=[COMPUTE_BACKEND_FUSED], choices=[COMPUTE_BACKEND_FUSED, COMPUTE_BACKEND_NUMPY])
+    parser.add_argument('--numRepetitions', type=int, default=200)
+    parser.add_argument('--sampleRate', type=int, default=16000)
+    parser.add_argument('--output', default='processFramesBenchmark.json')
+    parser.add_argument('--baseline', default=None, help='results JSON to compare against; exits with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD, help='relative p50 slowdown counted as a regression')
+    arguments = parser.parse_args()
+    
+    configs = getConfigs(arguments.dictionarySizes, arguments.numTDOAs, arguments.windowSizes, arguments.windowsPerBlock, arguments.computeBackends)
+    results = runBenchmark(configs, arguments.numRepetitions, arguments.sampleRate)
+    saveResults(results, arguments.output)
+    
+    if arguments.baseline:
+        regressions = compareResults(results, loadResults(arguments.baseline), arguments.threshold)
+        for regression in regressions:
+            logging.warning('ProcessFramesBenchmark: regression %s' % regression)
+        logging.info('ProcessFramesBenchmark: %d regressions against %s' % (len(regressions), arguments.baseline))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,159 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import sys
+import logging
+import argparse
+import threading
+import numpy as np
+from queue import Queue
+from time import sleep
+from collections import OrderedDict
+
+from gccNMF.realtime.defs import TARGET_MODE_WINDOW_FUNCTION
+from gccNMF.realtime.utils import SharedMemoryBlockRing, OverlapAddProcessor
+from gccNMF.realtime.gccNMFProcessor import GCCNMFProcess, GCCNMFProcessor
+from gccNMF.benchmarks.processFramesBenchmark import getSyntheticSamples
+
+# Deadline check of GCCNMFProcess reconfiguration on a virtual clock. Every thread has its own virtual timeline,
+# and the instrumented GCCNMFProcessor.processFrames and reset() charge a modelled cost to the timeline of the
+# thread running them. Block n arrives at n * blockDuration and the worker loop (this thread, stepping
+# GCCNMFProcess) misses its deadline if it finishes the block after (n + 1) * blockDuration. The result depends
+# only on where reset() runs, not on the speed of the machine: with hot reconfiguration the reset is charged to the
+# builder thread and no block may miss its deadline, synchronously every reconfiguration stalls the worker.
+# gccNMF/tests/test_reconfiguration.py asserts this; the script reports the lateness and swap timings.
+
+class VirtualClock(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.threadTimes = {}
+    
+    def now(self):
+        with self.lock:
+            # a new thread starts at the latest time of any thread, i.e. about when it was started
+            return self.threadTimes.setdefault( threading.get_ident(), max(self.threadTimes.values() or [0.0]) )
+    
+    def advance(self, seconds):
+        currentTime = self.now()
+        with self.lock:
+            self.threadTimes[threading.get_ident()] = currentTime + seconds
+    
+    def waitUntil(self, virtualTime):
+        self.advance( max(0.0, virtualTime - self.now()) )
+
+def instrumentProcessor(clock, processingCost, resetCost):
+    processFrames, reset = GCCNMFProcessor.processFrames, GCCNMFProcessor.reset
+    def chargedProcessFrames(self, windowedSamples):
+        clock.advance(processingCost)
+        return processFrames(self, windowedSamples)
+    def chargedReset(self):
+        clock.advance(resetCost)
+        return reset(self)
+    GCCNMFProcessor.processFrames = chargedProcessFrames
+    GCCNMFProcessor.reset = chargedReset
+    return processFrames, reset
+
+def createProcess(sampleRate, windowSize, blockSize, dictionarySizes, hotReconfigurationEnabled, seedValue=1):
+    numChannels, hopSize = 2, windowSize // 2
+    windowsPerBlock = blockSize // hopSize
+    randomState = np.random.RandomState(seedValue)
+    dictionariesW = {'Pretrained': dict( (dictionarySize, randomState.rand(windowSize // 2 + 1, dictionarySize).astype(np.float32) + 1e-3)
+                                         for dictionarySize in dictionarySizes )}
+    oladProcessor = OverlapAddProcessor(numChannels, windowSize, hopSize, blockSize, windowsPerBlock)
+    inputRing = SharedMemoryBlockRing(8, numChannels * blockSize)
+    outputRing = SharedMemoryBlockRing(8, numChannels * blockSize, wakeupEnabled=False)
+    return GCCNMFProcess(oladProcessor, sampleRate, windowSize, windowsPerBlock, dictionariesW, 'Pretrained', dictionarySizes[0], 0, 0.05, False, 6,
+                         None, None, None, None, None, Queue(), threading.Event(), Queue(), threading.Event(),
+                         inputRing, outputRing, threading.Event(), hotReconfigurationEnabled=hotReconfigurationEnabled)
+
+def runReconfigurations(hotReconfigurationEnabled, reconfigurations, numBlocks, sampleRate, windowSize, blockSize, processingCost, resetCost):
+    # reconfigurations: {blockIndex: parameters}, returns the per-block finish times relative to their deadlines
+    dictionarySizes = sorted( set( [256] + [ parameters['dictionarySize'] for parameters in reconfigurations.values() if 'dictionarySize' in parameters ] ) )
+    process = createProcess(sampleRate, windowSize, blockSize, dictionarySizes, hotReconfigurationEnabled)
+    blockDuration = blockSize / float(sampleRate)
+    samples = getSyntheticSamples(2, (numBlocks + 1) * blockSize)
+    
+    clock = VirtualClock()
+    originalMethods = instrumentProcessor(clock, processingCost * blockDuration, resetCost * blockDuration)
+    try:
+        # the first reset happens before playback starts, like RealtimePipeline.play
+        process.togglePlayQueue.put( {'numTDOAs': 64, 'dictionarySize': dictionarySizes[0]} )
+        process.step(timeout=0)
+        startTime = clock.now()
+        
+        lateness, swapBlocks = [], []
+        for blockIndex in range(numBlocks):
+            arrivalTime = startTime + blockIndex * blockDuration
+            clock.waitUntil(arrivalTime)
+            if blockIndex in reconfigurations:
+                process.togglePlayQueue.put(reconfigurations[blockIndex])
+            process.inputRing.writeSlot()[:] = samples[:, blockIndex*blockSize:(blockIndex+1)*blockSize].T.reshape(-1)
+            process.inputRing.commitWrite()
+            
+            processor = process.gccNMFProcessor
+            process.step(timeout=0)
+            if process.gccNMFProcessor is not processor:
+                swapBlocks.append(blockIndex)
+            lateness.append( clock.now() - (arrivalTime + blockDuration) )
+            
+            if process.outputRing.numAvailable():
+                process.outputRing.commitRead()
+            # lets a builder thread run in real time, so swaps happen within the run
+            sleep(0.002)
+        
+        while process.isReconfiguring():
+            sleep(0.01)
+            process.step(timeout=0)
+    finally:
+        GCCNMFProcessor.processFrames, GCCNMFProcessor.reset = originalMethods
+    
+    processor = process.gccNMFProcessor
+    return OrderedDict( [('hotReconfigurationEnabled', hotReconfigurationEnabled),
+                         ('deadlineMisses', int( np.sum(np.array(lateness) > 0) )),
+                         ('maxLatenessInBlocks', float( np.max(lateness) / blockDuration )),
+                         ('swapBlocks', swapBlocks),
+                         ('finalConfig', OrderedDict( [('numTDOAs', processor.numTDOAs), ('dictionarySize', processor.dictionarySize)] ))] )
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    
+    parser = argparse.ArgumentParser(description='Virtual clock deadline check of hot GCC-NMF reconfiguration; exits with status 1 on deadline misses')
+    parser.add_argument('--numBlocks', type=int, default=120)
+    parser.add_argument('--sampleRate', type=int, default=16000)
+    parser.add_argument('--windowSize', type=int, default=1024)
+    parser.add_argument('--blockSize', type=int, default=512)
+    parser.add_argument('--processingCost', type=float, default=0.3, help='modelled processFrames cost, in block durations')
+    parser.add_argument('--resetCost', type=float, default=8.0, help='modelled reset cost, in block durations')
+    arguments = parser.parse_args()
+    
+    reconfigurations = { 20: {'numTDOAs': 128}, 50: {'dictionarySize': 512}, 51: {'numTDOAs': 32, 'dictionarySize': 256}, 80: {'targetMode': TARGET_MODE_WINDOW_FUNCTION} }
+    results = [ runReconfigurations(hotReconfigurationEnabled, reconfigurations, arguments.numBlocks, arguments.sampleRate, arguments.windowSize,
+                                    arguments.blockSize, arguments.processingCost, arguments.resetCost)
+                for hotReconfigurationEnabled in [True, False] ]
+    for result in results:
+        print( 'hotReconfigurationEnabled %s: %d deadline misses, max lateness %.2f blocks, swaps at blocks %s, final config %s' %
+               (result['hotReconfigurationEnabled'], result['deadlineMisses'], result['maxLatenessInBlocks'], result['swapBlocks'], dict(result['finalConfig'])) )
+    sys.exit(1 if results[0]['deadlineMisses'] else 0)
@@ -0,0 +1,99 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import sys
+import json
+import logging
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from os.path import join
+from collections import OrderedDict
+
+from gccNMF.benchmarks.benchmarkUtils import getTimingSummary, saveResults, loadResults, compareResults, DEFAULT_REGRESSION_THRESHOLD
+
+# Cold start timings of the headless realtime pipeline (python -m gccNMF.realtime.pipeline --fast on a virtual device),
+# each run in a fresh interpreter: the startup milestones up to the first separated audio block, and the worker's
+# dictionary load, precomputation and graph build times. Also lists heavy modules the realtime imports pull in.
+
+STARTUP_METRICS = ['imports', 'config', 'pipelineCreated', 'processesStarted', 'firstAudioBlock', 'dictionaryLoadTime', 'precomputationTime', 'graphBuildTime']
+# only needed offline (batch separation, pretraining) or by the UI
+HEAVY_MODULES = ['scipy', 'sklearn', 'six', 'theano', 'kivy']
+
+def writeSyntheticInput(filePath, sampleRate=16000, durationInSeconds=1.0):
+    from gccNMF.realtime.wavfile import wavwrite
+    samples = np.random.RandomState(0).randn(2, int(sampleRate * durationInSeconds)).astype(np.float32) * 0.1
+    wavwrite(samples, filePath, sampleRate)
+
+def getRealtimeHeavyModules():
+    code = 'import sys, gccNMF.realtime.pipeline; print(" ".join(m for m in %r if m in sys.modules))' % HEAVY_MODULES
+    return subprocess.check_output( [sys.executable, '-c', code] ).decode().split()
+
+def runStartup(inputPath, timeoutInSeconds=60):
+    command = [sys.executable, '-m', 'gccNMF.realtime.pipeline', inputPath, '--fast', '--timeout', str(timeoutInSeconds)]
+    output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+    return json.loads(output.decode())['startup']
+
+def runBenchmark(numRuns, inputPath):
+    reports = [ runStartup(inputPath) for _ in range(numRuns) ]
+    stages = OrderedDict()
+    for metricName in STARTUP_METRICS:
+        values = [ report[metricName] for report in reports if report.get(metricName) is not None ]
+        if values:
+            stages[metricName] = getTimingSummary(values)
+    return [ OrderedDict( [('config', OrderedDict( [('benchmark', 'startup')] )), ('stages', stages)] ) ]
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Cold start timings (microseconds) of the headless realtime pipeline')
+    parser.add_argument('--inputPath', default=None, help='16 bit stereo WAV file, by default 1 s of synthetic noise')
+    parser.add_argument('--numRuns', type=int, default=5)
+    parser.add_argument('--output', default='startupBenchmark.json')
+    parser.add_argument('--baseline', default=None, help='results JSON to compare against; exits with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD, help='relative p50 slowdown counted as a regression')
+    arguments = parser.parse_args()
+    
+    heavyModules = getRealtimeHeavyModules()
+    if heavyModules:
+        logging.warning('StartupBenchmark: realtime imports load %s' % ', '.join(heavyModules))
+    
+    inputPath = arguments.inputPath
+    if inputPath is None:
+        inputPath = join(tempfile.mkdtemp(), 'startupBenchmark.wav')
+        writeSyntheticInput(inputPath)
+    results = runBenchmark(arguments.numRuns, inputPath)
+    for stageName, summary in results[0]['stages'].items():
+        logging.info('StartupBenchmark: %s p50 %.1f ms (min %.1f, max %.1f)' % (stageName, summary['p50'] / 1e3, summary['min'] / 1e3, summary['max'] / 1e3))
+    saveResults(results, arguments.output)
+    
+    if arguments.baseline:
+        regressions = compareResults(results, loadResults(arguments.baseline), arguments.threshold)
+        for regression in regressions:
+            logging.warning('StartupBenchmark: regression %s' % regression)
+        logging.info('StartupBenchmark: %d regressions against %s' % (len(regressions), arguments.baseline))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,147 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import logging
+import argparse
+import numpy as np
+from numpy.fft import rfft
+from collections import OrderedDict
+
+from gccNMF.realtime.defs import COMPUTE_BACKEND_FUSED, TDOA_SEARCH_HIERARCHICAL
+from gccNMF.realtime.gccNMFKernels import computeStackedCoherence, computeFusedGCCNMF, getAtomTDOAIndexes, computeHMask, \
+    getCoarseTDOAIndexes, computeHierarchicalAtomTDOAIndexes
+from gccNMF.benchmarks.benchmarkUtils import timeFunction, getTimingSummary, saveResults
+from gccNMF.benchmarks.processFramesBenchmark import createProcessor
+
+# Exhaustive vs. coarse-to-fine (hierarchical) atom TDOA search: the time to go from the stacked coherence to
+# the per-atom TDOA indexes, and how closely the hierarchical indexes and the resulting HMask follow the
+# exhaustive ones. Inputs are two alternating bursty sources at different inter-channel delays, so the GCC-NMF
+# surfaces have two competing peaks.
+
+DEFAULT_NUM_TDOAS = [64, 128, 256, 512]
+DEFAULT_COARSE_STRIDES = [4, 8]
+
+def getTwoSourceSamples(numSamples, delaysInSamples=(-4, 3), burstSize=2048, seedValue=0):
+    randomState = np.random.RandomState(seedValue)
+    maxDelay = max( abs(delay) for delay in delaysInSamples )
+    samples = np.zeros( (2, numSamples), np.float32 )
+    for sourceIndex, delay in enumerate(delaysInSamples):
+        source = randomState.randn(numSamples + 2 * maxDelay).astype(np.float32) * 0.1
+        envelope = np.repeat( (np.arange( (numSamples + 2 * maxDelay) // burstSize + 1 ) % 2) == sourceIndex, burstSize )[:len(source)]
+        source *= envelope + 0.05
+        samples[0] += source[maxDelay:maxDelay+numSamples]
+        samples[1] += source[maxDelay-delay:maxDelay-delay+numSamples]
+    return samples
+
+def getStackedCoherences(processor, samples, numBlocks):
+    # stacked coherence of consecutive blocks, as processFrames computes it
+    windowSize, numTime, hopSize = processor.windowSize, processor.numTimePerChunk, processor.windowSize // 2
+    stackedCoherences = []
+    for blockIndex in range(numBlocks):
+        startIndex = blockIndex * numTime * hopSize
+        windowedSamples = np.stack( [samples[:, startIndex + timeIndex * hopSize : startIndex + timeIndex * hopSize + windowSize]
+                                     for timeIndex in range(numTime)], axis=-1 )
+        processor.complexMixtureSpectrogram[:] = rfft(windowedSamples * processor.windowFunction, axis=1).astype(np.complex64)
+        computeStackedCoherence(processor.complexMixtureSpectrogram, out=processor.stackedCoherence)
+        stackedCoherences.append( processor.stackedCoherence.copy() )
+    return stackedCoherences
+
+def getHMask(processor, atomTDOAIndexes):
+    return computeHMask(atomTDOAIndexes, processor.targetMode, processor.targetTDOAIndex,
+                        processor.targetTDOAEpsilon, processor.targetTDOABeta, processor.targetTDOANoiseFloor)
+
+def benchmarkConfig(numTDOAs, coarseStride, numCandidates, numRepetitions, sampleRate, windowSize, windowsPerBlock, dictionarySize,
+                    microphoneSeparationInMetres, numBlocks):
+    processor = createProcessor(sampleRate, windowSize, windowsPerBlock, dictionarySize, numTDOAs, COMPUTE_BACKEND_FUSED, microphoneSeparationInMetres)
+    samples = getTwoSourceSamples( (numBlocks * windowsPerBlock + 1) * windowSize // 2 )
+    stackedCoherences = getStackedCoherences(processor, samples, numBlocks)
+    
+    coarseTDOAIndexes = getCoarseTDOAIndexes(numTDOAs, coarseStride)
+    coarseSteeringMatrix = np.ascontiguousarray(processor.steeringMatrix[coarseTDOAIndexes])
+    coarseScratch = np.zeros( (windowsPerBlock, len(coarseTDOAIndexes), processor.gccScratch.shape[-1]), np.float32 )
+    coarseGCCNMF = np.zeros( (windowsPerBlock, len(coarseTDOAIndexes), dictionarySize), np.float32 )
+    
+    def exhaustiveSearch(stackedCoherence):
+        computeFusedGCCNMF(processor.steeringMatrix, stackedCoherence, processor.W, processor.gccScratch, out=processor.gccNMF)
+        return getAtomTDOAIndexes(processor.gccNMF).astype(np.float32)
+    def hierarchicalSearch(stackedCoherence):
+        return computeHierarchicalAtomTDOAIndexes(processor.steeringMatrix, coarseSteeringMatrix, coarseTDOAIndexes, coarseStride,
+                                                  stackedCoherence, processor.W, coarseScratch, coarseGCCNMF, numCandidates)
+    
+    # target the most common exhaustive atom TDOA (one of the sources), with the default epsilon scaled to numTDOAs
+    exhaustiveIndexes = [ exhaustiveSearch(stackedCoherence) for stackedCoherence in stackedCoherences ]
+    targetTDOAIndex = np.argmax( np.bincount( np.concatenate(exhaustiveIndexes, axis=None).astype(int), minlength=numTDOAs ) )
+    processor.setTargetTDOARange(targetTDOAIndex, 3.2 * numTDOAs / 64.0, 2.0, 0.0)
+    
+    absoluteErrors, argmaxAgreements, hMaskErrors = [], [], []
+    for stackedCoherence, exhaustiveIndexes in zip(stackedCoherences, exhaustiveIndexes):
+        hierarchicalIndexes = hierarchicalSearch(stackedCoherence)
+        absoluteErrors.append( np.abs(hierarchicalIndexes - exhaustiveIndexes) )
+        argmaxAgreements.append( np.round(hierarchicalIndexes) == exhaustiveIndexes )
+        hMaskErrors.append( np.abs(getHMask(processor, hierarchicalIndexes) - getHMask(processor, exhaustiveIndexes)) )
+    
+    stackedCoherence = stackedCoherences[0]
+    return OrderedDict( [('exhaustive', getTimingSummary( timeFunction(lambda: exhaustiveSearch(stackedCoherence), numRepetitions) )),
+                         ('hierarchical', getTimingSummary( timeFunction(lambda: hierarchicalSearch(stackedCoherence), numRepetitions) )),
+                         ('numCoarseTDOAs', len(coarseTDOAIndexes)),
+                         ('argmaxAgreement', float( np.mean(argmaxAgreements) )),
+                         ('meanAbsoluteIndexError', float( np.mean(absoluteErrors) )),
+                         ('maxAbsoluteIndexError', float( np.max(absoluteErrors) )),
+                         ('meanHMaskError', float( np.mean(hMaskErrors) ))] )
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Exhaustive vs. hierarchical atom TDOA search timings (microseconds) and accuracy')
+    parser.add_argument('--numTDOAs', type=int, nargs='+', default=DEFAULT_NUM_TDOAS)
+    parser.add_argument('--coarseStrides', type=int, nargs='+', default=DEFAULT_COARSE_STRIDES)
+    parser.add_argument('--numCandidates', type=int, default=1)
+    parser.add_argument('--numRepetitions', type=int, default=100)
+    parser.add_argument('--numBlocks', type=int, default=32)
+    parser.add_argument('--sampleRate', type=int, default=16000)
+    parser.add_argument('--windowSize', type=int, default=1024)
+    parser.add_argument('--windowsPerBlock', type=int, default=2)
+    parser.add_argument('--dictionarySize', type=int, default=256)
+    parser.add_argument('--microphoneSeparationInMetres', type=float, default=0.2)
+    parser.add_argument('--output', default='tdoaSearchBenchmark.json')
+    arguments = parser.parse_args()
+    
+    results = []
+    for numTDOAs in arguments.numTDOAs:
+        for coarseStride in arguments.coarseStrides:
+            config = OrderedDict( [('tdoaSearch', TDOA_SEARCH_HIERARCHICAL), ('numTDOAs', numTDOAs), ('tdoaCoarseStride', coarseStride),
+                                   ('tdoaNumCandidates', arguments.numCandidates), ('windowSize', arguments.windowSize),
+                                   ('windowsPerBlock', arguments.windowsPerBlock), ('dictionarySize', arguments.dictionarySize)] )
+            result = benchmarkConfig(numTDOAs, coarseStride, arguments.numCandidates, arguments.numRepetitions, arguments.sampleRate,
+                                     arguments.windowSize, arguments.windowsPerBlock, arguments.dictionarySize,
+                                     arguments.microphoneSeparationInMetres, arguments.numBlocks)
+            results.append( OrderedDict( [('config', config), ('results', result)] ) )
+            logging.info( 'TDOASearchBenchmark: numTDOAs %d, stride %d: exhaustive %.0f us, hierarchical %.0f us (%.1fx), '
+                          'argmax agreement %.3f, mean |index error| %.3f, mean |HMask error| %.4f' %
+                          (numTDOAs, coarseStride, result['exhaustive']['p50'], result['hierarchical']['p50'],
+                           result['exhaustive']['p50'] / result['hierarchical']['p50'], result['argmaxAgreement'],
+                           result['meanAbsoluteIndexError'], result['meanHMaskError']) )
+    saveResults(results, arguments.output)
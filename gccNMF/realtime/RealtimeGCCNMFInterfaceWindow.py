@@ -3,17 +3,39 @@ from kivy.uix.slider import Slider
 from kivy.uix.button import Button
 import logging
 import numpy as np
+from time import perf_counter
 from kivy.clock import Clock
 from kivy.garden.graph import Graph
 from kivy.garden.graph import MeshLinePlot
 
 
+# MeshLinePlot over a fixed set of x values: y values are copied into a preallocated array and the mesh vertices
+# are computed in place with numpy when the graph draws, instead of from a list of point tuples (linear axes only).
+class ArrayMeshLinePlot(MeshLinePlot):
+    def __init__(self, xValues, **kwargs):
+        super(ArrayMeshLinePlot, self).__init__(**kwargs)
+        self.xValues = np.asarray(xValues, np.float32)
+        self.yValues = np.zeros_like(self.xValues)
+        self.vertices = np.zeros(4 * len(self.xValues), np.float32)
+    
+    def setValues(self, yValues):
+        self.yValues[:] = yValues
+        self.ask_draw()
+    
+    def plot_mesh(self):
+        self.vertices[0::4] = self.x_px()(self.xValues)
+        self.vertices[1::4] = self.y_px()(self.yValues)
+        if len(self._mesh.indices) != len(self.xValues):
+            self._mesh.indices = list(range(len(self.xValues)))
+        self._mesh.vertices = self.vertices.tolist()
+
+
 class RealtimeGCCNMFInterfaceWindow(GridLayout):
     def __init__(self, params,
                  gccPHATHistory, tdoaHistory, inputSpectrogramHistory, outputSpectrogramHistory, coefficientMaskHistories,
                  togglePlayAudioProcessQueue, togglePlayAudioProcessAck,
                  togglePlayGCCNMFProcessQueue, togglePlayGCCNMFProcessAck,
-                 tdoaParamsGCCNMFProcessQueue, tdoaParamsGCCNMFProcessAck):
+                 tdoaParameterBlock, uiStats=None):
 
         super(RealtimeGCCNMFInterfaceWindow, self).__init__()
         self.numTDOAs = params.numTDOAs
@@ -29,14 +51,20 @@ class RealtimeGCCNMFInterfaceWindow(GridLayout):
         self.togglePlayAudioProcessAck = togglePlayAudioProcessAck
         self.togglePlayGCCNMFProcessQueue = togglePlayGCCNMFProcessQueue
         self.togglePlayGCCNMFProcessAck = togglePlayGCCNMFProcessAck
-        self.tdoaParamsGCCNMFProcessQueue =tdoaParamsGCCNMFProcessQueue
-        self.tdoaParamsGCCNMFProcessAck = tdoaParamsGCCNMFProcessAck
+        # slider changes are written to shared memory without waiting, the worker applies the latest once per block
+        self.tdoaParameterBlock = tdoaParameterBlock
         # self.toggleSeparationGCCNMFProcessQueue = toggleSeparationGCCNMFProcessQueue
         # self.toggleSeparationGCCNMFProcessAck = toggleSeparationGCCNMFProcessAck
 
-        self.timer = Clock.schedule_interval(self.updateSlider, 0.01)
+        # redraws at uiRefreshRate, and only when the histories or the target parameters have changed
+        self.uiStats = uiStats
+        self.lastHistorySequences = None
+        self.lastTargetParameters = None
+        self.timer = Clock.schedule_interval(self.updateSlider, 1.0 / params.uiRefreshRate)
         self.tdoas = np.arange(self.numTDOAs).astype(np.float32)
         self.tdoaT = np.arange(self.numTDOAs)
+        self.targetValues = np.zeros(self.numTDOAs, np.float32)
+        self.gccPHATValues = np.zeros(self.numTDOAs, np.float32)
         self.initWindow()
 
     def initWindow(self):
@@ -58,10 +86,11 @@ class RealtimeGCCNMFInterfaceWindow(GridLayout):
                         x_ticks_major=10, y_ticks_major=0.5, x_grid_label=False,
                         padding=5,
                         x_grid=False, y_grid=False, xmin=0, xmax=self.numTDOAs, ymin=-0.5, ymax=1.5)
-        self.gaussianplot = MeshLinePlot(color=[1, 0, 0, 1])  # 사용자가 선택하는 target TDOA 정규 분포
-        self.calculated_plot = MeshLinePlot(color=[0, 1, 0, 1])  # gccPHAT으로 분석된 TDOA plot
+        self.gaussianplot = ArrayMeshLinePlot(self.tdoas, color=[1, 0, 0, 1])  # 사용자가 선택하는 target TDOA 정규 분포
+        self.calculated_plot = ArrayMeshLinePlot(self.tdoas, color=[0, 1, 0, 1])  # gccPHAT으로 분석된 TDOA plot
 
         self.graph.add_plot(self.gaussianplot)
+        self.graph.add_plot(self.calculated_plot)
         self.add_widget(self.graph)
 
     def OnSliderValueChange(self, instance, value):
@@ -125,45 +154,57 @@ class RealtimeGCCNMFInterfaceWindow(GridLayout):
         return windowWidth
 
     def tdoaRegionChanged(self):
-        self.queueParams(self.tdoaParamsGCCNMFProcessQueue,
-                         self.tdoaParamsGCCNMFProcessAck,
-                         {'targetTDOAIndex': self.getTDOA(),
-                          'targetTDOAEpsilon': self.getWindowWidth(),
-                          # 'targetTDOAEpsilon': self.targetWindowFunctionPlot.getWindowWidth(),  # targetTDOAEpsilon,
-                          'targetTDOABeta': self.getBeta(),
-                          'targetTDOANoiseFloor': self.getNoiseFloor()
-                          },
-                         'gccNMFProcessTDOAParameters (region)')
+        self.tdoaParameterBlock.write(targetTDOAIndex=self.getTDOA(),
+                                      targetTDOAEpsilon=self.getWindowWidth(),
+                                      # targetTDOAEpsilon=self.targetWindowFunctionPlot.getWindowWidth(),
+                                      targetTDOABeta=self.getBeta(),
+                                      targetTDOANoiseFloor=self.getNoiseFloor())
 
     def updateSlider(self, value):
-        sliderValue = self.tdoaHistory.get()[0] / (self.numTDOAs - 1) * 100
-        self.targetModeTDOASlider.value = int(sliderValue)
-        self.updatePlot()
-
-
-    def updatePlot(self):
-        self.graph.remove_plot(self.gaussianplot)  # 기존의 plot 삭제, gui로 보기 좋도록
-        self.graph.remove_plot(self.calculated_plot)  # 삭제
-
-        mu = self.getTDOA()
-        alpha = self.getWindowWidth()
-        beta = self.getBeta()
-        noiseFloor = self.getNoiseFloor()
-        data = generalizedGaussian(self.tdoas, alpha, beta, mu)  # 이것이 현재 들리는 소리의 tdoa를 표현
-        data -= min(data)
-        data = data / max(data) * (1 - noiseFloor) + noiseFloor
-
-        self.gaussianplot.points = [(x, data[x]) for x in range(0, self.numTDOAs)]
-        self.graph.add_plot(self.gaussianplot)
-
-        gccPHATValues = np.squeeze(np.mean(self.gccPHATHistory.values, axis=-1))
-        gccPHATValues -= min(gccPHATValues)
-        gccPHATValues /= max(gccPHATValues)
-        self.calculated_plot.points = [(x, gccPHATValues[x]) for x in range(gccPHATValues.shape[0])]
-        self.graph.add_plot(self.calculated_plot)
-
-
-def generalizedGaussian(x, alpha, beta, mu):
-    return np.exp(- (np.abs(x - mu) / alpha) ** beta)
+        startTime = perf_counter()
+        redrawn = False
+        historySequences = (self.gccPHATHistory.sequence, self.tdoaHistory.sequence)
+        if historySequences != self.lastHistorySequences:
+            self.lastHistorySequences = historySequences
+            sliderValue = self.tdoaHistory.get()[0] / (self.numTDOAs - 1) * 100
+            self.targetModeTDOASlider.value = int(sliderValue)
+            self.updateGCCPHATPlot()
+            redrawn = True
+        
+        targetParameters = (self.getTDOA(), self.getWindowWidth(), self.getBeta(), self.getNoiseFloor())
+        if targetParameters != self.lastTargetParameters:
+            self.lastTargetParameters = targetParameters
+            self.updateTargetPlot(*targetParameters)
+            redrawn = True
+        
+        if self.uiStats:
+            self.uiStats.beginUpdate()
+            self.uiStats.increment('numFrames')
+            if redrawn:
+                self.uiStats.increment('numRedraws')
+            self.uiStats.record('frameTime', (perf_counter() - startTime) * 1e6)
+            self.uiStats.endUpdate()
+
+    def updateTargetPlot(self, mu, alpha, beta, noiseFloor):
+        data = generalizedGaussian(self.tdoas, alpha, beta, mu, out=self.targetValues)  # 이것이 현재 들리는 소리의 tdoa를 표현
+        data -= data.min()
+        data *= (1 - noiseFloor) / data.max()
+        data += noiseFloor
+        self.gaussianplot.setValues(data)
+
+    def updateGCCPHATPlot(self):
+        gccPHATValues = self.gccPHATHistory.read( lambda values, index: np.mean(values, axis=-1, out=self.gccPHATValues) )
+        gccPHATValues -= gccPHATValues.min()
+        gccPHATValues /= max(gccPHATValues.max(), 1e-12)
+        self.calculated_plot.setValues(gccPHATValues)
+
+
+def generalizedGaussian(x, alpha, beta, mu, out=None):
+    out = np.subtract(x, mu, out=out)
+    np.abs(out, out=out)
+    out /= alpha
+    out **= beta
+    np.negative(out, out=out)
+    return np.exp(out, out=out)
 
 
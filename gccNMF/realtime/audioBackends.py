@@ -0,0 +1,202 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import logging
+import threading
+import numpy as np
+from time import sleep, perf_counter
+from multiprocessing import Event
+
+AUDIO_BACKEND_PYAUDIO = 'PyAudio'
+AUDIO_BACKEND_VIRTUAL = 'Virtual'
+AUDIO_BACKENDS = [AUDIO_BACKEND_PYAUDIO, AUDIO_BACKEND_VIRTUAL]
+
+# PortAudio callback return flags, as pyaudio.paContinue and pyaudio.paComplete
+CALLBACK_CONTINUE = 0
+CALLBACK_COMPLETE = 1
+
+# Audio I/O backends drive a PyAudio style callback(inputBytes, numFrames, timeInfo, status) -> (outputBytes, flag)
+# with interleaved 16 bit blocks of blockSize frames. Backends are created in the parent process and opened in the
+# audio process, so they must not hold device handles or threads before open(). Backends that are not paced by a
+# clock call waitForConsumer() before each callback, so they run at the speed of the processing behind the callback.
+class AudioBackend(object):
+    def open(self, numChannels, sampleRate, blockSize, callback, waitForConsumer=None):
+        raise NotImplementedError
+    
+    def start(self):
+        raise NotImplementedError
+    
+    def stop(self):
+        raise NotImplementedError
+    
+    def close(self):
+        raise NotImplementedError
+    
+    def isActive(self):
+        raise NotImplementedError
+
+
+class PyAudioBackend(AudioBackend):
+    def __init__(self, deviceIndex=None):
+        self.deviceIndex = deviceIndex
+        self.pyaudio = None
+        self.audioStream = None
+    
+    def open(self, numChannels, sampleRate, blockSize, callback, waitForConsumer=None):
+        import pyaudio
+        if self.pyaudio is None:
+            self.pyaudio = pyaudio.PyAudio()
+        # 마이크로 입력
+        self.audioStream = self.pyaudio.open(format=pyaudio.paInt16,
+                                             channels=numChannels,
+                                             rate=sampleRate,
+                                             frames_per_buffer=blockSize,
+                                             input=True,
+                                             output=True,
+                                             input_device_index=self.deviceIndex,
+                                             output_device_index=self.deviceIndex,
+                                             stream_callback=callback)
+    
+    def start(self):
+        self.audioStream.start_stream()
+    
+    def stop(self):
+        self.audioStream.stop_stream()
+    
+    def close(self):
+        if self.audioStream:
+            self.audioStream.close()
+            self.audioStream = None
+    
+    def isActive(self):
+        return self.audioStream is not None and self.audioStream.is_active()
+
+
+# Stands in for the sound card: reads the input from a WAV file and calls the callback once per block on its own
+# thread, either paced in real time against the wall clock or, unpaced, as fast as the consumer keeps up: each
+# callback first waits on waitForConsumer, as the callback itself never waits for the processing. timeInfo is derived
+# from the block index (one block of input and one block of output buffering), so runs are reproducible.
+# The output is captured in memory (capturedSamples) and optionally written to capturePath when the input ends.
+# finishedEvent is set once the whole file has been played, and can be waited on from other processes.
+class VirtualAudioBackend(AudioBackend):
+    def __init__(self, inputPath, paced=True, capturePath=None, loop=False):
+        self.inputPath = inputPath
+        self.paced = paced
+        self.capturePath = capturePath
+        self.loop = loop
+        self.finishedEvent = Event()
+        self.thread = None
+        self.running = False
+        self.capturedSamples = None
+    
+    def open(self, numChannels, sampleRate, blockSize, callback, waitForConsumer=None):
+        from scipy.io import wavfile
+        fileSampleRate, samples = wavfile.read(self.inputPath)
+        if samples.dtype != np.int16:
+            raise ValueError('VirtualAudioBackend: %s must be 16 bit PCM, got %s' % (self.inputPath, samples.dtype))
+        if fileSampleRate != sampleRate:
+            logging.warning('VirtualAudioBackend: %s has sample rate %d, playing it at %d' % (self.inputPath, fileSampleRate, sampleRate))
+        samples = samples.reshape(samples.shape[0], -1)
+        if samples.shape[1] != numChannels:
+            raise ValueError('VirtualAudioBackend: %s has %d channels, expected %d' % (self.inputPath, samples.shape[1], numChannels))
+        
+        self.numChannels = numChannels
+        self.sampleRate = sampleRate
+        self.blockSize = blockSize
+        self.callback = callback
+        self.waitForConsumer = waitForConsumer
+        self.numBlocks = -(-samples.shape[0] // blockSize)
+        self.inputSamples = np.zeros( (self.numBlocks * blockSize, numChannels), '<i2' )
+        self.inputSamples[:samples.shape[0]] = samples
+        self.inputBlocks = [ self.inputSamples[blockIndex*blockSize:(blockIndex+1)*blockSize].tobytes() for blockIndex in range(self.numBlocks) ]
+        self.capturedSamples = np.zeros( (self.numBlocks * blockSize, numChannels), '<i2' )
+        self.capturedBlocks = self.capturedSamples.reshape(self.numBlocks, -1)
+        self.blockIndex = 0
+        self.finishedEvent.clear()
+    
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.playLoop, name='VirtualAudioBackend')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+    
+    def close(self):
+        self.stop()
+    
+    def isActive(self):
+        return self.running
+    
+    def playLoop(self):
+        blockDuration = self.blockSize / float(self.sampleRate)
+        startTime = perf_counter()
+        startBlockIndex = self.blockIndex
+        while self.running:
+            if self.blockIndex == self.numBlocks:
+                if not self.loop:
+                    break
+                self.blockIndex = startBlockIndex = 0
+                startTime = perf_counter()
+            
+            if self.paced:
+                waitTime = startTime + (self.blockIndex - startBlockIndex) * blockDuration - perf_counter()
+                if waitTime > 0:
+                    sleep(waitTime)
+            elif self.waitForConsumer is not None:
+                self.waitForConsumer()
+            
+            streamTime = self.blockIndex * blockDuration
+            timeInfo = {'input_buffer_adc_time': streamTime - blockDuration, 'current_time': streamTime,
+                        'output_buffer_dac_time': streamTime + blockDuration}
+            outputBytes, flag = self.callback(self.inputBlocks[self.blockIndex], self.blockSize, timeInfo, 0)
+            self.capturedBlocks[self.blockIndex] = np.frombuffer(outputBytes, '<i2')
+            self.blockIndex += 1
+            if flag != CALLBACK_CONTINUE:
+                break
+        
+        self.running = False
+        if self.blockIndex == self.numBlocks:
+            logging.info('VirtualAudioBackend: played %d blocks from %s' % (self.numBlocks, self.inputPath))
+            if self.capturePath:
+                from scipy.io import wavfile
+                wavfile.write(self.capturePath, self.sampleRate, self.capturedSamples)
+                logging.info('VirtualAudioBackend: captured output written to %s' % self.capturePath)
+            self.finishedEvent.set()
+
+def createAudioBackend(params):
+    backendName = getattr(params, 'audioBackend', AUDIO_BACKEND_PYAUDIO)
+    if backendName == AUDIO_BACKEND_PYAUDIO:
+        return PyAudioBackend(params.deviceIndex)
+    elif backendName == AUDIO_BACKEND_VIRTUAL:
+        return VirtualAudioBackend(params.virtualInputPath or params.audioPath, params.virtualPaced, params.virtualCapturePath or None)
+    raise ValueError('createAudioBackend: unknown audioBackend %s, expected one of %s' % (backendName, AUDIO_BACKENDS))
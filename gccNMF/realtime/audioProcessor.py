@@ -30,13 +30,26 @@ from multiprocessing import Process
 from time import sleep
 import time as tm
 
+from gccNMF.realtime.defs import PA_INPUT_UNDERFLOW, PA_INPUT_OVERFLOW, PA_OUTPUT_UNDERFLOW, PA_OUTPUT_OVERFLOW, PA_PRIMING_OUTPUT
+from gccNMF.realtime.utils import LookAheadLimiter
+from gccNMF.realtime.audioBackends import PyAudioBackend, CALLBACK_CONTINUE
 from gccNMF.realtime.wavfile import pcm2float, float2pcm
 
+STATUS_FLAG_COUNTERS = [(PA_INPUT_UNDERFLOW, 'inputUnderflows'), (PA_INPUT_OVERFLOW, 'inputOverflows'), (PA_OUTPUT_UNDERFLOW, 'outputUnderflows'),
+                        (PA_OUTPUT_OVERFLOW, 'outputOverflows'), (PA_PRIMING_OUTPUT, 'primingOutputs')]
+STATS_LOG_INTERVAL_SECONDS = 2
+# the output of a block leaves the OverlapAddProcessor 2 blocks after its input
+OVERLAP_ADD_LATENCY_BLOCKS = 2
+# unpaced (virtual) devices wait for the GCCNMF worker before each callback, polling the rings
+WORKER_POLL_INTERVAL_SECONDS = 0.0001
+WORKER_WAIT_TIMEOUT_SECONDS = 1.0
 
-class PyAudioStreamProcessor(Process):
+
+class AudioStreamProcessor(Process):
     def __init__(self, numChannels, sampleRate, windowSize, hopSize, blockSize, deviceIndex,
-                 togglePlayQueue, togglePlayAck, inputFrames, outputFrames, processFramesEvent, processFramesDoneEvent, terminateEvent, inputFramesArray, outputFramesArray):
-        super(PyAudioStreamProcessor, self).__init__()
+                 togglePlayQueue, togglePlayAck, inputRing, outputRing, terminateEvent, stats=None,
+                 limiterCeiling=0.99, limiterLookAhead=64, limiterReleaseInSeconds=0.2, recorder=None, audioBackend=None, uiStats=None):
+        super(AudioStreamProcessor, self).__init__()
 
         self.numChannels = numChannels
         self.sampleRate = sampleRate
@@ -46,25 +59,28 @@ class PyAudioStreamProcessor(Process):
         
         self.togglePlayQueue = togglePlayQueue
         self.togglePlayAck = togglePlayAck
-        self.inputFrames = inputFrames
-        self.inputFramesArray = inputFramesArray
-        self.outputFrames = outputFrames
-        self.outputFramesArray = outputFramesArray
-        self.processFramesEvent = processFramesEvent
-        self.processFramesDoneEvent = processFramesDoneEvent
+        self.inputRing = inputRing
+        self.outputRing = outputRing
+        # the limiter and output buffers are created with the stream (initBuffers), in the audio process
+        self.limiterParameters = (limiterCeiling, limiterLookAhead, limiterReleaseInSeconds)
         self.terminateEvent = terminateEvent
-        self.deviceIndex = deviceIndex  # 사용 안함
+        self.deviceIndex = deviceIndex
         
         self.numBlocksPerBuffer = 8
 
-        self.processingTimes = []
-        self.underflowCounter = 0
+        self.stats = stats
+        # written by the UI, only read here to log its frame cost with the audio metrics
+        self.uiStats = uiStats
+        self.lastCallbackStartTime = None
+        self.firstOutputPending = True
+        self.outputPending = False
+        
+        self.recorder = recorder
+        self.inputTrackIndex = recorder.getTrackIndex('input') if recorder else None
+        self.outputTrackIndex = recorder.getTrackIndex('output') if recorder else None
         
-        self.fileName = None
+        self.audioBackend = PyAudioBackend(deviceIndex) if audioBackend is None else audioBackend
         self.audioStream = None
-        self.pyaudio = None
-
-        self.tempFrames = []
         
     def run(self):
         #os.nice(-20)
@@ -80,6 +96,8 @@ class PyAudioStreamProcessor(Process):
                 if self.audioStream:
                     self.audioStream.close()
                     logging.debug('AudioStreamProcessor: stream stopped')
+                if self.recorder:
+                    self.recorder.stop()
                 return
             
             if not self.togglePlayQueue.empty():
@@ -92,137 +110,165 @@ class PyAudioStreamProcessor(Process):
                 logging.debug('AudioStreamProcessor: processed togglePlayParams')
                 self.togglePlayAck.set()
                 logging.debug('AudioStreamProcessor: ack set')
-            elif currentTime - lastPrintTime >= 2:
-                if len(self.processingTimes) != 0:
-                    logging.info( 'Processing times (min/max/avg): %f, %f, %f' % (np.min(self.processingTimes), np.max(self.processingTimes), np.mean(self.processingTimes)) )
-                    lastPrintTime = currentTime
-                    del self.processingTimes[:]
+            elif currentTime - lastPrintTime >= STATS_LOG_INTERVAL_SECONDS:
+                if self.stats and self.active():
+                    self.logStats()
+                lastPrintTime = currentTime
             else:
                 sleep(0.01)
     
     def filePlayerCallback(self, in_data, numFrames, time_info, status):
 
-        startTime = tm.time()
-        inputBuffer = in_data
-        inputIntArray = np.frombuffer(inputBuffer, dtype='<i2')  # < 는 little-endian, i2가 signed 2byte integer
-        self.inputFramesArray[:] = pcm2float(inputIntArray)  # float형 으로 변환
-
-        # logging.info('AudioStreamProcessor: setting processFramesEvent')
-        self.processFramesDoneEvent.clear()
-        # logging.info(self.inputFrames)
-        self.processFramesEvent.set()
-        # logging.info('AudioStreamProcessor: waiting for processFramesDoneEvent')
-        self.processFramesDoneEvent.wait()
-        # logging.info('AudioStreamProcessor: done waiting for processFramesDoneEvent')
-        # outputFramesArray는 잘 저장되어 있음(float 값)
-        tempArray = np.array(self.outputFramesArray)
-        Max, Min = np.max(tempArray), np.min(tempArray)
-        tempArray = tempArray / max(Max, -Min, 1)
-        # float2pcm은 -1에서 1사이에 분포한 float 값들을 정수로 바꾸는 것, 근데 outputFramesArray는 정규화 안되있는 것
-        # outputIntArray = float2pcm(self.outputFramesArray)
-
-        outputIntArray = float2pcm(tempArray)
-        try:
-            outputBuffer = np.getbuffer(outputIntArray)
-        except:
-            # numpy에서 getbuffer 없어짐, 그래서 tobyte()를 사용한다
-            outputBuffer = outputIntArray.tobytes()  # little endian 바이트 저장방식??
-
-        self.processingTimes.append(tm.time() - startTime)
-        self.tempFrames.append(outputBuffer)
-        return outputBuffer, self.paContinue
+        startTime = tm.perf_counter()
+        inputIntArray = np.frombuffer(in_data, dtype='<i2')  # < 는 little-endian, i2가 signed 2byte integer
+        # never waits on the GCCNMF worker: the output is the most recent block it has finished, one block behind the input
+        # input is converted straight into the ring slot, output is read straight from it
+        inputPushed = self.inputRing.numFree() > 0
+        if inputPushed:
+            pcm2float(inputIntArray, out=self.inputRing.writeSlot())  # float형 으로 변환
+            self.inputRing.commitWrite()
+        self.outputPending = inputPushed
+        outputPopped = self.outputRing.numAvailable() > 0
+        if outputPopped:
+            limitedSamples = self.limiter.process( self.outputRing.readSlot() )
+            self.outputRing.commitRead()
+        else:
+            limitedSamples = self.limiter.process(self.silentSamples)
+        
+        # the limiter keeps the output within [-ceiling, ceiling] with a gain that is smooth across blocks
+        float2pcm(limitedSamples, out=self.outputIntArray)
+
+        if self.recorder:
+            if self.inputTrackIndex is not None:
+                self.recorder.push(self.inputTrackIndex, inputIntArray)
+            if self.outputTrackIndex is not None:
+                self.recorder.push(self.outputTrackIndex, self.outputIntArray)
+        if self.stats:
+            self.updateStats(startTime, time_info, status, inputPushed, outputPopped)
+        return self.outputBuffer, CALLBACK_CONTINUE
+    
+    def waitForWorker(self, timeout=WORKER_WAIT_TIMEOUT_SECONDS):
+        # until the worker has read every input block and the output of the last one is ready, then the next
+        # callback pops it; gives up after timeout, e.g. while the worker is stopped
+        deadline = tm.perf_counter() + timeout
+        while self.inputRing.numAvailable() > 0 or (self.outputPending and self.outputRing.numAvailable() == 0):
+            if tm.perf_counter() > deadline:
+                return False
+            sleep(WORKER_POLL_INTERVAL_SECONDS)
+        return True
+    
+    def initBuffers(self):
+        limiterCeiling, limiterLookAhead, limiterReleaseInSeconds = self.limiterParameters
+        self.limiter = LookAheadLimiter(self.numChannels, self.blockSize, self.sampleRate, limiterCeiling, limiterLookAhead, limiterReleaseInSeconds)
+        self.silentSamples = np.zeros(self.numChannels * self.blockSize, np.float32)
+        self.outputIntArray = np.zeros(self.numChannels * self.blockSize, '<i2')
+        # PyAudio copies the returned read-only buffer, so the same int16 array is handed back every callback
+        self.outputBuffer = memoryview(self.outputIntArray).cast('B').toreadonly()
+        self.blockDuration = self.blockSize / float(self.sampleRate)
+        self.limiterLatency = self.limiter.latency / float(self.sampleRate)
+    
+    def updateStats(self, startTime, timeInfo, status, inputPushed, outputPopped):
+        endTime = tm.perf_counter()
+        callbackTime = endTime - startTime
+        # PortAudio gives the time left until the output buffer plays; some host APIs report zeros
+        timeUntilDAC = timeInfo['output_buffer_dac_time'] - timeInfo['current_time'] if timeInfo else 0
+        deadline = timeUntilDAC if timeUntilDAC > 0 else self.blockDuration
+        deviceLatency = max(timeInfo['output_buffer_dac_time'] - timeInfo['input_buffer_adc_time'], 0) if timeInfo else 0
+        # blocks between the input just pushed and the output just popped
+        queueLag = self.inputRing.numAvailable() + self.outputRing.numAvailable()
+        
+        stats = self.stats
+        stats.beginUpdate()
+        stats.increment('numCallbacks')
+        if callbackTime > deadline:
+            stats.increment('deadlineMisses')
+        if status:
+            for flag, counterName in STATUS_FLAG_COUNTERS:
+                if status & flag:
+                    stats.increment(counterName)
+        if not inputPushed:
+            stats.increment('ringOverflows')
+        if not outputPopped:
+            stats.increment('ringUnderflows')
+        if self.recorder:
+            stats.setCounter('recorderDroppedBlocks', self.recorder.numDroppedBlocks)
+        stats.setCounter('queueLag', queueLag)
+        stats.setMaxCounter('maxQueueLag', queueLag)
+        stats.record('callbackTime', callbackTime * 1e6)
+        if self.lastCallbackStartTime is not None:
+            stats.record('callbackInterval', (startTime - self.lastCallbackStartTime) * 1e6)
+        if outputPopped and self.firstOutputPending:
+            stats.setCounter('firstOutputWallTime', tm.time() * 1e6)
+            self.firstOutputPending = False
+        if outputPopped:
+            stats.record('endToEndLatency', (deviceLatency + (queueLag + OVERLAP_ADD_LATENCY_BLOCKS) * self.blockDuration + self.limiterLatency) * 1e6)
+        stats.endUpdate()
+        self.lastCallbackStartTime = startTime
+    
+    def logStats(self):
+        summary = self.stats.getSummary()
+        logging.info( 'Callback time us (p50/p99/max): %d, %d, %d, end-to-end latency ms (p50/p99): %.1f, %.1f' %
+                      (summary['callbackTime']['p50'], summary['callbackTime']['p99'], summary['callbackTime']['max'],
+                       summary['endToEndLatency']['p50'] / 1e3, summary['endToEndLatency']['p99'] / 1e3) )
+        logging.info( 'Deadline misses: %d, xruns (input under/over, output under/over): %d, %d, %d, %d, ring overflows/underflows: %d, %d, queue lag: %d (max %d)' %
+                      (summary['deadlineMisses'], summary['inputUnderflows'], summary['inputOverflows'], summary['outputUnderflows'], summary['outputOverflows'],
+                       summary['ringOverflows'], summary['ringUnderflows'], summary['queueLag'], summary['maxQueueLag']) )
+        if self.uiStats:
+            uiSummary = self.uiStats.getSummary()
+            if uiSummary['numFrames']:
+                logging.info( 'UI frame time us (p50/p99/max): %d, %d, %d, redraws: %d of %d frames' %
+                              (uiSummary['frameTime']['p50'], uiSummary['frameTime']['p99'], uiSummary['frameTime']['max'],
+                               uiSummary['numRedraws'], uiSummary['numFrames']) )
     
     def active(self):
         if not self.audioStream:
             return False
         else:
-            return self.audioStream.is_active()
+            return self.audioStream.isActive()
 
     def startStream(self):
         if not self.audioStream:
             logging.info('AudioStreamProcessor: creating stream...')
-            # logging.info(self.fileName)
             self.reset()
-        logging.info('AudioStreamProcessor: starting stream')
-        self.audioStream.start_stream()
+        # blocks left from the previous session: the worker finishes the input already pushed, and its output is dropped
+        # so the stream does not start with stale audio; input can only be consumed by the worker (single consumer)
+        if not self.waitForWorker():
+            logging.warning('AudioStreamProcessor: worker did not drain %d input block(s) from the previous session' % self.inputRing.numAvailable())
+        numStaleBlocks = self.outputRing.discard()
+        self.outputPending = False
+        logging.info('AudioStreamProcessor: starting stream, dropped %d stale output block(s)' % numStaleBlocks)
+        if self.recorder:
+            self.recorder.start()
+        self.audioStream.start()
         
     def stopStream(self):
         if self.audioStream:
             logging.info('AudioStreamProcessor: stopping stream')
-            ##### 녹음 파일 생성 #######
-            # import wave
-            # w = wave.open("../../data/record_temp.wav", 'wb')
-            # w.setnchannels(self.numChannels)
-            # w.setsampwidth(self.bytesPerFrame)
-            # w.setframerate(self.sampleRate)
-            # w.writeframes(b''.join(self.tempFrames))
-            # w.close()
-            self.audioStream.stop_stream()
+            self.audioStream.stop()
+            # 녹음 파일 마무리, the next start records to new files
+            if self.recorder:
+                self.recorder.stop()
             
     def reset(self):
         if self.audioStream:
             logging.info('AudioStreamProcessor: aborting stream')
-            self.tempFrames = []
             self.audioStream.close()
+            self.audioStream = None
 
-        # logging.info('AudioStreamProcessor: call createAudioStream()')
         self.createAudioStream()
         
     def togglePlay(self):
         self.stopStream() if self.active() else self.startStream()
 
     def createAudioStream(self):
-        import pyaudio
-        
-        if self.pyaudio is None:
-            self.pyaudio = pyaudio.PyAudio()
-        
-        self.paContinue = pyaudio.paContinue
-
-        # 마이크로 입력
-        self.numChannels = 2
-        self.sampleRate = 8000
         self.bytesPerFrame = 2
         self.bytesPerFrameAllChannels = self.bytesPerFrame * self.numChannels
-        self.audioStream = self.pyaudio.open(format=8,  # self.pyaudio.get_format_from_width(self.bytesPerFrame) = 8
-                                             channels=2,  # 2
-                                             rate=self.sampleRate,  # 16000
-                                             frames_per_buffer=self.blockSize,  # 512
-                                             input=True,  # 입력
-                                             output=True,
-                                             stream_callback=self.filePlayerCallback)
-
-        '''
-        waveFile = wave.open(self.fileName, 'rb')
-        self.numFrames = waveFile.getnframes()
-        self.samples = waveFile.readframes(self.numFrames)
-        self.sampleRate = waveFile.getframerate()
-        self.bytesPerFrame = waveFile.getsampwidth()
-        self.bytesPerFrameAllChannels = self.bytesPerFrame * self.numChannels
-        self.format = self.pyaudio.get_format_from_width(self.bytesPerFrame)
-        # print("numFrames : ", self.numFrames)
-        # print("sampleRate : ", self.sampleRate)
-        # print("bytesPerFrame : ", self.bytesPerFrame)
-        # print("bytesPerFrameAllChannels : ", self.bytesPerFrameAllChannels)
-        # print("format : ", self.format)
-        waveFile.close()
-        self.waveFile = wave.open(self.fileName, 'rb')
-        self.sampleIndex = 0
-        self.audioStream = self.pyaudio.open(format=self.format,
-                                             channels=self.numChannels,
-                                             rate=self.sampleRate,
-                                             frames_per_buffer=self.blockSize,
-                                             output=True,
-                                             stream_callback=self.filePlayerCallback)
-
-        '''
-        '''
-        defaultAudioInfo = self.pyaudio.get_default_input_device_info()
-        self.sampleRate = int(defaultAudioInfo["defaultSampleRate"])
-        self.numChannels = defaultAudioInfo["maxInputChannels"]
-        self.bytesPerFrame = 2
-        self.format = self.pyaudio.get_format_from_width(self.bytesPerFrame)
-        self.chunk = int(self.sampleRate / 10)  # 44100
-        '''
-
+        self.initBuffers()
+        logging.info( 'AudioStreamProcessor: opening %s (%d channels, %d Hz, %d frames per block)' %
+                      (type(self.audioBackend).__name__, self.numChannels, self.sampleRate, self.blockSize) )
+        self.outputPending = False
+        self.audioBackend.open(self.numChannels, self.sampleRate, self.blockSize, self.filePlayerCallback, self.waitForWorker)
+        self.audioStream = self.audioBackend
 
+# the stream processor used to be PyAudio only
+PyAudioStreamProcessor = AudioStreamProcessor
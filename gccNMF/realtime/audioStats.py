@@ -0,0 +1,202 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import sys
+import json
+import numpy as np
+from collections import OrderedDict
+
+from gccNMF.realtime.utils import openSharedMemory
+
+# Fixed-size runtime statistics in a named shared memory block: int64 counters and HDR-style latency histograms,
+# updated by a single writer process under a sequence lock and readable by the UI or any process that attaches
+# by name (python -m gccNMF.realtime.audioStats <name>) while the stream is running.
+# The block is self-describing: a header gives the layout and a JSON description holds the counter and histogram names.
+#
+# Histogram buckets hold integer microseconds: values below 2**subBucketBits have their own bucket, above that each
+# power of two is split into 2**(subBucketBits-1) linear sub-buckets, so the relative error is below 2**(1-subBucketBits).
+STATS_HEADER_SEQUENCE, STATS_HEADER_NUM_COUNTERS, STATS_HEADER_NUM_HISTOGRAMS, STATS_HEADER_NUM_BUCKETS, \
+    STATS_HEADER_SUB_BUCKET_BITS, STATS_HEADER_DESCRIPTION_NUM_BYTES = range(6)
+STATS_HEADER_NUM_BYTES = 64
+SUB_BUCKET_BITS = 5
+MAX_VALUE_BITS = 24  # ~16.8 s
+SUMMARY_PERCENTILES = [50, 90, 99, 99.9]
+
+AUDIO_CALLBACK_COUNTERS = ['numCallbacks', 'deadlineMisses', 'inputUnderflows', 'inputOverflows', 'outputUnderflows', 'outputOverflows',
+                           'primingOutputs', 'ringOverflows', 'ringUnderflows', 'queueLag', 'maxQueueLag', 'recorderDroppedBlocks',
+                           'firstOutputWallTime']  # microseconds since the epoch, 0 until the first separated block plays
+AUDIO_CALLBACK_HISTOGRAMS = ['callbackTime', 'callbackInterval', 'endToEndLatency']
+WORKER_COUNTERS = ['numBlocks', 'droppedOutputBlocks', 'inputLag', 'maxInputLag', 'gatedBlocks',
+                   'dictionaryLoadTime', 'precomputationTime', 'graphBuildTime',  # microseconds, of the last GCCNMFProcessor reset
+                   'reconfigurations', 'tdoaParameterVersion', 'dictionaryUpdates']
+WORKER_HISTOGRAMS = ['processingTime']
+UI_COUNTERS = ['numFrames', 'numRedraws']
+UI_HISTOGRAMS = ['frameTime']
+
+def getNumBuckets(subBucketBits=SUB_BUCKET_BITS, maxValueBits=MAX_VALUE_BITS):
+    return (maxValueBits - subBucketBits + 2) << (subBucketBits - 1)
+
+def getBucketIndex(value, subBucketBits=SUB_BUCKET_BITS):
+    value = max(int(value), 0)
+    shift = max(value.bit_length() - subBucketBits, 0)
+    return (shift << (subBucketBits - 1)) + (value >> shift)
+
+def getBucketLowerBound(bucketIndex, subBucketBits=SUB_BUCKET_BITS):
+    numSubBuckets = 1 << subBucketBits
+    if bucketIndex < numSubBuckets:
+        return bucketIndex
+    shift = (bucketIndex >> (subBucketBits - 1)) - 1
+    return (bucketIndex - (shift << (subBucketBits - 1))) << shift
+
+def getHistogramPercentile(counts, percentile, subBucketBits=SUB_BUCKET_BITS):
+    # upper bound of the bucket holding the percentile, in the histogram's units
+    totalCount = np.sum(counts)
+    if totalCount == 0:
+        return 0
+    bucketIndex = int( np.searchsorted(np.cumsum(counts), totalCount * percentile / 100.0) )
+    return getBucketLowerBound(bucketIndex + 1, subBucketBits) - 1
+
+def getHistogramSummary(counts, subBucketBits=SUB_BUCKET_BITS):
+    summary = OrderedDict( [('count', int(np.sum(counts)))] )
+    for percentile in SUMMARY_PERCENTILES:
+        summary['p%g' % percentile] = getHistogramPercentile(counts, percentile, subBucketBits)
+    nonZeroIndexes = np.flatnonzero(counts)
+    summary['max'] = getBucketLowerBound(int(nonZeroIndexes[-1]) + 1, subBucketBits) - 1 if len(nonZeroIndexes) else 0
+    return summary
+
+class SharedMemoryStats(object):
+    def __init__(self, counterNames, histogramNames, name=None, subBucketBits=SUB_BUCKET_BITS, maxValueBits=MAX_VALUE_BITS):
+        description = json.dumps( {'counters': list(counterNames), 'histograms': list(histogramNames)} ).encode('utf-8')
+        descriptionNumBytes = (len(description) + 7) // 8 * 8
+        numBuckets = getNumBuckets(subBucketBits, maxValueBits)
+        size = STATS_HEADER_NUM_BYTES + descriptionNumBytes + (len(counterNames) + len(histogramNames) * numBuckets) * 8
+        
+        self.sharedMemory = openSharedMemory(name, create=True, size=size)
+        self.isOwner = True
+        self.name = self.sharedMemory.name
+        
+        header = np.ndarray( (STATS_HEADER_NUM_BYTES // 8,), np.int64, buffer=self.sharedMemory.buf )
+        header[:] = 0
+        header[STATS_HEADER_NUM_COUNTERS] = len(counterNames)
+        header[STATS_HEADER_NUM_HISTOGRAMS] = len(histogramNames)
+        header[STATS_HEADER_NUM_BUCKETS] = numBuckets
+        header[STATS_HEADER_SUB_BUCKET_BITS] = subBucketBits
+        header[STATS_HEADER_DESCRIPTION_NUM_BYTES] = descriptionNumBytes
+        self.sharedMemory.buf[STATS_HEADER_NUM_BYTES:STATS_HEADER_NUM_BYTES+len(description)] = description
+        self.initViews()
+        self.values[:] = 0
+    
+    @classmethod
+    def attach(cls, name):
+        stats = cls.__new__(cls)
+        stats.sharedMemory = openSharedMemory(name)
+        stats.isOwner = False
+        stats.name = name
+        stats.initViews()
+        return stats
+    
+    def initViews(self):
+        buffer = self.sharedMemory.buf
+        self.header = np.ndarray( (STATS_HEADER_NUM_BYTES // 8,), np.int64, buffer=buffer )
+        numCounters, numHistograms, numBuckets, descriptionNumBytes = [ int(self.header[index]) for index in
+            [STATS_HEADER_NUM_COUNTERS, STATS_HEADER_NUM_HISTOGRAMS, STATS_HEADER_NUM_BUCKETS, STATS_HEADER_DESCRIPTION_NUM_BYTES] ]
+        self.subBucketBits = int(self.header[STATS_HEADER_SUB_BUCKET_BITS])
+        self.numBuckets = numBuckets
+        
+        description = json.loads( bytes(buffer[STATS_HEADER_NUM_BYTES:STATS_HEADER_NUM_BYTES+descriptionNumBytes]).rstrip(b'\0').decode('utf-8') )
+        self.counterNames = description['counters']
+        self.histogramNames = description['histograms']
+        self.counterIndexes = dict( (counterName, index) for index, counterName in enumerate(self.counterNames) )
+        self.histogramIndexes = dict( (histogramName, index) for index, histogramName in enumerate(self.histogramNames) )
+        
+        valuesOffset = STATS_HEADER_NUM_BYTES + descriptionNumBytes
+        self.values = np.ndarray( (numCounters + numHistograms * numBuckets,), np.int64, buffer=buffer, offset=valuesOffset )
+        self.counters = self.values[:numCounters]
+        self.histograms = self.values[numCounters:].reshape(numHistograms, numBuckets)
+    
+    def __getstate__(self):
+        return {'name': self.name}
+    
+    def __setstate__(self, state):
+        attached = SharedMemoryStats.attach(state['name'])
+        self.__dict__.update(attached.__dict__)
+    
+    # writer side: group updates between beginUpdate and endUpdate so readers see them together
+    def beginUpdate(self):
+        self.header[STATS_HEADER_SEQUENCE] += 1
+    
+    def endUpdate(self):
+        self.header[STATS_HEADER_SEQUENCE] += 1
+    
+    def increment(self, counterName, amount=1):
+        self.counters[self.counterIndexes[counterName]] += amount
+    
+    def setCounter(self, counterName, value):
+        self.counters[self.counterIndexes[counterName]] = value
+    
+    def setMaxCounter(self, counterName, value):
+        counterIndex = self.counterIndexes[counterName]
+        if value > self.counters[counterIndex]:
+            self.counters[counterIndex] = value
+    
+    def record(self, histogramName, value):
+        self.histograms[self.histogramIndexes[histogramName], min(getBucketIndex(value, self.subBucketBits), self.numBuckets-1)] += 1
+    
+    def reset(self):
+        self.beginUpdate()
+        self.values[:] = 0
+        self.endUpdate()
+    
+    # reader side
+    def snapshot(self, out=None):
+        out = np.empty_like(self.values) if out is None else out
+        while True:
+            sequence = self.header[STATS_HEADER_SEQUENCE]
+            if sequence % 2 == 0:
+                out[:] = self.values
+                if self.header[STATS_HEADER_SEQUENCE] == sequence:
+                    return out
+    
+    def getSummary(self):
+        values = self.snapshot()
+        numCounters = len(self.counterNames)
+        summary = OrderedDict( (counterName, int(values[index])) for index, counterName in enumerate(self.counterNames) )
+        histograms = values[numCounters:].reshape(len(self.histogramNames), self.numBuckets)
+        for histogramName, counts in zip(self.histogramNames, histograms):
+            summary[histogramName] = getHistogramSummary(counts, self.subBucketBits)
+        return summary
+    
+    def close(self):
+        del self.header, self.values, self.counters, self.histograms
+        self.sharedMemory.close()
+        if self.isOwner:
+            self.sharedMemory.unlink()
+
+if __name__ == '__main__':
+    for statsName in sys.argv[1:]:
+        stats = SharedMemoryStats.attach(statsName)
+        print( json.dumps( {statsName: stats.getSummary()}, indent=2 ) )
+        stats.close()
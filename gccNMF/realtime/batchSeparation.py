@@ -0,0 +1,186 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import sys
+import logging
+import argparse
+import numpy as np
+from os import makedirs
+from os.path import exists, join, basename, getsize
+from glob import glob
+from time import time
+from multiprocessing import Pool
+
+from gccNMF.realtime.defs import PRETRAINED_W_PATH_TEMPLATE
+from gccNMF.realtime.gccNMFFunctions import loadMixtureSignal, computeComplexMixtureSpectrogram, getFrequenciesInHz, performKLNMFActivations, \
+    getAngularSpectrogram, estimateTargetTDOAIndexesFromAngularSpectrum, getTargetTDOAGCCNMFs, getTargetCoefficientMasks, \
+    getTargetSpectrogramEstimates, getTargetSignalEstimates, saveTargetSignalEstimates, getSourceEstimateFileName
+
+# Offline GCC-NMF over a directory of *_mix.wav files, spread across a process pool.
+# Each worker memory-maps the pretrained dictionary read-only, so W is shared through the page cache instead of
+# being pickled per task. A "<prefix>_sim.done" marker listing the outputs is written once all _sim_N.wav files
+# of a mixture are saved; mixtures with a valid marker are skipped when a run is restarted. A mixture that fails
+# (e.g. fewer angular spectrum peaks than numSources) is logged and listed in the summary without stopping the run;
+# it gets no marker, so a restart retries it.
+
+MIXTURE_FILE_SUFFIX = '_mix.wav'
+DONE_FILE_SUFFIX = '_sim.done'
+
+W = None
+
+def initWorker(dictionaryPath):
+    global W
+    W = np.load(dictionaryPath, mmap_mode='r')
+
+def getMixtureFilePaths(inputDir):
+    return sorted( glob( join(inputDir, '*' + MIXTURE_FILE_SUFFIX) ) )
+
+def getOutputPrefix(mixtureFilePath, outputDir):
+    return join( outputDir, basename(mixtureFilePath)[:-len(MIXTURE_FILE_SUFFIX)] )
+
+def isComplete(outputPrefix):
+    doneFilePath = outputPrefix + DONE_FILE_SUFFIX
+    if not exists(doneFilePath):
+        return False
+    with open(doneFilePath) as doneFile:
+        try:
+            numTargets = int( doneFile.read().strip() )
+        except ValueError:
+            return False
+    sourceEstimateFilePaths = [getSourceEstimateFileName(outputPrefix, targetIndex) for targetIndex in range(numTargets)]
+    return all( exists(filePath) and getsize(filePath) > 0 for filePath in sourceEstimateFilePaths )
+
+def markComplete(outputPrefix, numTargets):
+    with open(outputPrefix + DONE_FILE_SUFFIX, 'w') as doneFile:
+        doneFile.write('%d\n' % numTargets)
+
+def separateFile(arguments):
+    # a failing mixture is logged and reported in the summary, the other mixtures still run
+    mixtureFilePath = arguments[0]
+    startTime = time()
+    try:
+        duration, numTargets = separateMixture(*arguments)
+    except Exception as error:
+        logging.exception( 'BatchSeparation: %s failed: %s: %s' % (mixtureFilePath, type(error).__name__, error) )
+        return mixtureFilePath, None, time() - startTime, 0, '%s: %s' % (type(error).__name__, error)
+    return mixtureFilePath, duration, time() - startTime, numTargets, None
+
+def separateMixture(mixtureFilePath, outputPrefix, windowSize, hopSize, numTDOAs, microphoneSeparationInMetres, numSources, numHIterations, sparsityAlpha):
+    stereoSamples, sampleRate = loadMixtureSignal(mixtureFilePath)
+    numChannels, numSamples = stereoSamples.shape
+    
+    complexMixtureSpectrogram = computeComplexMixtureSpectrogram(stereoSamples, windowSize, hopSize, np.hanning)
+    _, numFrequencies, numTime = complexMixtureSpectrogram.shape
+    frequenciesInHz = getFrequenciesInHz(sampleRate, numFrequencies)
+    
+    V = np.concatenate( np.abs(complexMixtureSpectrogram), axis=-1 )
+    H = performKLNMFActivations(V, W, numHIterations, sparsityAlpha)
+    stereoH = np.array( np.hsplit(H, numChannels) )
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spectralCoherenceV = complexMixtureSpectrogram[0] * complexMixtureSpectrogram[1].conj() \
+                             / np.abs(complexMixtureSpectrogram[0]) / np.abs(complexMixtureSpectrogram[1])
+    angularSpectrogram = getAngularSpectrogram(spectralCoherenceV, frequenciesInHz, microphoneSeparationInMetres, numTDOAs)
+    meanAngularSpectrum = np.nanmean(angularSpectrogram, axis=-1)
+    targetTDOAIndexes = estimateTargetTDOAIndexesFromAngularSpectrum(meanAngularSpectrum, microphoneSeparationInMetres, numTDOAs, numSources)
+    
+    targetTDOAGCCNMFs = getTargetTDOAGCCNMFs(spectralCoherenceV, microphoneSeparationInMetres, numTDOAs, frequenciesInHz, targetTDOAIndexes, W, stereoH)
+    targetCoefficientMasks = getTargetCoefficientMasks(targetTDOAGCCNMFs, len(targetTDOAIndexes))
+    targetSpectrogramEstimates = getTargetSpectrogramEstimates(targetCoefficientMasks, complexMixtureSpectrogram, W, stereoH)
+    targetSignalEstimates = getTargetSignalEstimates(targetSpectrogramEstimates, windowSize, hopSize, np.hanning)
+    
+    saveTargetSignalEstimates(targetSignalEstimates, sampleRate, outputPrefix)
+    markComplete(outputPrefix, len(targetTDOAIndexes))
+    
+    return numSamples / float(sampleRate), len(targetTDOAIndexes)
+
+def runBatchSeparation(inputDir, outputDir=None, dictionarySize=256, numWorkers=None, windowSize=1024, hopSize=512, numTDOAs=64,
+                       microphoneSeparationInMetres=0.05, numSources=None, numHIterations=100, sparsityAlpha=0, dictionaryPath=None):
+    outputDir = inputDir if outputDir is None else outputDir
+    dictionaryPath = PRETRAINED_W_PATH_TEMPLATE % dictionarySize if dictionaryPath is None else dictionaryPath
+    if not exists(dictionaryPath):
+        raise IOError('BatchSeparation: dictionary not found: %s' % dictionaryPath)
+    if not exists(outputDir):
+        makedirs(outputDir)
+    
+    mixtureFilePaths = getMixtureFilePaths(inputDir)
+    pendingArguments = []
+    for mixtureFilePath in mixtureFilePaths:
+        outputPrefix = getOutputPrefix(mixtureFilePath, outputDir)
+        if isComplete(outputPrefix):
+            logging.debug('BatchSeparation: skipping %s, outputs complete' % mixtureFilePath)
+            continue
+        pendingArguments.append( (mixtureFilePath, outputPrefix, windowSize, hopSize, numTDOAs, microphoneSeparationInMetres,
+                                  numSources, numHIterations, sparsityAlpha) )
+    logging.info( 'BatchSeparation: %d mixtures, %d already complete, %d to process' % (len(mixtureFilePaths), len(mixtureFilePaths)-len(pendingArguments), len(pendingArguments)) )
+    
+    results = []
+    failures = []
+    startTime = time()
+    pool = Pool(numWorkers, initializer=initWorker, initargs=(dictionaryPath,))
+    try:
+        for mixtureFilePath, duration, elapsed, numTargets, error in pool.imap_unordered(separateFile, pendingArguments):
+            if error is not None:
+                failures.append( (mixtureFilePath, error) )
+                continue
+            logging.info( 'BatchSeparation: %s: %d targets, %.1f s audio in %.2f s (%.1fx realtime)' % (mixtureFilePath, numTargets, duration, elapsed, duration / elapsed) )
+            results.append( (mixtureFilePath, duration, elapsed, numTargets) )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    
+    totalTime = time() - startTime
+    totalDuration = sum(result[1] for result in results)
+    if results:
+        logging.info( 'BatchSeparation: processed %d files, %.1f s audio in %.1f s wall time (%.1fx realtime)' % (len(results), totalDuration, totalTime, totalDuration / totalTime) )
+    if failures:
+        logging.warning( 'BatchSeparation: %d of %d files failed:' % (len(failures), len(pendingArguments)) )
+        for mixtureFilePath, error in failures:
+            logging.warning( 'BatchSeparation:     %s: %s' % (mixtureFilePath, error) )
+    return results, failures
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Batch GCC-NMF separation of *_mix.wav files')
+    parser.add_argument('inputDir')
+    parser.add_argument('--outputDir', default=None)
+    parser.add_argument('--dictionarySize', type=int, default=256)
+    parser.add_argument('--numWorkers', type=int, default=None)
+    parser.add_argument('--windowSize', type=int, default=1024)
+    parser.add_argument('--hopSize', type=int, default=512)
+    parser.add_argument('--numTDOAs', type=int, default=64)
+    parser.add_argument('--microphoneSeparationInMetres', type=float, default=0.05)
+    parser.add_argument('--numSources', type=int, default=None)
+    parser.add_argument('--numHIterations', type=int, default=100)
+    arguments = parser.parse_args()
+    
+    _, failures = runBatchSeparation(arguments.inputDir, arguments.outputDir, arguments.dictionarySize, arguments.numWorkers, arguments.windowSize,
+                                     arguments.hopSize, arguments.numTDOAs, arguments.microphoneSeparationInMetres, arguments.numSources, arguments.numHIterations)
+    sys.exit(1 if failures else 0)
@@ -38,10 +38,16 @@ from gccNMF.realtime.gccNMFPretraining import getDictionariesW
 
 INT_OPTIONS = ['numTDOAs', 'numTDOAHistory', 'numSpectrogramHistory', 'numChannels',
                'windowSize', 'hopSize', 'blockSize', 'dictionarySize', 'numHUpdates',
-               'localizationWindowSize']
-FLOAT_OPTIONS = ['gccPHATNLAlpha', 'microphoneSeparationInMetres']
-BOOL_OPTIONS = ['gccPHATNLEnabled', 'localizationEnabled']
-STRING_OPTIONS = ['dictionaryType', 'audioPath']
+               'localizationWindowSize', 'precomputationCacheSize', 'numRingBlocks', 'limiterLookAhead',
+               'recordingQueueBlocks', 'tdoaCoarseStride', 'tdoaNumCandidates', 'gatingHangoverBlocks',
+               'adaptationMinibatchSize', 'adaptationNumHIterations', 'adaptationQueueBlocks']
+FLOAT_OPTIONS = ['gccPHATNLAlpha', 'microphoneSeparationInMetres', 'limiterCeiling', 'limiterReleaseInSeconds',
+                 'recordingRotateSeconds', 'recordingRotateMegabytes', 'gatingOnThresholdInDB', 'gatingOffThresholdInDB', 'gatingAttenuationInDB',
+                 'uiRefreshRate', 'adaptationForgettingFactor', 'adaptationPriorWeight', 'adaptationPublishIntervalInSeconds']
+BOOL_OPTIONS = ['gccPHATNLEnabled', 'localizationEnabled', 'precomputationDiskCacheEnabled', 'recordingEnabled', 'virtualPaced', 'gatingEnabled',
+                'hotReconfigurationEnabled', 'dictionaryAdaptationEnabled']
+STRING_OPTIONS = ['dictionaryType', 'audioPath', 'computeBackend', 'recordingDir', 'recordingFormat',
+                  'audioBackend', 'virtualInputPath', 'virtualCapturePath', 'tdoaSearch']
 
 def getDefaultConfig():
     configParser = configparser.ConfigParser(allow_no_value=True)
@@ -61,7 +67,15 @@ def getDefaultConfig():
     
     config['Audio'] = {'numChannels': '2',
                        'sampleRate': '8000',  # 16000
-                       'deviceIndex': 'None'}
+                       'deviceIndex': 'None',
+                       'numRingBlocks': '4',
+                       'limiterCeiling': '0.99',
+                       'limiterLookAhead': '64',  # frames, must divide blockSize
+                       'limiterReleaseInSeconds': '0.2',
+                       'audioBackend': 'PyAudio',  # PyAudio, Virtual
+                       'virtualInputPath': '',  # Virtual backend input WAV, defaults to audioPath
+                       'virtualPaced': 'True',  # False: as fast as possible
+                       'virtualCapturePath': ''}
     
     config['STFT'] = {'windowSize': '1024',  # 1024 고정해야함, Frequency Size임
                       'hopSize': '512',  # 512
@@ -71,6 +85,37 @@ def getDefaultConfig():
                      'dictionarySizes': '[64, 128, 256, 512, 1024]',
                      'dictionaryType': 'Pretrained',
                      'numHUpdates': '0'}
+    
+    config['Processing'] = {'computeBackend': 'Fused',  # Fused, NumPy, Theano
+                            'precomputationCacheSize': '8',
+                            'precomputationDiskCacheEnabled': 'False',
+                            'tdoaSearch': 'Exhaustive',  # Exhaustive, Hierarchical (Fused backend only)
+                            'tdoaCoarseStride': '4',
+                            'tdoaNumCandidates': '1',
+                            'gatingEnabled': 'False',  # skip GCC-NMF for silent or stationary blocks
+                            'gatingOnThresholdInDB': '9.0',  # above the noise floor
+                            'gatingOffThresholdInDB': '4.0',
+                            'gatingHangoverBlocks': '8',
+                            'gatingAttenuationInDB': '-20.0',
+                            'hotReconfigurationEnabled': 'True'}  # rebuild the processor off the worker loop on parameter changes
+    
+    config['Adaptation'] = {'dictionaryAdaptationEnabled': 'False',  # learn W from the mixture in a background process
+                            'adaptationMinibatchSize': '64',  # frames
+                            'adaptationNumHIterations': '10',
+                            'adaptationForgettingFactor': '0.9',  # per minibatch
+                            'adaptationPriorWeight': '4.0',  # minibatches, weight of the pretrained dictionary
+                            'adaptationPublishIntervalInSeconds': '5.0',
+                            'adaptationQueueBlocks': '64'}
+    
+    config['Interface'] = {'uiRefreshRate': '30'}  # Hz, plots are only redrawn when the histories or parameters change
+    
+    config['Recording'] = {'recordingEnabled': 'False',
+                           'recordingDir': 'recordings',  # relative to the data directory
+                           'recordingTracks': "['input', 'output']",
+                           'recordingFormat': 'wav',  # wav, raw
+                           'recordingQueueBlocks': '256',
+                           'recordingRotateSeconds': '3600',
+                           'recordingRotateMegabytes': '0'}  # 0: no size limit besides the WAV 4 GB limit
     try:
         for key, value in config.items():
             configParser[key] = value
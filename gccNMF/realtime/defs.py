@@ -41,4 +41,28 @@ DEFAULT_AUDIO_FILE = join(DATA_DIR, 'dev_Sq1_Co_A_mix.wav')
 
 DEFAULT_CONFIG_FILE = join(ROOT_DIR, 'gccNMF.cfg')
 
-SPEED_OF_SOUND_IN_METRES_PER_SECOND = 340.29
\ No newline at end of file
+# PRETRAINED_W_DIR = join(DATA_DIR, 'pretrainedW')
+PRETRAINED_W_DIR = abspath( join( __file__, '..' ) )  # W_*.npy are shipped next to this file
+PRETRAINED_W_PATH_TEMPLATE = join(PRETRAINED_W_DIR, 'W_%d.npy')
+
+SPEED_OF_SOUND_IN_METRES_PER_SECOND = 340.29
+
+TARGET_MODE_BOXCAR = 0
+TARGET_MODE_MULTIPLE = 1
+TARGET_MODE_WINDOW_FUNCTION = 2
+
+COMPUTE_BACKEND_FUSED = 'Fused'
+COMPUTE_BACKEND_NUMPY = 'NumPy'
+COMPUTE_BACKEND_THEANO = 'Theano'
+COMPUTE_BACKENDS = [COMPUTE_BACKEND_FUSED, COMPUTE_BACKEND_NUMPY, COMPUTE_BACKEND_THEANO]
+
+# PortAudio stream callback status flags (paInputUnderflow, ...), as passed to PyAudio stream callbacks
+PA_INPUT_UNDERFLOW = 0x1
+PA_INPUT_OVERFLOW = 0x2
+PA_OUTPUT_UNDERFLOW = 0x4
+PA_OUTPUT_OVERFLOW = 0x8
+PA_PRIMING_OUTPUT = 0x10
+
+TDOA_SEARCH_EXHAUSTIVE = 'Exhaustive'
+TDOA_SEARCH_HIERARCHICAL = 'Hierarchical'
+TDOA_SEARCHES = [TDOA_SEARCH_EXHAUSTIVE, TDOA_SEARCH_HIERARCHICAL]
@@ -0,0 +1,167 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import os
+import logging
+import numpy as np
+from time import time
+from multiprocessing import Process
+
+from gccNMF.realtime.gccNMFKernels import warmStartActivations, updateKLActivations, ACTIVATION_EPSILON
+from gccNMF.realtime.gccNMFPretraining import DICTIONARY_TYPES
+
+POLL_INTERVAL_SECONDS = 0.1
+# below the audio and GCCNMF worker processes
+ADAPTATION_NICENESS = 10
+
+def getAdaptedDictionaryShapes(numFrequencies, dictionarySize):
+    # dictionary slot arrays: the adapted W and recV, and the key of the dictionary they were adapted from
+    return [('W', (numFrequencies, dictionarySize)), ('recV', (numFrequencies,)), ('dictionaryKey', (2,))]
+
+def getDictionaryKey(dictionaryType, dictionarySize):
+    return np.array( [DICTIONARY_TYPES.index(dictionaryType), dictionarySize], np.float32 )
+
+# Online KL-NMF dictionary learning on minibatches of magnitude frames (Lefevre et al., online NMF): activations are
+# fitted with W fixed, then W is the ratio of exponentially forgotten sufficient statistics, A = W * (V / WH) H^T and
+# B = sum(H). The initial dictionary enters the statistics with the weight of priorWeight minibatches, so it is only
+# forgotten gradually. Atom order and norms are kept, the adapted W replaces the ordered dictionary atom for atom.
+class OnlineKLDictionary(object):
+    def __init__(self, W, forgettingFactor=0.9, numHIterations=10, priorWeight=4.0):
+        self.W = np.array(W, np.float32, order='C')
+        self.atomNorms = np.sqrt( np.sum(np.square(self.W), axis=0) )
+        self.forgettingFactor = forgettingFactor
+        self.numHIterations = numHIterations
+        self.priorWeight = priorWeight
+        self.A = None
+        self.B = None
+        self.numUpdates = 0
+        self.minibatchSize = None
+    
+    def initBuffers(self, minibatchSize):
+        # reused by every update with the same number of frames
+        numFrequencies, dictionarySize = self.W.shape
+        self.minibatchSize = minibatchSize
+        self.H = np.ones( (dictionarySize, minibatchSize), np.float32 )
+        self.WH = np.zeros( (numFrequencies, minibatchSize), np.float32 )
+        self.ratio = np.zeros( (numFrequencies, minibatchSize), np.float32 )
+        self.WSum = np.zeros( (dictionarySize, 1), np.float32 )
+        self.numerators = np.zeros( (numFrequencies, dictionarySize), np.float32 )
+        self.activationSums = np.zeros(dictionarySize, np.float32)
+        self.atomGains = np.zeros(dictionarySize, np.float32)
+    
+    def update(self, V):
+        # V: (freq, time) magnitude frames
+        if V.shape[1] != self.minibatchSize:
+            self.initBuffers(V.shape[1])
+        H, WH, ratio = self.H, self.WH, self.ratio
+        H.fill(1)
+        np.sum(self.W, axis=0, out=self.WSum[:, 0])
+        self.WSum += ACTIVATION_EPSILON
+        warmStartActivations(V, self.W, H, WH)
+        updateKLActivations(V, self.W, H, WH, self.WSum, self.numHIterations, ratio)
+        
+        np.divide(V, WH, out=ratio)
+        np.dot(ratio, H.T, out=self.numerators)
+        self.numerators *= self.W
+        np.sum(H, axis=1, out=self.activationSums)
+        if self.A is None:
+            self.B = self.priorWeight * self.activationSums
+            self.A = self.W * self.B
+        self.A *= self.forgettingFactor
+        self.A += self.numerators
+        self.B *= self.forgettingFactor
+        self.B += self.activationSums
+        np.add(self.B, ACTIVATION_EPSILON, out=self.activationSums)
+        np.divide(self.A, self.activationSums, out=self.W)
+        
+        np.sqrt( np.sum(np.square(self.W), axis=0), out=self.atomGains )
+        self.atomGains += ACTIVATION_EPSILON
+        np.divide(self.atomNorms, self.atomGains, out=self.atomGains)
+        self.W *= self.atomGains
+        self.A *= self.atomGains
+        self.numUpdates += 1
+        return self.W
+    
+    def getRecV(self):
+        return np.sum(self.W, axis=-1)
+
+# Background dictionary adaptation for the realtime pipeline: the GCCNMF worker pushes the magnitude spectra of its
+# active blocks into adaptationRing (dropping them when the ring is full), this process learns from them in minibatches
+# and every publishIntervalInSeconds publishes W and recV to dictionarySlot, which the worker swaps in between blocks.
+# The learner keeps the dictionary it was started with: while the worker is reconfigured to another dictionary type or
+# size it stops pushing magnitudes, so the learner idles and publishes nothing until that dictionary is selected again.
+class DictionaryAdaptationProcess(Process):
+    def __init__(self, dictionariesW, dictionaryType, dictionarySize, numFrequencies, adaptationRing, dictionarySlot, terminateEvent,
+                 minibatchSize=64, forgettingFactor=0.9, numHIterations=10, publishIntervalInSeconds=5.0, priorWeight=4.0):
+        super(DictionaryAdaptationProcess, self).__init__()
+        self.dictionariesW = dictionariesW
+        self.dictionaryType = dictionaryType
+        self.dictionarySize = dictionarySize
+        self.numFrequencies = numFrequencies
+        self.adaptationRing = adaptationRing
+        self.dictionarySlot = dictionarySlot
+        self.terminateEvent = terminateEvent
+        self.minibatchSize = minibatchSize
+        self.forgettingFactor = forgettingFactor
+        self.numHIterations = numHIterations
+        self.publishIntervalInSeconds = publishIntervalInSeconds
+        self.priorWeight = priorWeight
+    
+    def run(self):
+        try:
+            os.nice(ADAPTATION_NICENESS)
+        except (AttributeError, OSError):
+            pass
+        dictionary = OnlineKLDictionary(self.dictionariesW[self.dictionaryType][self.dictionarySize], self.forgettingFactor,
+                                        self.numHIterations, self.priorWeight)
+        minibatch = np.zeros( (self.numFrequencies, self.minibatchSize), np.float32 )
+        numFrames = 0
+        lastPublishTime = time()
+        publishedNumUpdates = 0
+        logging.info( 'DictionaryAdaptationProcess: adapting %s W (size %d), minibatches of %d frames' % (self.dictionaryType, self.dictionarySize, self.minibatchSize) )
+        
+        while not self.terminateEvent.is_set():
+            if not self.adaptationRing.wait(POLL_INTERVAL_SECONDS):
+                continue
+            frames = self.adaptationRing.readSlot().reshape(self.numFrequencies, -1)
+            frameIndex = 0
+            while frameIndex < frames.shape[1]:
+                numToCopy = min(self.minibatchSize - numFrames, frames.shape[1] - frameIndex)
+                minibatch[:, numFrames:numFrames+numToCopy] = frames[:, frameIndex:frameIndex+numToCopy]
+                numFrames += numToCopy
+                frameIndex += numToCopy
+                if numFrames == self.minibatchSize:
+                    dictionary.update(minibatch)
+                    numFrames = 0
+            self.adaptationRing.commitRead()
+            
+            if dictionary.numUpdates > publishedNumUpdates and time() - lastPublishTime >= self.publishIntervalInSeconds:
+                version = self.dictionarySlot.publish(W=dictionary.W, recV=dictionary.getRecV(),
+                                                      dictionaryKey=getDictionaryKey(self.dictionaryType, self.dictionarySize))
+                logging.info( 'DictionaryAdaptationProcess: published W version %d after %d minibatches' % (version, dictionary.numUpdates) )
+                lastPublishTime = time()
+                publishedNumUpdates = dictionary.numUpdates
+        logging.info('DictionaryAdaptationProcess: received terminate')
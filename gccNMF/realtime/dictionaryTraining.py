@@ -0,0 +1,255 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import logging
+import argparse
+import numpy as np
+from os import makedirs, getpid, replace
+from os.path import exists, join, isdir
+from glob import glob
+from time import time
+from multiprocessing import Pool
+
+from gccNMF.realtime.wavfile import wavread
+from gccNMF.realtime.gccNMFKernels import warmStartActivations, updateKLActivations, ACTIVATION_EPSILON
+from gccNMF.realtime.dictionaryAdaptation import OnlineKLDictionary
+
+# Streaming dictionary training for the pretrained W_<size>.npy dictionaries. The magnitude frames V are read in
+# column chunks, either from a memory-mapped (freq, time) .npy file such as chimeTrainSet.npy or from the STFTs
+# of the WAV files in a directory (one chunk per file), so the corpus never has to fit in memory. Each dictionary is
+# learned with online KL-NMF (OnlineKLDictionary) on shuffled minibatches, from a random unit-norm start and without
+# a prior. A random subset of the chunks is held out: training stops once the held-out KL divergence improves by less
+# than tolerance for patience evaluations in a row, and the best dictionary seen is kept. Each dictionary size trains
+# in its own worker process, and is written as <outputDir>/W_<size>.npy for loadPretrainedW.
+
+DEFAULT_DICTIONARY_SIZES = [64, 128, 256, 512, 1024]
+W_FILE_NAME_TEMPLATE = 'W_%d.npy'
+WAV_FILE_PATTERN = '*.wav'
+
+class MemoryMappedFrameSource(object):
+    def __init__(self, filePath, chunkSize=4096):
+        self.filePath = filePath
+        self.chunkSize = chunkSize
+        self.V = None
+        self.numFrequencies, self.numFrames = self.getV().shape
+        self.numChunks = -(-self.numFrames // chunkSize)
+    
+    def __getstate__(self):
+        # workers map the file themselves
+        state = self.__dict__.copy()
+        state['V'] = None
+        return state
+    
+    def getV(self):
+        if self.V is None:
+            self.V = np.load(self.filePath, mmap_mode='r')
+        return self.V
+    
+    def readChunk(self, chunkIndex):
+        startIndex = chunkIndex * self.chunkSize
+        return np.array( self.getV()[:, startIndex:startIndex+self.chunkSize], np.float32 )
+
+class WavDirectoryFrameSource(object):
+    def __init__(self, inputDir, windowSize=1024, hopSize=512):
+        self.filePaths = sorted( glob( join(inputDir, WAV_FILE_PATTERN) ) )
+        if not self.filePaths:
+            raise IOError('DictionaryTraining: no WAV files found in %s' % inputDir)
+        self.windowSize = windowSize
+        self.hopSize = hopSize
+        self.numFrequencies = windowSize // 2 + 1
+        self.numChunks = len(self.filePaths)
+    
+    def readChunk(self, chunkIndex):
+        # magnitude frames of every channel, concatenated in time
+        from gccNMF.realtime.librosaSTFT import stft
+        samples, _ = wavread(self.filePaths[chunkIndex])
+        samples = np.atleast_2d(samples)
+        return np.concatenate( [np.abs( stft(channelSamples.copy(), self.windowSize, self.hopSize, self.windowSize, np.hanning, center=False) )
+                                for channelSamples in samples], axis=-1 ).astype(np.float32)
+
+def getFrameSource(inputPath, chunkSize=4096, windowSize=1024, hopSize=512):
+    if isdir(inputPath):
+        return WavDirectoryFrameSource(inputPath, windowSize, hopSize)
+    return MemoryMappedFrameSource(inputPath, chunkSize)
+
+def splitChunkIndexes(numChunks, validationFraction, randomState):
+    chunkIndexes = randomState.permutation(numChunks)
+    numValidationChunks = int( round(numChunks * validationFraction) )
+    if numChunks > 1:
+        numValidationChunks = min( max(numValidationChunks, 1), numChunks-1 )
+    else:
+        numValidationChunks = 0
+    return np.sort(chunkIndexes[numValidationChunks:]), np.sort(chunkIndexes[:numValidationChunks])
+
+def getValidationFrames(frameSource, chunkIndexes, maxNumFrames, randomState):
+    # at most maxNumFrames non-silent frames, sampled evenly from the held-out chunks as they are read
+    maxNumChunkFrames = -(-maxNumFrames // len(chunkIndexes))
+    validationFrames = []
+    for chunkIndex in chunkIndexes:
+        frames = frameSource.readChunk(chunkIndex)
+        frames = frames[:, np.sum(frames, axis=0) > 0]
+        if frames.shape[1] > maxNumChunkFrames:
+            frames = frames[:, np.sort( randomState.choice(frames.shape[1], maxNumChunkFrames, replace=False) )]
+        validationFrames.append(frames)
+    return np.ascontiguousarray( np.concatenate(validationFrames, axis=-1)[:, :maxNumFrames] )
+
+def getRelativeKLDivergence(V, W, numHIterations):
+    # D(V || W H) / sum(V), H fitted to V with W fixed
+    H = np.ones( (W.shape[1], V.shape[1]), np.float32 )
+    WH = np.zeros_like(V)
+    WSum = np.sum(W, axis=0)[:, np.newaxis] + np.float32(ACTIVATION_EPSILON)
+    warmStartActivations(V, W, H, WH)
+    updateKLActivations(V, W, H, WH, WSum, numHIterations, np.zeros_like(V))
+    divergence = np.sum( V * np.log( (V + ACTIVATION_EPSILON) / WH ) - V + WH )
+    return float( divergence / np.sum(V) )
+
+def iterateMinibatches(frameSource, chunkIndexes, minibatch, randomState):
+    # fills minibatch in place from the chunks in random order, frames shuffled within each chunk;
+    # frames left over at the end of an epoch start the next one
+    numFrames = 0
+    while True:
+        for chunkIndex in randomState.permutation(chunkIndexes):
+            frames = frameSource.readChunk(chunkIndex)
+            frames = frames[:, randomState.permutation(frames.shape[1])]
+            frameIndex = 0
+            while frameIndex < frames.shape[1]:
+                numToCopy = min(minibatch.shape[1] - numFrames, frames.shape[1] - frameIndex)
+                minibatch[:, numFrames:numFrames+numToCopy] = frames[:, frameIndex:frameIndex+numToCopy]
+                numFrames += numToCopy
+                frameIndex += numToCopy
+                if numFrames == minibatch.shape[1]:
+                    yield minibatch
+                    numFrames = 0
+        yield None
+
+def trainDictionary(frameSource, dictionarySize, minibatchSize=128, forgettingFactor=0.95, numHIterations=10, maxNumEpochs=30,
+                    evaluationIntervalInMinibatches=50, tolerance=1e-3, patience=3, validationFraction=0.1, maxNumValidationFrames=2048, seedValue=0):
+    randomState = np.random.RandomState(seedValue)
+    trainingChunkIndexes, validationChunkIndexes = splitChunkIndexes(frameSource.numChunks, validationFraction, randomState)
+    if len(validationChunkIndexes) == 0:
+        logging.info('DictionaryTraining: a single chunk, validating on training frames')
+        validationChunkIndexes = trainingChunkIndexes
+    validationV = getValidationFrames(frameSource, validationChunkIndexes, maxNumValidationFrames, randomState)
+    
+    W = randomState.rand(frameSource.numFrequencies, dictionarySize).astype(np.float32) + np.float32(ACTIVATION_EPSILON)
+    W /= np.sqrt( np.sum(np.square(W), axis=0) )
+    dictionary = OnlineKLDictionary(W, forgettingFactor, numHIterations, priorWeight=0)
+    minibatch = np.zeros( (frameSource.numFrequencies, minibatchSize), np.float32 )
+    
+    bestW = dictionary.W.copy()
+    bestDivergence = getRelativeKLDivergence(validationV, bestW, numHIterations)
+    numEpochs = 0
+    numStalledEvaluations = 0
+    logging.info( 'DictionaryTraining: W (size %d), %d training chunks, %d validation frames, initial divergence %.4f' %
+                  (dictionarySize, len(trainingChunkIndexes), validationV.shape[1], bestDivergence) )
+    
+    # evaluated every evaluationIntervalInMinibatches and at the end of each epoch
+    lastEvaluationNumUpdates = 0
+    for V in iterateMinibatches(frameSource, trainingChunkIndexes, minibatch, randomState):
+        if V is None:
+            numEpochs += 1
+        else:
+            dictionary.update(V)
+            if dictionary.numUpdates % evaluationIntervalInMinibatches:
+                continue
+        
+        if dictionary.numUpdates > lastEvaluationNumUpdates:
+            lastEvaluationNumUpdates = dictionary.numUpdates
+            divergence = getRelativeKLDivergence(validationV, dictionary.W, numHIterations)
+            logging.debug( 'DictionaryTraining: W (size %d), %d minibatches, divergence %.4f' % (dictionarySize, dictionary.numUpdates, divergence) )
+            numStalledEvaluations = 0 if divergence < bestDivergence * (1 - tolerance) else numStalledEvaluations + 1
+            if divergence < bestDivergence:
+                bestDivergence = divergence
+                bestW[:] = dictionary.W
+            if numStalledEvaluations == patience:
+                logging.info( 'DictionaryTraining: W (size %d) converged after %d minibatches' % (dictionarySize, dictionary.numUpdates) )
+                break
+        if numEpochs == maxNumEpochs:
+            break
+    
+    logging.info( 'DictionaryTraining: W (size %d), %d minibatches (%d epochs), divergence %.4f' % (dictionarySize, dictionary.numUpdates, numEpochs, bestDivergence) )
+    return bestW, bestDivergence
+
+def saveDictionary(W, outputDir, dictionarySize):
+    # written under a temporary name first, so a concurrent loadPretrainedW never maps a partial file
+    filePath = join(outputDir, W_FILE_NAME_TEMPLATE % dictionarySize)
+    temporaryFilePath = '%s.%d.npy' % (filePath[:-4], getpid())
+    np.save(temporaryFilePath, W)
+    replace(temporaryFilePath, filePath)
+    return filePath
+
+def trainDictionaryWorker(arguments):
+    frameSource, dictionarySize, outputDir, trainingArguments = arguments
+    startTime = time()
+    W, divergence = trainDictionary(frameSource, dictionarySize, **trainingArguments)
+    return dictionarySize, saveDictionary(W, outputDir, dictionarySize), divergence, time() - startTime
+
+def trainDictionaries(inputPath, outputDir, dictionarySizes=DEFAULT_DICTIONARY_SIZES, numWorkers=None, chunkSize=4096, windowSize=1024, hopSize=512, **trainingArguments):
+    frameSource = getFrameSource(inputPath, chunkSize, windowSize, hopSize)
+    if not exists(outputDir):
+        makedirs(outputDir)
+    
+    results = []
+    numWorkers = len(dictionarySizes) if numWorkers is None else numWorkers
+    pool = Pool(numWorkers)
+    try:
+        # largest first, they take the longest
+        workerArguments = [(frameSource, dictionarySize, outputDir, trainingArguments) for dictionarySize in sorted(dictionarySizes, reverse=True)]
+        for dictionarySize, filePath, divergence, elapsed in pool.imap_unordered(trainDictionaryWorker, workerArguments):
+            logging.info( 'DictionaryTraining: saved W (size %d, divergence %.4f) in %.1f s: %s' % (dictionarySize, divergence, elapsed, filePath) )
+            results.append( (dictionarySize, filePath, divergence, elapsed) )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Streaming KL-NMF training of the pretrained W_<size>.npy dictionaries')
+    parser.add_argument('inputPath', help='(freq, time) magnitude .npy file, memory-mapped, or a directory of WAV files')
+    parser.add_argument('outputDir')
+    parser.add_argument('--dictionarySizes', type=int, nargs='+', default=DEFAULT_DICTIONARY_SIZES)
+    parser.add_argument('--numWorkers', type=int, default=None)
+    parser.add_argument('--chunkSize', type=int, default=4096)
+    parser.add_argument('--windowSize', type=int, default=1024)
+    parser.add_argument('--hopSize', type=int, default=512)
+    parser.add_argument('--minibatchSize', type=int, default=128)
+    parser.add_argument('--forgettingFactor', type=float, default=0.95)
+    parser.add_argument('--numHIterations', type=int, default=10)
+    parser.add_argument('--maxNumEpochs', type=int, default=30)
+    parser.add_argument('--evaluationIntervalInMinibatches', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=1e-3)
+    parser.add_argument('--patience', type=int, default=3)
+    arguments = parser.parse_args()
+    
+    trainDictionaries(arguments.inputPath, arguments.outputDir, arguments.dictionarySizes, arguments.numWorkers, arguments.chunkSize,
+                      arguments.windowSize, arguments.hopSize, minibatchSize=arguments.minibatchSize, forgettingFactor=arguments.forgettingFactor,
+                      numHIterations=arguments.numHIterations, maxNumEpochs=arguments.maxNumEpochs,
+                      evaluationIntervalInMinibatches=arguments.evaluationIntervalInMinibatches, tolerance=arguments.tolerance, patience=arguments.patience)
@@ -51,18 +51,18 @@ SOFTWARE.
 
 from numpy.random import random, seed
 from numpy import hanning, array, squeeze, arange, sqrt, sum, dot, newaxis, linspace, \
-    exp, outer, pi, einsum, argsort, zeros, empty, nanargmax, where, zeros_like, angle, float32, complex64, argmax
-from scipy.signal import argrelmax
+    exp, outer, pi, einsum, argsort, empty, nanargmax, where, float32, complex64, argmax, divide, result_type, \
+    multiply, matmul, equal, asarray, ones, absolute
 import logging
-import os
 
-from sklearn.cluster import KMeans
-
-from gccNMF.realtime.librosaSTFT import stft, istft
+# scipy.signal, sklearn and librosaSTFT (scipy, six) are imported in the functions using them, they dominate import time
 from gccNMF.realtime.wavfile import wavread, wavwrite
+from gccNMF.realtime.precomputationCache import LRUCache
 
 SPEED_OF_SOUND_IN_METRES_PER_SECOND = 340.29  # 음속
 
+EXP_J_OMEGA_TAU_CACHE = LRUCache(maxEntries=8)
+
 
 def getMixtureFileName(mixtureFileNamePrefix):
     return mixtureFileNamePrefix + '_mix.wav'
@@ -93,7 +93,12 @@ def getTDOAsInSeconds(microphoneSeparationInMetres, numTDOAs):
 def getFrequenciesInHz(sampleRate, numFrequencies):
     return linspace(0, sampleRate/2, numFrequencies)
 
+def getExpJOmegaTau(frequenciesInHz, microphoneSeparationInMetres, numTDOAs):
+    key = (frequenciesInHz.tobytes(), microphoneSeparationInMetres, numTDOAs)
+    return EXP_J_OMEGA_TAU_CACHE.get( key, lambda: exp( outer(frequenciesInHz, -(2j * pi) * getTDOAsInSeconds(microphoneSeparationInMetres, numTDOAs)) ) )
+
 def computeComplexMixtureSpectrogram(stereoSamples, windowSize, hopSize, windowFunction, fftSize=None):
+    from gccNMF.realtime.librosaSTFT import stft
     if fftSize is None:
         fftSize = windowSize
 
@@ -110,9 +115,20 @@ def performKLNMF(V, dictionarySize, numIterations, sparsityAlpha, epsilon=1e-16,
     W = random( (V.shape[0], dictionarySize) ).astype(float32) + epsilon
     H = random( (dictionarySize, V.shape[1]) ).astype(float32) + epsilon
 
+    # the quotient V / WH and the update factors are computed into buffers reused across iterations
+    WH = empty( V.shape, result_type(W, H) )
+    quotient = empty( V.shape, result_type(V, WH) )
+    HUpdate = empty( H.shape, result_type(W, quotient) )
+    WUpdate = empty( W.shape, result_type(quotient, H) )
     for iterationIndex in range(numIterations):
-        H *= dot( W.T, V / dot( W, H ) ) / ( sum(W, axis=0)[:, newaxis] + sparsityAlpha + epsilon )
-        W *= dot( V / dot( W, H ), H.T ) / sum(H, axis=1)
+        divide( V, dot(W, H, out=WH), out=quotient )
+        dot( W.T, quotient, out=HUpdate )
+        HUpdate /= ( sum(W, axis=0)[:, newaxis] + sparsityAlpha + epsilon )
+        H *= HUpdate
+        divide( V, dot(W, H, out=WH), out=quotient )
+        dot( quotient, H.T, out=WUpdate )
+        WUpdate /= sum(H, axis=1)
+        W *= WUpdate
         
         dictionaryAtomNorms = sqrt( sum(W**2, 0 ) )
         W /= dictionaryAtomNorms
@@ -120,16 +136,28 @@ def performKLNMF(V, dictionarySize, numIterations, sparsityAlpha, epsilon=1e-16,
         
     return W, H
 
+def performKLNMFActivations(V, W, numIterations, sparsityAlpha, epsilon=1e-16, seedValue=0):
+    # KL-NMF with a fixed (e.g. pretrained) dictionary W, only the activations H are learned
+    seed(seedValue)
+    
+    H = random( (W.shape[1], V.shape[1]) ).astype(float32) + epsilon
+    normalization = sum(W, axis=0)[:, newaxis] + sparsityAlpha + epsilon
+    
+    for iterationIndex in range(numIterations):
+        H *= dot( W.T, V / (dot( W, H ) + epsilon) ) / normalization
+        
+    return H
+
 def getAngularSpectrogram(spectralCoherenceV, frequenciesInHz, microphoneSeparationInMetres, numTDOAs):
     numFrequencies, numTime = spectralCoherenceV.shape
     
-    tdoasInSeconds = getTDOAsInSeconds(microphoneSeparationInMetres, numTDOAs)
-    expJOmega = exp( outer(frequenciesInHz, -(2j * pi) * tdoasInSeconds) )
+    expJOmega = getExpJOmegaTau(frequenciesInHz, microphoneSeparationInMetres, numTDOAs)
     
     FREQ, TIME, TDOA = range(3)
     return sum( einsum( spectralCoherenceV, [FREQ, TIME], expJOmega, [FREQ, TDOA], [TDOA, FREQ, TIME] ).real, axis=1 )
     
 def estimateTargetTDOAIndexesFromAngularSpectrum(angularSpectrum, microphoneSeparationInMetres, numTDOAs, numSources):
+    from scipy.signal import argrelmax
     peakIndexes = argrelmax(angularSpectrum)[0]
     tdoasInSeconds = getTDOAsInSeconds(microphoneSeparationInMetres, numTDOAs)
     
@@ -138,9 +166,9 @@ def estimateTargetTDOAIndexesFromAngularSpectrum(angularSpectrum, microphoneSepa
         sourcePeakIndexes = peakIndexes[ argsort(angularSpectrum[peakIndexes])[-numSources:] ]
         
         if len(sourcePeakIndexes) != numSources:
-            logging.info('didn''t find enough peaks in ITDFunctions.estimateTargetTDOAIndexesFromAngularSpectrum... aborting' )
-            os._exit(1)
+            raise ValueError( 'estimateTargetTDOAIndexesFromAngularSpectrum: found %d angular spectrum peaks, expected numSources = %d' % (len(sourcePeakIndexes), numSources) )
     else:
+        from sklearn.cluster import KMeans
         kMeans = KMeans(n_clusters=2, n_init=10)
         kMeans.fit(angularSpectrum[peakIndexes][:, newaxis])
         sourcesClusterIndex = argmax(kMeans.cluster_centers_)
@@ -156,39 +184,48 @@ def estimateTargetTDOAIndexesFromAngularSpectrum(angularSpectrum, microphoneSepa
 def getTargetTDOAGCCNMFs(coherenceV, microphoneSeparationInMetres, numTDOAs, frequenciesInHz, targetTDOAIndexes, W, stereoH):
     numTargets = len(targetTDOAIndexes)
     
-    hypothesisTDOAs = getTDOAsInSeconds(microphoneSeparationInMetres, numTDOAs)
-    
     numFrequencies, numTime = coherenceV.shape
     numChannels, numAtom, numTime = stereoH.shape
     normalizedW = W #/ sqrt( sum(W**2, axis=1, keepdims=True) )
     
-    expJOmegaTau = exp( outer(frequenciesInHz, -(2j * pi) * hypothesisTDOAs) )
-
-    TIME, FREQ, TDOA, ATOM = range(4)
-    targetTDOAGCCNMFs = empty( (numTargets, numAtom, numTime), float32 )
-    for targetIndex, targetTDOAIndex in enumerate(targetTDOAIndexes):
-        gccChunk = einsum( coherenceV, [FREQ, TIME], expJOmegaTau[:, targetTDOAIndex], [FREQ], [FREQ, TIME] )
-        targetTDOAGCCNMFs[targetIndex] = einsum( normalizedW, [FREQ, ATOM], gccChunk, [FREQ, TIME], [ATOM, TIME] ).real
+    # Re(e^{j omega tau} coherence) for every target at once, (target, freq, time), then one batched GEMM with W^T
+    targetExpJOmegaTau = getExpJOmegaTau(frequenciesInHz, microphoneSeparationInMetres, numTDOAs)[:, targetTDOAIndexes].T[:, :, newaxis]
+    targetGCCs = empty( (numTargets, numFrequencies, numTime), float32 )
+    imaginaryProducts = empty( (numTargets, numFrequencies, numTime), float32 )
+    multiply( targetExpJOmegaTau.real, coherenceV.real, out=targetGCCs, casting='unsafe' )
+    multiply( targetExpJOmegaTau.imag, coherenceV.imag, out=imaginaryProducts, casting='unsafe' )
+    targetGCCs -= imaginaryProducts
     
-    return targetTDOAGCCNMFs
+    targetTDOAGCCNMFs = empty( (numTargets, numAtom, numTime), float32 )
+    return matmul( asarray(normalizedW, float32).T, targetGCCs, out=targetTDOAGCCNMFs )
     
 def getTargetCoefficientMasks(targetTDOAGCCNMFs, numTargets):
+    # (target, atom, time) binary masks, each atom goes to the target with the largest GCC-NMF
     nanArgMax = nanargmax(targetTDOAGCCNMFs, axis=0)
     
-    targetCoefficientMasks = zeros_like(targetTDOAGCCNMFs)
-    for targetIndex in range(numTargets):
-        targetCoefficientMasks[targetIndex][where(nanArgMax==targetIndex)] = 1
-    return targetCoefficientMasks
+    targetCoefficientMasks = empty( (numTargets,) + nanArgMax.shape, float32 )
+    return equal( arange(numTargets)[:, newaxis, newaxis], nanArgMax, out=targetCoefficientMasks )
     
 def getTargetSpectrogramEstimates(targetCoefficientMasks, complexMixtureSpectrogram, W, stereoH):
+    # (target, channel, freq, time) magnitudes W (H * mask) from one broadcast matmul, with the mixture phase
     numTargets = targetCoefficientMasks.shape[0]
-    targetSpectrogramEstimates = zeros( (numTargets,) + complexMixtureSpectrogram.shape, complex64 )
-    for targetIndex, targetCoefficientMask in enumerate(targetCoefficientMasks):
-        for channelIndex, coefficients in enumerate(stereoH):
-            targetSpectrogramEstimates[targetIndex, channelIndex] = dot(W, coefficients * targetCoefficientMask)
-    return targetSpectrogramEstimates * exp( 1j * angle(complexMixtureSpectrogram) )
+    maskedH = multiply( stereoH[newaxis], targetCoefficientMasks[:, newaxis], dtype=float32 )
+    targetMagnitudes = empty( (numTargets,) + complexMixtureSpectrogram.shape, float32 )
+    matmul( asarray(W, float32), maskedH, out=targetMagnitudes )
+    
+    # mixture phase as X / |X|, 1 where |X| is 0 (as exp(1j * angle(0)))
+    mixtureMagnitudes = absolute( complexMixtureSpectrogram )
+    mixturePhases = ones( complexMixtureSpectrogram.shape, complex64 )
+    divide( complexMixtureSpectrogram, mixtureMagnitudes, out=mixturePhases, where=mixtureMagnitudes > 0, casting='unsafe' )
+    
+    # real and imaginary parts written separately, without casting the magnitudes to complex
+    targetSpectrogramEstimates = empty( targetMagnitudes.shape, complex64 )
+    multiply( targetMagnitudes, mixturePhases.real, out=targetSpectrogramEstimates.real )
+    multiply( targetMagnitudes, mixturePhases.imag, out=targetSpectrogramEstimates.imag )
+    return targetSpectrogramEstimates
 
 def getTargetSignalEstimates(targetSpectrogramEstimates, windowSize, hopSize, windowFunction):
+    from gccNMF.realtime.librosaSTFT import istft
     numTargets, numChannels, numFreq, numTime = targetSpectrogramEstimates.shape
     stftGainFactor = hopSize / float(windowSize) * 2
     
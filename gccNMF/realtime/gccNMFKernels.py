@@ -0,0 +1,227 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import numpy as np
+
+from gccNMF.realtime.defs import SPEED_OF_SOUND_IN_METRES_PER_SECOND, TARGET_MODE_BOXCAR, TARGET_MODE_WINDOW_FUNCTION
+
+# NumPy implementations of the realtime GCC-NMF pipeline:
+# coherence -> GCC -> NMF projection -> HMask -> tfMask
+# Shapes: spectrogram (channel, freq, time), realGCC (freq, time, tdoa), gccNMF (time, tdoa, atom),
+# multi-target masks have a leading target axis
+#
+# The fused path never forms the complex GCC tensor: Re(coherence * expJOmegaTau) is computed with real
+# arithmetic from the precomputed steering matrix [Re(E).T, -Im(E).T] into a preallocated (time, tdoa, freq)
+# float32 scratch buffer, which is then projected onto W with a single batched GEMM.
+# Weighting W by the coherence instead would double the GEMM cost, and precomputing Re/Im(E) x W
+# would take numFreq * numTDOAs * dictionarySize floats per configuration.
+
+def getFrequenciesInHz(sampleRate, numFrequencies):
+    return np.linspace(0, sampleRate/2, numFrequencies).astype(np.float32)
+
+def getHypothesisTDOAs(microphoneSeparationInMetres, numTDOAs):
+    maxTDOA = microphoneSeparationInMetres / SPEED_OF_SOUND_IN_METRES_PER_SECOND
+    return np.linspace(-maxTDOA, maxTDOA, numTDOAs).astype(np.float32)
+
+def getExpJOmegaTau(frequenciesInHz, hypothesisTDOAs):
+    return np.exp( np.outer(frequenciesInHz, -(2j * np.pi) * hypothesisTDOAs) ).astype(np.complex64)
+
+def getSteeringMatrix(expJOmegaTau):
+    return np.ascontiguousarray( np.concatenate( [expJOmegaTau.real.T, -expJOmegaTau.imag.T], axis=1 ), np.float32 )
+
+def computeCoherence(complexMixtureSpectrogram, out=None):
+    left, right = complexMixtureSpectrogram[0], complexMixtureSpectrogram[1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coherenceV = np.multiply(left, right.conj(), out=out)
+        coherenceV /= np.abs(left) * np.abs(right)
+    return coherenceV
+
+def computeStackedCoherence(complexMixtureSpectrogram, out):
+    # out: (2 * numFreq, numTime) real followed by imaginary coherence, zero where either channel is silent
+    left, right = complexMixtureSpectrogram[0], complexMixtureSpectrogram[1]
+    numFrequencies = left.shape[0]
+    crossSpectrum = left * right.conj()
+    magnitude = np.abs(left) * np.abs(right)
+    valid = magnitude > 0
+    out.fill(0)
+    np.divide(crossSpectrum.real, magnitude, out=out[:numFrequencies], where=valid)
+    np.divide(crossSpectrum.imag, magnitude, out=out[numFrequencies:], where=valid)
+    return np.count_nonzero(valid, axis=0)
+
+def computeFusedGCCPHAT(steeringMatrix, stackedCoherence, numValidFrequencies):
+    # frequency-averaged GCC-PHAT (tdoa, time), equivalent to nanmean(realGCC, axis=0).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.dot(steeringMatrix, stackedCoherence) / numValidFrequencies
+
+def computeFusedGCCNMF(steeringMatrix, stackedCoherence, W, gccScratch, out):
+    # gccScratch: (time, tdoa, 2 * numFreq), out: (time, tdoa, atom)
+    numFrequencies = W.shape[0]
+    np.multiply(stackedCoherence.T[:, np.newaxis, :], steeringMatrix, out=gccScratch)
+    realGCC = gccScratch[..., :numFrequencies]
+    realGCC += gccScratch[..., numFrequencies:]
+    return np.matmul(realGCC, W, out=out)
+
+def computeRealGCC(coherenceV, expJOmegaTau):
+    return (coherenceV[:, :, np.newaxis] * expJOmegaTau[:, np.newaxis]).real
+
+def computeGCCNMF(realGCC, W):
+    return np.tensordot(realGCC, W, axes=([0], [0]))
+
+def getAtomTDOAIndexes(gccNMF):
+    return np.argmax(gccNMF, axis=1).T
+
+def computeHMask(atomTDOAIndexes, targetMode, targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor):
+    distances = np.abs(atomTDOAIndexes - targetTDOAIndex)
+    if targetMode == TARGET_MODE_BOXCAR:
+        return (distances < targetTDOAEpsilon).astype(np.float32)
+    elif targetMode == TARGET_MODE_WINDOW_FUNCTION:
+        return (np.exp( -(distances / targetTDOAEpsilon) ** targetTDOABeta ) / (1+targetTDOANoiseFloor) + targetTDOANoiseFloor).astype(np.float32)
+    raise ValueError('unsupported targetMode: %s' % str(targetMode))
+
+def computeTFMask(W, HMask, recV):
+    return np.dot(W, HMask) / recV[:, np.newaxis]
+
+def computeMultiTargetHMasks(gccNMF, targetTDOAIndexes):
+    # (target, atom, time) binary masks: as in the offline getTargetCoefficientMasks, each atom goes to the target
+    # with the largest GCC-NMF value at the target's TDOA
+    numTDOAs = gccNMF.shape[1]
+    targetIndexes = np.clip( np.round(targetTDOAIndexes).astype(np.intp), 0, numTDOAs-1 )
+    winningTargets = np.argmax(gccNMF[:, targetIndexes, :], axis=1).T
+    return (winningTargets == np.arange(len(targetIndexes))[:, np.newaxis, np.newaxis]).astype(np.float32)
+
+def computeMultiTargetTFMasks(W, HMasks, recV):
+    # (target, freq, time), one batched product for all targets
+    return np.matmul(W, HMasks) / recV[:, np.newaxis]
+
+# Online KL-NMF activations with the dictionary W fixed, as performKLNMFActivations but warm-started: each block starts
+# from the previous block's last frame, rescaled to the level of each new frame, and takes a few multiplicative updates
+# on the channel-averaged magnitude spectrogram. A small part of each frame's mean activation is mixed back in, since
+# multiplicative updates cannot revive atoms the previous block drove to zero. The masks then weight each atom by its
+# activation, W (HMask H) / W H, instead of W HMask / W 1.
+ACTIVATION_EPSILON = 1e-9
+ACTIVATION_WARM_START_MIX = 0.1
+
+def computeMixtureMagnitude(complexMixtureSpectrogram, out):
+    # (freq, time) mean magnitude over channels
+    np.abs(complexMixtureSpectrogram[0], out=out)
+    out += np.abs(complexMixtureSpectrogram[1])
+    out *= 0.5
+    return out
+
+def warmStartActivations(V, W, H, WH):
+    # H: (atom, time) activations of the previous block, updated in place; WH: (freq, time) out, W H for the new H
+    H[:] = H[:, -1:]
+    H *= 1 - ACTIVATION_WARM_START_MIX
+    H += ACTIVATION_WARM_START_MIX * np.mean(H, axis=0)
+    np.maximum(H, ACTIVATION_EPSILON, out=H)
+    np.dot(W, H, out=WH)
+    frameGains = np.sum(V, axis=0) / (np.sum(WH, axis=0) + ACTIVATION_EPSILON)
+    H *= frameGains
+    WH *= frameGains
+    WH += ACTIVATION_EPSILON
+
+def updateKLActivations(V, W, H, WH, WSum, numUpdates, ratio):
+    # numUpdates multiplicative KL updates of H in place, WH is kept equal to W H + epsilon; WSum: (atom, 1)
+    for updateIndex in range(numUpdates):
+        np.divide(V, WH, out=ratio)
+        H *= np.dot(W.T, ratio)
+        H /= WSum
+        np.dot(W, H, out=WH)
+        WH += ACTIVATION_EPSILON
+    return H
+
+def computeActivationTFMask(W, HMask, H, WH):
+    # HMask: (atom, time), or (target, atom, time) for one mask per target
+    return np.matmul(W, HMask * H) / WH
+
+# Coarse-to-fine TDOA search: the GCC-NMF projection is evaluated on every coarseStride-th TDOA, then for each
+# time frame only on the fine TDOAs within coarseStride of some atom's best coarse candidates, and each atom takes
+# the best fine TDOA within its candidates' windows. Sharing the fine TDOAs between atoms keeps the refinement a GEMM;
+# its cost follows the spread of the atoms' TDOAs rather than numTDOAs.
+def getCoarseTDOAIndexes(numTDOAs, coarseStride):
+    return np.unique( np.append(np.arange(0, numTDOAs, coarseStride), numTDOAs-1) )
+
+def getParabolicPeakOffsets(leftValues, peakValues, rightValues):
+    # sub-grid peak positions in [-0.5, 0.5] from the three samples around each peak, 0 where they are not a peak
+    denominators = leftValues - 2 * peakValues + rightValues
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offsets = np.where( denominators < 0, 0.5 * (leftValues - rightValues) / denominators, 0 )
+    return np.clip( np.nan_to_num(offsets), -0.5, 0.5 ).astype(np.float32)
+
+def getInterpolatedPeakIndex(values):
+    # argmax of a 1D array refined by parabolic interpolation, nan values ignored
+    values = np.nan_to_num(values, nan=-np.inf)
+    peakIndex = int( np.argmax(values) )
+    if peakIndex == 0 or peakIndex == len(values)-1 or not np.isfinite(values[peakIndex-1:peakIndex+2]).all():
+        return float(peakIndex)
+    return peakIndex + float( getParabolicPeakOffsets(values[peakIndex-1], values[peakIndex], values[peakIndex+1]) )
+
+def computeHierarchicalAtomTDOAIndexes(steeringMatrix, coarseSteeringMatrix, coarseTDOAIndexes, coarseStride, stackedCoherence, W,
+                                       coarseScratch, coarseGCCNMF, numCandidates=1, interpolate=True):
+    # returns (atom, time) float32 TDOA indexes, like getAtomTDOAIndexes on the exhaustive gccNMF
+    # coarseScratch: (time, numCoarseTDOAs, 2 * numFreq), coarseGCCNMF: (time, numCoarseTDOAs, atom)
+    numTDOAs = steeringMatrix.shape[0]
+    numFrequencies, numAtoms = W.shape
+    numTime = stackedCoherence.shape[1]
+    
+    computeFusedGCCNMF(coarseSteeringMatrix, stackedCoherence, W, coarseScratch, out=coarseGCCNMF)
+    if numCandidates == 1:
+        candidates = coarseTDOAIndexes[ np.argmax(coarseGCCNMF, axis=1) ][:, np.newaxis]
+    else:
+        numCandidates = min(numCandidates, len(coarseTDOAIndexes))
+        candidates = coarseTDOAIndexes[ np.argpartition(-coarseGCCNMF, numCandidates-1, axis=1)[:, :numCandidates] ]
+    # candidates: (time, candidate, atom)
+    
+    windowOffsets = np.arange(-coarseStride+1, coarseStride)
+    fineIndexPositions = np.empty(numTDOAs, np.intp)
+    atomIndexes = np.arange(numAtoms)
+    atomTDOAIndexes = np.empty( (numAtoms, numTime), np.float32 )
+    for timeIndex in range(numTime):
+        atomCandidates = candidates[timeIndex]
+        neededTDOAs = np.zeros(numTDOAs, bool)
+        neededTDOAs[ np.clip(atomCandidates[..., np.newaxis] + windowOffsets, 0, numTDOAs-1) ] = True
+        fineTDOAIndexes = np.flatnonzero(neededTDOAs)
+        
+        gcc = steeringMatrix[fineTDOAIndexes] * stackedCoherence[:, timeIndex]
+        realGCC = gcc[:, :numFrequencies] + gcc[:, numFrequencies:]
+        fineGCCNMF = np.dot(realGCC, W)
+        
+        inWindow = np.any( np.abs(fineTDOAIndexes[:, np.newaxis, np.newaxis] - atomCandidates) < coarseStride, axis=1 )
+        bestPositions = np.argmax( np.where(inWindow, fineGCCNMF, -np.inf), axis=0 )
+        bestTDOAIndexes = fineTDOAIndexes[bestPositions]
+        atomTDOAIndexes[:, timeIndex] = bestTDOAIndexes
+        
+        if interpolate:
+            # neighbours are only available if some atom's window covered them
+            fineIndexPositions.fill(-1)
+            fineIndexPositions[fineTDOAIndexes] = np.arange(len(fineTDOAIndexes))
+            leftPositions = fineIndexPositions[ np.maximum(bestTDOAIndexes-1, 0) ]
+            rightPositions = fineIndexPositions[ np.minimum(bestTDOAIndexes+1, numTDOAs-1) ]
+            hasNeighbours = (leftPositions >= 0) & (rightPositions >= 0) & (bestTDOAIndexes > 0) & (bestTDOAIndexes < numTDOAs-1)
+            offsets = getParabolicPeakOffsets( fineGCCNMF[leftPositions, atomIndexes], fineGCCNMF[bestPositions, atomIndexes],
+                                               fineGCCNMF[rightPositions, atomIndexes] )
+            atomTDOAIndexes[:, timeIndex] += np.where(hasNeighbours, offsets, 0)
+    return atomTDOAIndexes
@@ -25,25 +25,27 @@ SOFTWARE.
 '''
 
 import numpy as np
-from os import makedirs
-from os.path import exists, join
+from os import makedirs, getpid, replace
+from os.path import exists, join, getmtime
 import logging
 from collections import OrderedDict
+from collections.abc import Mapping
 
-from gccNMF.realtime.gccNMFFunctions import performKLNMF
-from gccNMF.realtime.defs import DATA_DIR
-
-# PRETRAINED_W_DIR = join(DATA_DIR, 'pretrainedW')
-DATA_DIR
-PRETRAINED_W_DIR = join(DATA_DIR, '../gccNMF/realtime')
-PRETRAINED_W_PATH_TEMPLATE = join(PRETRAINED_W_DIR, 'W_%d.npy')
+from gccNMF.realtime.defs import DATA_DIR, PRETRAINED_W_DIR, PRETRAINED_W_PATH_TEMPLATE
 
 
 SPARSITY_ALPHA = 0
 NUM_PRELEARNING_ITERATIONS = 100
+# W_<size>.npy are trained from this (freq, time) corpus, streamed from disk, by gccNMF.realtime.dictionaryTraining
 CHIME_DATASET_PATH = join(DATA_DIR, 'chimeTrainSet.npy')
+ORDERED_W_FILE_NAME_TEMPLATE = 'W_%d_ordered.npy'
+DICTIONARY_TYPES = ['Pretrained', 'Random']
 
 def getDictionariesW(windowSize, dictionarySizes, ordered=False):
+    return DictionaryStore(windowSize, dictionarySizes, ordered)
+
+def loadDictionariesW(windowSize, dictionarySizes, ordered=False):
+    # eager version of DictionaryStore, every dictionary loaded and ordered up front
     fftSize = windowSize // 2 + 1
     dictionariesW = OrderedDict( [('Pretrained', OrderedDict( [(dictionarySize, loadPretrainedW(dictionarySize, retrainW = False)) for dictionarySize in dictionarySizes] )),
                                   ('Random', OrderedDict( [(dictionarySize, np.random.rand(fftSize, dictionarySize).astype('float32')) for dictionarySize in dictionarySizes] )) ])#,
@@ -68,17 +70,18 @@ def getOrderedDictionary(W):
     orderedW = np.squeeze(W[:, orderedAtomIndexes])
     return orderedW
     
-def loadPretrainedW(dictionarySize, retrainW=False):
+def loadPretrainedW(dictionarySize, retrainW=False, mmapMode=None):
     pretrainedWFilePath = PRETRAINED_W_PATH_TEMPLATE % dictionarySize
     logging.info('GCCNMFPretraining: Loading pretrained W (size %d): %s' % (dictionarySize, pretrainedWFilePath) )
     # if exists(pretrainedWFilePath) and not retrainW:
-    W = np.load(pretrainedWFilePath)
+    W = np.load(pretrainedWFilePath, mmap_mode=mmapMode)
     # else:
     #     if retrainW:
     #         logging.info('GCCNMFPretraining: Retraining W, saving as %s...' % pretrainedWFilePath)
     #     else:
     #         logging.info('GCCNMFPretraining: Pretrained W not found at %s, creating...' % pretrainedWFilePath)
     #
+    #     from gccNMF.realtime.gccNMFFunctions import performKLNMF
     #     trainV = np.load(CHIME_DATASET_PATH)
     #     W, _ = performKLNMF(trainV, dictionarySize, numIterations=100, sparsityAlpha=0, epsilon=1e-16, seedValue=0)
     #
@@ -87,4 +90,79 @@ def loadPretrainedW(dictionarySize, retrainW=False):
     #     except:
     #         pass
     #     np.save(pretrainedWFilePath, W)
-    return W
\ No newline at end of file
+    return W
+
+# Lazy dictionary store, indexed like the nested dicts of loadDictionariesW: dictionariesW[dictionaryType][dictionarySize].
+# Pretrained dictionaries are memory-mapped read-only, their spectral-centroid ordering cached in cacheDir as
+# W_<size>_ordered.npy (rebuilt when W_<size>.npy is newer). Random dictionaries are generated on first use, seeded
+# by their size. Pickling keeps only the configuration: child processes map the dictionaries they use themselves.
+class DictionaryStore(Mapping):
+    def __init__(self, windowSize, dictionarySizes, ordered=False, cacheDir=PRETRAINED_W_DIR, dictionaryTypes=DICTIONARY_TYPES):
+        self.windowSize = windowSize
+        self.dictionarySizes = list(dictionarySizes)
+        self.ordered = ordered
+        self.cacheDir = cacheDir
+        self.dictionaryTypes = list(dictionaryTypes)
+        self.dictionaries = {}
+    
+    def __getitem__(self, dictionaryType):
+        if dictionaryType not in self.dictionaryTypes:
+            raise KeyError(dictionaryType)
+        return DictionarySizes(self, dictionaryType)
+    
+    def __iter__(self):
+        return iter(self.dictionaryTypes)
+    
+    def __len__(self):
+        return len(self.dictionaryTypes)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['dictionaries'] = {}
+        return state
+    
+    def getDictionary(self, dictionaryType, dictionarySize):
+        key = (dictionaryType, dictionarySize)
+        if key not in self.dictionaries:
+            if dictionaryType == 'Pretrained':
+                W = self.loadOrderedPretrainedW(dictionarySize) if self.ordered else loadPretrainedW(dictionarySize, mmapMode='r')
+            else:
+                fftSize = self.windowSize // 2 + 1
+                W = np.random.RandomState(dictionarySize).rand(fftSize, dictionarySize).astype('float32')
+                W = getOrderedDictionary(W) if self.ordered else W
+            self.dictionaries[key] = W
+        return self.dictionaries[key]
+    
+    def loadOrderedPretrainedW(self, dictionarySize):
+        pretrainedWFilePath = PRETRAINED_W_PATH_TEMPLATE % dictionarySize
+        orderedWFilePath = join(self.cacheDir, ORDERED_W_FILE_NAME_TEMPLATE % dictionarySize)
+        if exists(orderedWFilePath) and getmtime(orderedWFilePath) >= getmtime(pretrainedWFilePath):
+            return np.load(orderedWFilePath, mmap_mode='r')
+        
+        orderedW = getOrderedDictionary( loadPretrainedW(dictionarySize, mmapMode='r') )
+        try:
+            # written under a temporary name first, so concurrent processes never map a partial file
+            temporaryFilePath = '%s.%d.npy' % (orderedWFilePath[:-4], getpid())
+            np.save(temporaryFilePath, orderedW)
+            replace(temporaryFilePath, orderedWFilePath)
+            logging.info('GCCNMFPretraining: cached ordered W (size %d): %s' % (dictionarySize, orderedWFilePath))
+        except (IOError, OSError) as error:
+            logging.info('GCCNMFPretraining: could not cache ordered W in %s: %s' % (self.cacheDir, error))
+            return orderedW
+        return np.load(orderedWFilePath, mmap_mode='r')
+
+class DictionarySizes(Mapping):
+    def __init__(self, dictionaryStore, dictionaryType):
+        self.dictionaryStore = dictionaryStore
+        self.dictionaryType = dictionaryType
+    
+    def __getitem__(self, dictionarySize):
+        if dictionarySize not in self.dictionaryStore.dictionarySizes:
+            raise KeyError(dictionarySize)
+        return self.dictionaryStore.getDictionary(self.dictionaryType, dictionarySize)
+    
+    def __iter__(self):
+        return iter(self.dictionaryStore.dictionarySizes)
+    
+    def __len__(self):
+        return len(self.dictionaryStore.dictionarySizes)
@@ -24,43 +24,96 @@ SOFTWARE.
 @author: Sean UN Wood
 '''
 
+import copy
 import logging
-from time import sleep
+import threading
 import numpy as np
 from numpy.fft import rfft
+from time import perf_counter
 from multiprocessing import Process
+from collections import OrderedDict
 
-from gccNMF.realtime.defs import SPEED_OF_SOUND_IN_METRES_PER_SECOND
+from gccNMF.realtime.defs import TARGET_MODE_BOXCAR, TARGET_MODE_MULTIPLE, TARGET_MODE_WINDOW_FUNCTION, \
+    COMPUTE_BACKEND_FUSED, COMPUTE_BACKEND_NUMPY, COMPUTE_BACKEND_THEANO, COMPUTE_BACKENDS, TDOA_SEARCH_EXHAUSTIVE, TDOA_SEARCH_HIERARCHICAL, TDOA_SEARCHES
+from gccNMF.realtime.precomputationCache import PrecomputationCache
+from gccNMF.realtime.utils import ActivityDetector
+from gccNMF.realtime.dictionaryAdaptation import getDictionaryKey
+from gccNMF.realtime.gccNMFKernels import computeCoherence, computeStackedCoherence, computeFusedGCCPHAT, computeFusedGCCNMF, computeRealGCC, computeGCCNMF, \
+    getAtomTDOAIndexes, computeHMask, computeTFMask, computeMultiTargetHMasks, computeMultiTargetTFMasks, getCoarseTDOAIndexes, \
+    computeHierarchicalAtomTDOAIndexes, getInterpolatedPeakIndex, computeMixtureMagnitude, warmStartActivations, updateKLActivations, \
+    computeActivationTFMask, ACTIVATION_EPSILON
 
-TARGET_MODE_BOXCAR = 0
-TARGET_MODE_MULTIPLE = 1
-TARGET_MODE_WINDOW_FUNCTION = 2
+PARAMETER_POLL_INTERVAL_SECONDS = 0.01
+# parameters that only take effect through GCCNMFProcessor.reset()
+PARAMETERS_REQUIRING_RESET = ['microphoneSeparationInMetres', 'numTDOAs', 'numSources', 'targetMode',
+                              'dictionarySize', 'dictionaryType', 'gccPHATNLEnabled', 'computeBackend', 'tdoaSearch', 'tdoaCoarseStride', 'tdoaNumCandidates',
+                              'gatingEnabled', 'gatingOnThresholdInDB', 'gatingOffThresholdInDB', 'gatingHangoverBlocks', 'gatingAttenuationInDB']
+# runtime state carried over when a reconfigured processor is swapped in
+RUNTIME_PARAMETERS = ['separationEnabled', 'localizationEnabled', 'localizationWindowSize', 'targetTDOAIndex', 'targetTDOAEpsilon',
+                      'targetTDOABeta', 'targetTDOANoiseFloor', 'targetTDOAIndexes', 'numHUpdates']
+# time constant with which the held mask of gated blocks decays towards the gating attenuation
+GATING_RELEASE_SECONDS = 0.25
+# realtime-tunable parameters in the shared parameter block written by the UI (see SharedMemoryParameterBlock)
+TDOA_PARAMETERS = ['targetTDOAIndex', 'targetTDOAEpsilon', 'targetTDOABeta', 'targetTDOANoiseFloor', 'localizationEnabled', 'localizationWindowSize']
 
 class GCCNMFProcess(Process):  # OladProcessor
     def __init__(self, oladProcessor, sampleRate, windowSize, numTimePerChunk, dictionariesW, dictionaryType, dictionarySize, numHUpdates, microphoneSeparationInMetres, localizationEnabled, localizationWindowSize,
                  gccPHATHistory, tdoaHistory, inputSpectrogramHistory, outputSpectrogramHistory, coefficientMaskHistories, 
                  tdoaParametersQueue, tdoaParametersAck, togglePlayQueue, togglePlayAck, #toggleSeparationQueue, toggleSeparationAck,
-                 processFramesEvent, processFramesDoneEvent, terminateEvent):
+                 inputRing, outputRing, terminateEvent, computeBackend=COMPUTE_BACKEND_FUSED, precomputationCache=None, stats=None,
+                 tdoaSearch=TDOA_SEARCH_EXHAUSTIVE, tdoaCoarseStride=4, tdoaNumCandidates=1, gatingEnabled=False, gatingOnThresholdInDB=9.0,
+                 gatingOffThresholdInDB=4.0, gatingHangoverBlocks=8, gatingAttenuationInDB=-20.0, hotReconfigurationEnabled=True, tdoaParameterBlock=None,
+                 adaptationRing=None, dictionarySlot=None):
         super(GCCNMFProcess, self).__init__()
 
         # logging.info("GCCNMFProcessor(Process)")
         self.oladProcessor = oladProcessor
         self.gccNMFProcessor = GCCNMFProcessor(sampleRate, windowSize, numTimePerChunk, dictionariesW, dictionaryType, dictionarySize, numHUpdates, microphoneSeparationInMetres,
-                                               localizationEnabled, localizationWindowSize, gccPHATHistory, tdoaHistory, inputSpectrogramHistory, outputSpectrogramHistory, coefficientMaskHistories)
+                                               localizationEnabled, localizationWindowSize, gccPHATHistory, tdoaHistory, inputSpectrogramHistory, outputSpectrogramHistory, coefficientMaskHistories,
+                                               computeBackend, precomputationCache, tdoaSearch, tdoaCoarseStride, tdoaNumCandidates, gatingEnabled,
+                                               gatingOnThresholdInDB, gatingOffThresholdInDB, gatingHangoverBlocks, gatingAttenuationInDB)
         
         self.tdoaParametersQueue = tdoaParametersQueue
         self.tdoaParametersAck = tdoaParametersAck
         self.togglePlayQueue = togglePlayQueue
         self.togglePlayAck = togglePlayAck
+        # polled once per block, the queue is kept for targetTDOAIndexes
+        self.tdoaParameterBlock = tdoaParameterBlock
+        self.tdoaParameterVersion = 0
+        # dictionary adaptation (see DictionaryAdaptationProcess): magnitudes of active blocks out, adapted dictionaries in
+        self.adaptationRing = adaptationRing
+        self.dictionarySlot = dictionarySlot
+        self.dictionaryVersion = 0
+        # the adaptation process learns from the dictionary the pipeline started with, it is paused (no magnitudes
+        # pushed) while another dictionary type or size is configured, and resumes when it is configured again
+        self.adaptationDictionary = (dictionaryType, dictionarySize)
+        self.adaptationPaused = False
         # self.toggleSeparationQueue = toggleSeparationQueue
         # self.toggleSeparationAck = toggleSeparationAck
-        ####
-        processFramesEvent.clear()
-        ####
-        self.processFramesEvent = processFramesEvent
-        self.processFramesDoneEvent = processFramesDoneEvent
+        self.inputRing = inputRing
+        self.outputRing = outputRing
+        self.droppedOutputBlock = np.zeros(outputRing.blockSize, np.float32)
+        self.stats = stats
         self.terminateEvent = terminateEvent
         
+        # hot reconfiguration: a builder thread resets a copy of the processor with the new parameters while blocks
+        # keep being processed with the current one, the worker loop swaps it in between two blocks
+        self.hotReconfigurationEnabled = hotReconfigurationEnabled
+        self.reconfigurationLock = threading.Lock()
+        self.pendingParameters = {}
+        self.reconfiguredProcessor = None
+        self.builderThread = None
+    
+    def __getstate__(self):
+        # the lock is recreated in the worker process
+        state = self.__dict__.copy()
+        del state['reconfigurationLock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reconfigurationLock = threading.Lock()
+        
     def run(self):
         ######
         # os.nice(-20)
@@ -69,49 +122,80 @@ class GCCNMFProcess(Process):  # OladProcessor
             if self.terminateEvent.is_set():
                 logging.info('GCCNMFProcessor: received terminate')
                 return
-            
-            wait = True
-            
-            if not self.tdoaParametersQueue.empty():
-                logging.debug('GCCNMFProcessor: received tdoaParams')
-                self.processTDOAParametersQueue()
-                logging.debug('AudioStreamProcessor: processed tdoaParams')
-                self.tdoaParametersAck.set()
-                logging.debug('AudioStreamProcessor: ack set')
-                wait = False
-            
-            if not self.togglePlayQueue.empty():
-                logging.debug('GCCNMFProcessor: received togglePlayParams')
-                self.processTogglePlayQueue()
-                logging.debug('GCCNMFProcessor: processed togglePlayParams')
-                self.togglePlayAck.set()
-                logging.debug('GCCNMFProcessor: ack set')
-                wait = False
+            self.step()
+    
+    def step(self, timeout=PARAMETER_POLL_INTERVAL_SECONDS):
+        # one iteration of the worker loop: parameter queues, processor swap, then at most one block
+        if not self.tdoaParametersQueue.empty():
+            logging.debug('GCCNMFProcessor: received tdoaParams')
+            self.processTDOAParametersQueue()
+            logging.debug('AudioStreamProcessor: processed tdoaParams')
+            self.tdoaParametersAck.set()
+            logging.debug('AudioStreamProcessor: ack set')
+        
+        if not self.togglePlayQueue.empty():
+            logging.debug('GCCNMFProcessor: received togglePlayParams')
+            self.processTogglePlayQueue()
+            logging.debug('GCCNMFProcessor: processed togglePlayParams')
+            self.togglePlayAck.set()
+            logging.debug('GCCNMFProcessor: ack set')
 
-            # if not self.toggleSeparationQueue.empty():
-            #     logging.debug('GCCNMFProcessor: received toggleSeparationParams')
-            #     self.processToggleSeparationQueue()
-            #     logging.debug('GCCNMFProcessor: processed toggleSeparationParams')
-            #     self.toggleSeparationAck.set()
-            #     logging.debug('GCCNMFProcessor: ack set')
-            #     wait = False
-            if self.processFramesEvent.is_set():
-                self.processFramesEvent.clear()
-                #logging.info('GCCNMFProcessor: received processFramesEvent')
-                self.oladProcessor.processFrames(self.gccNMFProcessor.processFrames)
-                #logging.info('GCCNMFProcessor: setting processFramesDoneEvent')
-                self.processFramesDoneEvent.set()
-                #logging.info('GCCNMFProcessor: set processFramesDoneEvent')
-                wait = False
-            
-            if wait:
-                sleep(0.001)
+        # if not self.toggleSeparationQueue.empty():
+        #     logging.debug('GCCNMFProcessor: received toggleSeparationParams')
+        #     self.processToggleSeparationQueue()
+        #     logging.debug('GCCNMFProcessor: processed toggleSeparationParams')
+        #     self.toggleSeparationAck.set()
+        #     logging.debug('GCCNMFProcessor: ack set')
+
+        if self.reconfiguredProcessor is not None:
+            self.swapReconfiguredProcessor()
+        if self.dictionarySlot:
+            self.processDictionarySlot()
+
+        # sleeps until the audio callback pushes a block, waking periodically to service the parameter queues
+        if self.inputRing.wait(timeout):
+            self.processBlock()
+
+    def processBlock(self):
+        startTime = perf_counter()
+        if self.tdoaParameterBlock:
+            self.processTDOAParameterBlock()
+        inputLag = self.inputRing.numAvailable()
+        outputSamples = self.outputRing.writeSlot() if self.outputRing.numFree() > 0 else self.droppedOutputBlock
+        self.oladProcessor.processFrames(self.gccNMFProcessor.processFrames, self.inputRing.readSlot(), outputSamples)
+        self.inputRing.commitRead()
+        if outputSamples is not self.droppedOutputBlock:
+            self.outputRing.commitWrite()
+        else:
+            logging.debug('GCCNMFProcessor: output ring full, dropping block')
+        if self.adaptationRing:
+            self.pushMixtureMagnitude()
+        
+        if self.stats:
+            stats = self.stats
+            stats.beginUpdate()
+            stats.increment('numBlocks')
+            if outputSamples is self.droppedOutputBlock:
+                stats.increment('droppedOutputBlocks')
+            stats.setCounter('inputLag', inputLag)
+            stats.setMaxCounter('maxInputLag', inputLag)
+            stats.setCounter('tdoaParameterVersion', self.tdoaParameterVersion)
+            if self.gccNMFProcessor.activityDetector:
+                stats.setCounter('gatedBlocks', self.gccNMFProcessor.activityDetector.numGatedBlocks)
+            stats.record('processingTime', (perf_counter() - startTime) * 1e6)
+            stats.endUpdate()
 
     # 인터페이스 슬라이딩 바에서 입력된 TDOA값을 가져온다.
     def processTDOAParametersQueue(self):
         parameters = self.tdoaParametersQueue.get()
         if 'targetTDOAIndexes' in parameters:
             targetTDOAIndexes = parameters['targetTDOAIndexes']
+            # the output ring is sized for the overlap-add output channels, further targets would not fit in TARGET_MODE_MULTIPLE
+            maxNumTargets = self.oladProcessor.numOutputChannels // self.oladProcessor.numChannels
+            if len(targetTDOAIndexes) > maxNumTargets:
+                logging.error( 'GCCNMFProcessor: %d targetTDOAIndexes requested, the device output has room for %d target(s) (%d channels), keeping %s' %
+                               (len(targetTDOAIndexes), maxNumTargets, self.oladProcessor.numOutputChannels, str(targetTDOAIndexes[:maxNumTargets])) )
+                targetTDOAIndexes = targetTDOAIndexes[:maxNumTargets]
             logging.info( 'GCCNMFProcessor: setting targetTDOAIndexes: %s' % str(targetTDOAIndexes) )
             self.gccNMFProcessor.setTargetTDOAIndexes(targetTDOAIndexes)
         elif 'localizationEnabled' in parameters:
@@ -130,37 +214,125 @@ class GCCNMFProcess(Process):  # OladProcessor
                           (targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor)) 
             self.gccNMFProcessor.setTargetTDOARange(targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor)
              
+    # applies the latest parameters written by the UI since the last block, intermediate versions are skipped
+    def processTDOAParameterBlock(self):
+        self.tdoaParameterVersion, parameters = self.tdoaParameterBlock.readIfChanged(self.tdoaParameterVersion)
+        if parameters is None:
+            return
+        logging.debug( 'GCCNMFProcessor: applying tdoa parameters version %d: %s' % (self.tdoaParameterVersion, str(dict(parameters))) )
+        self.gccNMFProcessor.setTargetTDOARange(parameters['targetTDOAIndex'], parameters['targetTDOAEpsilon'],
+                                                parameters['targetTDOABeta'], parameters['targetTDOANoiseFloor'])
+        self.gccNMFProcessor.localizationEnabled = bool(parameters['localizationEnabled'])
+        self.gccNMFProcessor.localizationWindowSize = int(parameters['localizationWindowSize'])
+    
+    def pushMixtureMagnitude(self):
+        # never waits on the adaptation process, blocks are dropped while its ring is full
+        processor = self.gccNMFProcessor
+        adaptationPaused = (processor.dictionaryType, processor.dictionarySize) != self.adaptationDictionary
+        if adaptationPaused != self.adaptationPaused:
+            self.adaptationPaused = adaptationPaused
+            logging.info( 'GCCNMFProcessor: dictionary adaptation %s (adapting %s dictionary of size %d, using %s dictionary of size %d)' %
+                          ( ('paused' if adaptationPaused else 'resumed',) + self.adaptationDictionary + (processor.dictionaryType, processor.dictionarySize) ) )
+        if not adaptationPaused and processor.blockActive and self.adaptationRing.numFree() > 0:
+            computeMixtureMagnitude(processor.complexMixtureSpectrogram, out=self.adaptationRing.writeSlot().reshape(processor.numFrequencies, -1))
+            self.adaptationRing.commitWrite()
+    
+    def processDictionarySlot(self):
+        self.dictionaryVersion, dictionary = self.dictionarySlot.readIfChanged(self.dictionaryVersion)
+        if dictionary is None or not self.gccNMFProcessor.setAdaptedDictionary(dictionary['W'], dictionary['recV'], dictionary['dictionaryKey']):
+            return
+        logging.info('GCCNMFProcessor: swapped in adapted dictionary version %d' % self.dictionaryVersion)
+        if self.stats:
+            self.stats.beginUpdate()
+            self.stats.increment('dictionaryUpdates')
+            self.stats.endUpdate()
+    
     def processTogglePlayQueue(self):
-        from theano.compile.sharedvalue import SharedVariable
-        
         parameters = self.togglePlayQueue.get()
-        parametersRequiringReset = ['microphoneSeparationInMetres', 'numTDOAs', 'numSources', 'targetMode',
-                                    'dictionarySize', 'dictionaryType', 'gccPHATNLEnabled']
 
-        resetGCCNMFProcessor = False
+        # parameters requiring a reset are applied to a reconfigured copy of the processor, the others immediately
+        resetParameters = {}
         for parameterName, parameterValue in parameters.items():
-            if not hasattr(self.gccNMFProcessor, parameterName):
+            unchanged = hasattr(self.gccNMFProcessor, parameterName) and getattr(self.gccNMFProcessor, parameterName) == parameterValue
+            if unchanged:
+                logging.info('GCCNMFProcessor: %s unchanged: %s' % (parameterName, parameterValue))
+            else:
                 logging.info('GCCNMFProcessor: setting %s: %s' % (parameterName, parameterValue))
-                setattr(self.gccNMFProcessor, parameterName, parameterValue)
-                resetGCCNMFProcessor |= parameterName in parametersRequiringReset
+            if parameterName in PARAMETERS_REQUIRING_RESET:
+                # an unchanged value still overrides a different one from a reconfiguration in progress
+                if not unchanged or self.isReconfiguring() or self.gccNMFProcessor.resetTimings is None:
+                    resetParameters[parameterName] = parameterValue
             else:
-                currentParam = getattr(self.gccNMFProcessor, parameterName)
-                if issubclass(type(currentParam), SharedVariable):
-                    if currentParam.get_value() != parameterValue:
-                        logging.info('GCCNMFProcessor: setting %s: %s (shared)' % (parameterName, parameterValue))
-                        currentParam.set_value(parameterValue)
-                    else:
-                        logging.info('GCCNMFProcessor: %s unchanged: %s (shared)' % (parameterName, parameterValue))
-                else:
-                    if currentParam != parameterValue:
-                        logging.info('GCCNMFProcessor: setting %s: %s' % (parameterName, parameterValue))
-                        setattr(self.gccNMFProcessor, parameterName, parameterValue)
-                    else:
-                        logging.info('GCCNMFProcessor: %s unchanged: %s' % (parameterName, parameterValue))
-                resetGCCNMFProcessor |= parameterName in parametersRequiringReset
+                setattr(self.gccNMFProcessor, parameterName, parameterValue)
 
-        if resetGCCNMFProcessor:
+        if resetParameters:
+            self.reconfigure(resetParameters)
+    
+    def reconfigure(self, parameters):
+        if not self.hotReconfigurationEnabled or self.gccNMFProcessor.resetTimings is None:
+            # nothing is playing through a processor that was never reset, so the first reset is synchronous
+            for parameterName, parameterValue in parameters.items():
+                setattr(self.gccNMFProcessor, parameterName, parameterValue)
             self.gccNMFProcessor.reset()
+            self.publishResetTimings()
+            # reset() reloads the stored dictionary, the latest adapted one is applied again before the next block
+            self.dictionaryVersion = 0
+            return
+        
+        with self.reconfigurationLock:
+            self.pendingParameters.update(parameters)
+            if self.builderThread is None:
+                self.builderThread = threading.Thread(target=self.buildReconfiguredProcessors, name='GCCNMFReconfiguration')
+                self.builderThread.daemon = True
+                self.builderThread.start()
+    
+    def isReconfiguring(self):
+        return self.builderThread is not None or self.reconfiguredProcessor is not None
+    
+    def buildReconfiguredProcessors(self):
+        # builds until no parameters are pending, each build starting from the latest configuration;
+        # parameters that fail to build are dropped and the current processor is kept
+        try:
+            while True:
+                with self.reconfigurationLock:
+                    parameters, self.pendingParameters = self.pendingParameters, {}
+                    if not parameters:
+                        self.builderThread = None
+                        return
+                    baseProcessor = self.gccNMFProcessor if self.reconfiguredProcessor is None else self.reconfiguredProcessor
+                try:
+                    reconfiguredProcessor = baseProcessor.copyWithParameters(parameters)
+                    reconfiguredProcessor.reset()
+                except Exception:
+                    logging.exception('GCCNMFProcessor: reconfiguration failed, dropping parameters: %s' % str(parameters))
+                    continue
+                with self.reconfigurationLock:
+                    self.reconfiguredProcessor = reconfiguredProcessor
+        finally:
+            # a later reconfiguration can always start a new builder, even if this one died
+            with self.reconfigurationLock:
+                if self.builderThread is threading.current_thread():
+                    self.builderThread = None
+    
+    def swapReconfiguredProcessor(self):
+        with self.reconfigurationLock:
+            reconfiguredProcessor, self.reconfiguredProcessor = self.reconfiguredProcessor, None
+        reconfiguredProcessor.copyRuntimeParameters(self.gccNMFProcessor)
+        self.gccNMFProcessor = reconfiguredProcessor
+        self.dictionaryVersion = 0
+        logging.info('GCCNMFProcessor: swapped in reconfigured processor')
+        self.publishResetTimings()
+        if self.stats:
+            self.stats.beginUpdate()
+            self.stats.increment('reconfigurations')
+            self.stats.endUpdate()
+    
+    def publishResetTimings(self):
+        if self.stats:
+            self.stats.beginUpdate()
+            for timingName, timingInSeconds in self.gccNMFProcessor.resetTimings.items():
+                self.stats.setCounter(timingName, timingInSeconds * 1e6)
+            self.stats.endUpdate()
     
     # def processToggleSeparationQueue(self):
     #     parameters = self.toggleSeparationQueue.get()
@@ -172,7 +344,9 @@ class GCCNMFProcess(Process):  # OladProcessor
     #
 class GCCNMFProcessor(object):
     def __init__(self, sampleRate, windowSize, numTimePerChunk, dictionariesW, dictionaryType, dictionarySize, numHUpdates, microphoneSeparationInMetres,
-                 localizationEnabled, localizationWindowSize, gccPHATHistory=None, tdoaHistory=None, inputSpectrogramHistory=None, outputSpectrogramHistory=None, coefficientMaskHistories=None):
+                 localizationEnabled, localizationWindowSize, gccPHATHistory=None, tdoaHistory=None, inputSpectrogramHistory=None, outputSpectrogramHistory=None, coefficientMaskHistories=None,
+                 computeBackend=COMPUTE_BACKEND_FUSED, precomputationCache=None, tdoaSearch=TDOA_SEARCH_EXHAUSTIVE, tdoaCoarseStride=4, tdoaNumCandidates=1,
+                 gatingEnabled=False, gatingOnThresholdInDB=9.0, gatingOffThresholdInDB=4.0, gatingHangoverBlocks=8, gatingAttenuationInDB=-20.0):
         super(GCCNMFProcessor, self).__init__()
         # logging.info("GCCNMFProcessor (object)")
         self.sampleRate = sampleRate
@@ -181,7 +355,21 @@ class GCCNMFProcessor(object):
         self.dictionariesW = dictionariesW
         self.dictionaryType = dictionaryType
         self.dictionarySize = dictionarySize
+        # KL updates of the activations per block, 0: unit activations, the masks only come from the GCC-NMF projection
+        self.numHUpdates = numHUpdates
         self.microphoneSeparationInMetres = microphoneSeparationInMetres
+        self.computeBackend = computeBackend
+        self.tdoaSearch = tdoaSearch
+        self.tdoaCoarseStride = tdoaCoarseStride
+        self.tdoaNumCandidates = tdoaNumCandidates
+        # energy gating: blocks the ActivityDetector finds silent or stationary skip GCC-PHAT and GCC-NMF
+        self.gatingEnabled = gatingEnabled
+        self.gatingOnThresholdInDB = gatingOnThresholdInDB
+        self.gatingOffThresholdInDB = gatingOffThresholdInDB
+        self.gatingHangoverBlocks = gatingHangoverBlocks
+        self.gatingAttenuationInDB = gatingAttenuationInDB
+        self.activityDetector = None
+        self.precomputationCache = PrecomputationCache() if precomputationCache is None else precomputationCache
         
         self.gccPHATHistory = gccPHATHistory
         self.tdoaHistory = tdoaHistory
@@ -199,29 +387,43 @@ class GCCNMFProcessor(object):
         # self.targetMode = TARGET_MODE_WINDOW_FUNCTION
         self.targetMode = TARGET_MODE_BOXCAR
         
-        from theano import shared
-        self.targetTDOAIndex = shared( np.float32(10.0) )
-        self.targetTDOAEpsilon = shared( np.float32(2.0) )
-        self.targetTDOABeta = shared( np.float32(1.0) )
-        self.targetTDOANoiseFloor = shared( np.float32(0.0) )
+        self.targetTDOAIndex = np.float32(10.0)
+        self.targetTDOAEpsilon = np.float32(2.0)
+        self.targetTDOABeta = np.float32(1.0)
+        self.targetTDOANoiseFloor = np.float32(0.0)
+        # TARGET_MODE_MULTIPLE: one stereo output stream per target TDOA, from a single GCC-NMF projection
+        self.targetTDOAIndexes = np.array([self.targetTDOAIndex], np.float32)
 
-        self.computedTDOAIndex = shared( np.float32(10.0) )
+        self.computedTDOAIndex = np.float32(10.0)
+        self.blockActive = True
+        self.resetTimings = None
         
     def processFrames(self, windowedSamples):
         # logging.info(windowedSamples)  #  값 넘어옴
         self.complexMixtureSpectrogram[:] = rfft(windowedSamples * self.windowFunction, axis=1).astype(np.complex64)
         # self.complexMixtureSpectrogram[:] = rfft(windowedSamples, axis=1).astype(np.complex64)
         # self.complexMixtureSpectrogram[:] = rfft(windowedSamples * self.synthesisWindowFunction, axis=1).astype(np.complex64)
-        self.spectrogram.set_value(self.complexMixtureSpectrogram)
-        # logging.info(self.complexMixtureSpectrogram)
-        #self.spectrogram.set_value( rfft(windowedSamples * self.windowFunction, axis=1).astype(np.complex64) )
-        realGCC = self.getComplexGCC()[0].real  # 값 넘어옴
+        active = self.blockActive = self.activityDetector.update(self.complexMixtureSpectrogram) if self.activityDetector else True
+        # gated blocks keep the histories advancing: a flat GCC-PHAT, and the last masks decaying towards the attenuation
+        gccPHAT = self.gccPHAT = self.computeGCC() if active else self.gatedGCCPHAT
         if self.separationEnabled:
-            [inputMask, coefficientMask] = self.getTFMask(realGCC)
-            outputSpectrogram = inputMask * self.complexMixtureSpectrogram
+            if active:
+                [inputMask, coefficientMask] = self.computeTFMask()
+                if self.activityDetector:
+                    self.holdMasks(inputMask, coefficientMask)
+            else:
+                [inputMask, coefficientMask] = self.getGatedMasks()
+            if self.targetMode == TARGET_MODE_MULTIPLE:
+                # (target * channel, freq, time): the channels of each target's stream are adjacent
+                outputSpectrogram = (inputMask[:, np.newaxis] * self.complexMixtureSpectrogram).reshape(-1, self.numFrequencies, self.numTimePerChunk)
+                coefficientMask = coefficientMask[0]
+            else:
+                outputSpectrogram = inputMask * self.complexMixtureSpectrogram
             
             if self.coefficientMaskHistories:
                 self.coefficientMaskHistories[self.dictionarySize].set(1-coefficientMask)
+        elif self.targetMode == TARGET_MODE_MULTIPLE:
+            outputSpectrogram = np.tile(self.complexMixtureSpectrogram, (len(self.targetTDOAIndexes), 1, 1))
         else:
             outputSpectrogram = self.complexMixtureSpectrogram.copy()
 
@@ -229,16 +431,20 @@ class GCCNMFProcessor(object):
         if self.inputSpectrogramHistory:
             self.inputSpectrogramHistory.set( -np.mean(np.abs(self.complexMixtureSpectrogram), axis=0) ** (1/3.0) )
         if self.gccPHATHistory:
-            self.gccPHATHistory.set( np.nanmean(realGCC, axis=0).T )  # 제대로 된 값 생김 근데 value 변수만 갱신하고 array(공유변수)는 갱신 안되는듯?
+            self.gccPHATHistory.set(gccPHAT)
 
         if self.tdoaHistory:  # 여기서 tdoaIndex 유추(지연시간)
-            if self.localizationEnabled:
+            if self.localizationEnabled and active:
                 gccPHATHistory = self.gccPHATHistory.getUnraveledArray()
-                tdoaIndex = np.argmax( np.nanmean(gccPHATHistory[:, -self.localizationWindowSize:], axis=-1) )
-                # tdoaIndex = (self.targetTDOAIndex.get_value() + 1) % self.numTDOAs
+                meanGCCPHAT = np.nanmean(gccPHATHistory[:, -self.localizationWindowSize:], axis=-1)
+                if self.tdoaSearch == TDOA_SEARCH_HIERARCHICAL:
+                    tdoaIndex = getInterpolatedPeakIndex(meanGCCPHAT)
+                else:
+                    tdoaIndex = np.argmax(meanGCCPHAT)
+                # tdoaIndex = (self.targetTDOAIndex + 1) % self.numTDOAs
                 # tdoaIndex = np.random.randint(0, self.numTDOAs+1)
-                self.targetTDOAIndex.set_value(tdoaIndex)
-            self.tdoaHistory.set( np.array( [[self.targetTDOAIndex.get_value()]] ) )
+                self.targetTDOAIndex = np.float32(tdoaIndex)
+            self.tdoaHistory.set( np.array( [[self.targetTDOAIndex]] ) )
         if self.outputSpectrogramHistory:
             # logging.info(type(self.outputSpectrogramHistory))
             self.outputSpectrogramHistory.set( -np.nanmean(np.abs(outputSpectrogram), axis=0) ** (1/3.0) )
@@ -247,58 +453,224 @@ class GCCNMFProcessor(object):
         
     def reset(self):
         logging.info('GCCNMFProcessor: resetting...')
-        self.buildTheanoFunctions()
+        startTime = perf_counter()
+        
+        self.W = self.dictionariesW[self.dictionaryType][self.dictionarySize]  # 제대로 세팅 여기서 dictionary setting 됨
+        self.numFrequencies, self.numAtom = self.W.shape
+        logging.info( 'Dictionary shape: %s' % str(self.W.shape))
+        dictionaryLoadTime = perf_counter()
+        precomputation = self.precomputationCache.get(self.sampleRate, self.windowSize, self.numTDOAs, self.microphoneSeparationInMetres,
+                                                      self.dictionaryType, self.dictionarySize, self.W)
+        precomputationTime = perf_counter()
+        self.frequenciesInHz = precomputation.frequenciesInHz
+        self.hypothesisTDOAs = precomputation.hypothesisTDOAs
+        self.expJOmegaTau = precomputation.expJOmegaTau
+        self.steeringMatrix = precomputation.steeringMatrix
+        self.recV = precomputation.recV
+        
+        self.complexMixtureSpectrogram = np.zeros( (2, self.numFrequencies, self.numTimePerChunk), 'complex64' )  # 초기화
+        self.resetGating()
+        self.resetActivations()
+        
+        logging.info('GCCNMFProcessor: using %s compute backend' % self.computeBackend)
+        if self.computeBackend == COMPUTE_BACKEND_THEANO:
+            if self.targetMode == TARGET_MODE_MULTIPLE:
+                raise ValueError('GCCNMFProcessor: TARGET_MODE_MULTIPLE requires the %s or %s compute backend' % (COMPUTE_BACKEND_FUSED, COMPUTE_BACKEND_NUMPY))
+            self.buildTheanoFunctions()
+            self.computeGCC = self.computeTheanoGCC
+            self.computeTFMask = self.computeTheanoTFMask
+            if self.numHUpdates > 0:
+                logging.info('GCCNMFProcessor: activation updates need the %s or %s backend, using unit activations' % (COMPUTE_BACKEND_FUSED, COMPUTE_BACKEND_NUMPY))
+        elif self.computeBackend == COMPUTE_BACKEND_FUSED:
+            self.stackedCoherence = np.zeros( (2 * self.numFrequencies, self.numTimePerChunk), np.float32 )
+            self.gccScratch = np.zeros( (self.numTimePerChunk, self.numTDOAs, 2 * self.numFrequencies), np.float32 )
+            self.gccNMF = np.zeros( (self.numTimePerChunk, self.numTDOAs, self.numAtom), np.float32 )
+            self.computeGCC = self.computeFusedGCC
+            self.computeTFMask = self.computeFusedTFMask
+            if self.tdoaSearch == TDOA_SEARCH_HIERARCHICAL and self.targetMode != TARGET_MODE_MULTIPLE:
+                self.coarseTDOAIndexes = getCoarseTDOAIndexes(self.numTDOAs, self.tdoaCoarseStride)
+                self.coarseSteeringMatrix = np.ascontiguousarray(self.steeringMatrix[self.coarseTDOAIndexes])
+                self.coarseGCCScratch = np.zeros( (self.numTimePerChunk, len(self.coarseTDOAIndexes), 2 * self.numFrequencies), np.float32 )
+                self.coarseGCCNMF = np.zeros( (self.numTimePerChunk, len(self.coarseTDOAIndexes), self.numAtom), np.float32 )
+                self.computeTFMask = self.computeHierarchicalTFMask
+                logging.info( 'GCCNMFProcessor: hierarchical TDOA search over %d coarse TDOAs' % len(self.coarseTDOAIndexes) )
+        elif self.computeBackend == COMPUTE_BACKEND_NUMPY:
+            self.computeGCC = self.computeNumpyGCC
+            self.computeTFMask = self.computeNumpyTFMask
+        else:
+            raise ValueError('GCCNMFProcessor: unknown computeBackend %s, expected one of %s' % (self.computeBackend, COMPUTE_BACKENDS))
+        if self.tdoaSearch not in TDOA_SEARCHES:
+            raise ValueError('GCCNMFProcessor: unknown tdoaSearch %s, expected one of %s' % (self.tdoaSearch, TDOA_SEARCHES))
+        if self.tdoaSearch == TDOA_SEARCH_HIERARCHICAL and self.computeTFMask != self.computeHierarchicalTFMask:
+            logging.info('GCCNMFProcessor: hierarchical TDOA search needs the %s backend and a single target, searching exhaustively' % COMPUTE_BACKEND_FUSED)
 
+        # graph build: the Theano compilation, or the Fused/NumPy buffer setup
+        self.resetTimings = OrderedDict( [('dictionaryLoadTime', dictionaryLoadTime - startTime), ('precomputationTime', precomputationTime - dictionaryLoadTime),
+                                          ('graphBuildTime', perf_counter() - precomputationTime)] )
         logging.info('GCCNMFProcessor: done reset.')
     
+    def copyWithParameters(self, parameters):
+        # shares the dictionaries, precomputation cache and history buffers; reset() then gives the copy its own state
+        processor = copy.copy(self)
+        for parameterName, parameterValue in parameters.items():
+            setattr(processor, parameterName, parameterValue)
+        return processor
+    
+    def copyRuntimeParameters(self, processor):
+        for parameterName in RUNTIME_PARAMETERS:
+            if hasattr(processor, parameterName):
+                setattr(self, parameterName, getattr(processor, parameterName))
+    
+    def resetActivations(self):
+        # the activations are allocated by the first fitted block and then warm-started from block to block
+        self.H = None
+        self.WSum = np.sum(self.W, axis=0, dtype=np.float32)[:, np.newaxis] + np.float32(ACTIVATION_EPSILON)
+        self.magnitudeV = np.zeros( (self.numFrequencies, self.numTimePerChunk), np.float32 )
+        self.WH = np.zeros_like(self.magnitudeV)
+        self.klRatio = np.zeros_like(self.magnitudeV)
+    
+    def fitActivations(self):
+        computeMixtureMagnitude(self.complexMixtureSpectrogram, out=self.magnitudeV)
+        if self.H is None:
+            self.H = np.ones( (self.numAtom, self.numTimePerChunk), np.float32 )
+        warmStartActivations(self.magnitudeV, self.W, self.H, self.WH)
+        return updateKLActivations(self.magnitudeV, self.W, self.H, self.WH, self.WSum, self.numHUpdates, self.klRatio)
+    
+    def setAdaptedDictionary(self, W, recV, dictionaryKey):
+        # W: adapted from the dictionary identified by dictionaryKey (see getDictionaryKey), replacing the stored one
+        # until the next reset; returns False if not applied, e.g. after switching to another dictionary type
+        if self.computeBackend == COMPUTE_BACKEND_THEANO or W.shape != self.W.shape or \
+           not np.array_equal( dictionaryKey, getDictionaryKey(self.dictionaryType, self.dictionarySize) ):
+            logging.info( 'GCCNMFProcessor: ignoring adapted dictionary of shape %s, key %s (%s backend, %s dictionary of size %d)' %
+                          (str(W.shape), str(dictionaryKey), self.computeBackend, self.dictionaryType, self.dictionarySize) )
+            return False
+        self.W = W
+        self.recV = recV
+        self.WSum = np.sum(self.W, axis=0, dtype=np.float32)[:, np.newaxis] + np.float32(ACTIVATION_EPSILON)
+        return True
+    
+    def computeMasksFromHMask(self, HMask):
+        # numHUpdates may change between blocks
+        if self.numHUpdates > 0:
+            return computeActivationTFMask(self.W, HMask, self.fitActivations(), self.WH)
+        if self.targetMode == TARGET_MODE_MULTIPLE:
+            return computeMultiTargetTFMasks(self.W, HMask, self.recV)
+        return computeTFMask(self.W, HMask, self.recV)
+    
+    def resetGating(self):
+        if not self.gatingEnabled:
+            self.activityDetector = None
+            return
+        blockDurationInSeconds = self.numTimePerChunk * (self.windowSize // 2) / float(self.sampleRate)
+        self.activityDetector = ActivityDetector(blockDurationInSeconds, self.gatingOnThresholdInDB, self.gatingOffThresholdInDB, self.gatingHangoverBlocks)
+        self.gatingGain = np.float32( 10 ** (self.gatingAttenuationInDB / 20.0) )
+        self.gatingDecay = np.float32( np.exp(-blockDurationInSeconds / GATING_RELEASE_SECONDS) )
+        self.gatedGCCPHAT = np.zeros( (self.numTDOAs, self.numTimePerChunk), np.float32 )
+        self.heldInputMask = None
+        self.heldCoefficientMask = None
+        logging.info( 'GCCNMFProcessor: energy gating enabled (on %.1f dB, off %.1f dB, hangover %d blocks, attenuation %.1f dB)' %
+                      (self.gatingOnThresholdInDB, self.gatingOffThresholdInDB, self.gatingHangoverBlocks, self.gatingAttenuationInDB) )
+    
+    def holdMasks(self, inputMask, coefficientMask):
+        # the last frame's masks, (freq, 1) and (atom, 1), with a leading target axis in TARGET_MODE_MULTIPLE
+        self.heldInputMask = np.array(inputMask[..., -1:], np.float32)
+        self.heldCoefficientMask = np.array(coefficientMask[..., -1:], np.float32)
+    
+    def getGatedMasks(self):
+        numTargets = self.getNumOutputStreams()
+        if self.heldInputMask is None or (self.targetMode == TARGET_MODE_MULTIPLE and len(self.heldInputMask) != numTargets):
+            inputMaskShape = (numTargets, self.numFrequencies, 1) if self.targetMode == TARGET_MODE_MULTIPLE else (self.numFrequencies, 1)
+            coefficientMaskShape = (numTargets, self.numAtom, 1) if self.targetMode == TARGET_MODE_MULTIPLE else (self.numAtom, 1)
+            self.heldInputMask = np.full(inputMaskShape, self.gatingGain, np.float32)
+            self.heldCoefficientMask = np.full(coefficientMaskShape, self.gatingGain, np.float32)
+        for heldMask in (self.heldInputMask, self.heldCoefficientMask):
+            heldMask -= self.gatingGain
+            heldMask *= self.gatingDecay
+            heldMask += self.gatingGain
+        inputMask = np.repeat(self.heldInputMask, self.numTimePerChunk, axis=-1)
+        coefficientMask = np.repeat(self.heldCoefficientMask, self.numTimePerChunk, axis=-1)
+        return inputMask, coefficientMask
+    
+    def computeFusedGCC(self):
+        numValidFrequencies = computeStackedCoherence(self.complexMixtureSpectrogram, out=self.stackedCoherence)
+        return computeFusedGCCPHAT(self.steeringMatrix, self.stackedCoherence, numValidFrequencies)
+    
+    def computeFusedTFMask(self):
+        computeFusedGCCNMF(self.steeringMatrix, self.stackedCoherence, self.W, self.gccScratch, out=self.gccNMF)
+        return self.computeMasks(self.gccNMF)
+    
+    def computeHierarchicalTFMask(self):
+        atomTDOAIndexes = computeHierarchicalAtomTDOAIndexes(self.steeringMatrix, self.coarseSteeringMatrix, self.coarseTDOAIndexes, self.tdoaCoarseStride,
+                                                             self.stackedCoherence, self.W, self.coarseGCCScratch, self.coarseGCCNMF, self.tdoaNumCandidates)
+        HMask = computeHMask(atomTDOAIndexes, self.targetMode, self.targetTDOAIndex,
+                             self.targetTDOAEpsilon, self.targetTDOABeta, self.targetTDOANoiseFloor)
+        return self.computeMasksFromHMask(HMask), HMask
+    
+    def computeNumpyGCC(self):
+        self.coherenceV = computeCoherence(self.complexMixtureSpectrogram)
+        self.realGCC = computeRealGCC(self.coherenceV, self.expJOmegaTau)
+        return np.nanmean(self.realGCC, axis=0).T
+    
+    def computeNumpyTFMask(self):
+        return self.computeMasks( computeGCCNMF(self.realGCC, self.W) )
+    
+    def computeMasks(self, gccNMF):
+        if self.targetMode == TARGET_MODE_MULTIPLE:
+            HMasks = computeMultiTargetHMasks(gccNMF, self.targetTDOAIndexes)
+            return self.computeMasksFromHMask(HMasks), HMasks
+        HMask = computeHMask(getAtomTDOAIndexes(gccNMF), self.targetMode, self.targetTDOAIndex,
+                             self.targetTDOAEpsilon, self.targetTDOABeta, self.targetTDOANoiseFloor)
+        return self.computeMasksFromHMask(HMask), HMask
+    
+    def computeTheanoGCC(self):
+        self.spectrogram.set_value(self.complexMixtureSpectrogram)
+        self.realGCC = self.getComplexGCC()[0].real
+        return np.nanmean(self.realGCC, axis=0).T
+    
+    def computeTheanoTFMask(self):
+        return self.getTFMask(self.realGCC, self.targetTDOAIndex, self.targetTDOAEpsilon, self.targetTDOABeta, self.targetTDOANoiseFloor)
+    
     def buildTheanoFunctions(self):  # theano.function은 함수 정의 함수(입력) = 출력
         from theano import shared, tensor, function
 
-        # V = concatenate( abs(complexMixtureSpectrogram), axis=-1 )
-        # W, H = performKLNMF(V, dictionarySize, numIterations, sparsityAlpha)
-
-        self.W = self.dictionariesW[self.dictionaryType][self.dictionarySize]  # 제대로 세팅 여기서 dictionary setting 됨
-        self.numFrequencies, self.numAtom = self.W.shape
-        logging.info( 'Dictionary shape: %s' % str(self.W.shape))
-        self.frequenciesInHz = np.linspace(0, self.sampleRate/2, self.numFrequencies).astype(np.float32)
-        self.maxTDOA = self.microphoneSeparationInMetres / SPEED_OF_SOUND_IN_METRES_PER_SECOND
-        self.hypothesisTDOAs = np.linspace(-self.maxTDOA, self.maxTDOA, self.numTDOAs).astype(np.float32)
-        self.expJOmegaTau = np.exp( np.outer(self.frequenciesInHz, -(2j * np.pi) * self.hypothesisTDOAs) ).astype(np.complex64)
-        self.omegaTau = np.outer(self.frequenciesInHz, -2 * np.pi * self.hypothesisTDOAs).astype(np.float32)
-        
-        self.complexMixtureSpectrogram = np.zeros( (2, self.numFrequencies, self.numTimePerChunk), 'complex64' )  # 초기화
         self.spectrogram = shared(self.complexMixtureSpectrogram)  # Return a SharedVariable Variable
 
         ### 여기서 spectrogram이 공유 변수 레퍼런스
-        # logging.info(self.spectrogram)
         self.coherenceV = self.spectrogram[0] * self.spectrogram[1].conj() / np.abs(self.spectrogram[0]) / np.abs(self.spectrogram[1])
 
         self.complexGCC = self.coherenceV[:, :, np.newaxis] * self.expJOmegaTau[:, np.newaxis]  # np.newaxis는 같은 배열에 대해 차원 증가
         self.getComplexGCC = function([], [self.complexGCC])  # 수식 인듯 하다
 
-        self.realGCC = tensor.tensor3('realGCC', dtype='float32')  # tensor3 : 3차원 변수 리턴
-        ########
-        # self.realGCC = self.complexGCC.real
-        #########
-        self.gccNMF = tensor.dot( self.realGCC.T, self.W )
-        self.getGCCNMF = function(inputs=[self.realGCC], outputs=[self.gccNMF])  # theano, self.gccNMF로 계산하여 결과 출력
+        realGCC = tensor.tensor3('realGCC', dtype='float32')  # tensor3 : 3차원 변수 리턴
+        targetTDOAIndex = tensor.scalar('targetTDOAIndex', dtype='float32')
+        targetTDOAEpsilon = tensor.scalar('targetTDOAEpsilon', dtype='float32')
+        targetTDOABeta = tensor.scalar('targetTDOABeta', dtype='float32')
+        targetTDOANoiseFloor = tensor.scalar('targetTDOANoiseFloor', dtype='float32')
+        
+        self.gccNMF = tensor.dot( realGCC.T, self.W )
+        self.getGCCNMF = function(inputs=[realGCC], outputs=[self.gccNMF])  # theano, self.gccNMF로 계산하여 결과 출력
         
         if self.targetMode == TARGET_MODE_BOXCAR:
-            self.HMask = tensor.switch( abs(tensor.argmax(self.gccNMF, axis=0).T - self.targetTDOAIndex) < self.targetTDOAEpsilon, 1.0, 0.0 )
+            self.HMask = tensor.switch( abs(tensor.argmax(self.gccNMF, axis=0).T - targetTDOAIndex) < targetTDOAEpsilon, 1.0, 0.0 )
         elif self.targetMode == TARGET_MODE_WINDOW_FUNCTION:
-            self.HMask = tensor.exp( - (abs(tensor.argmax(self.gccNMF, axis=0).T - self.targetTDOAIndex) / self.targetTDOAEpsilon) ** self.targetTDOABeta ) / (1+self.targetTDOANoiseFloor) + self.targetTDOANoiseFloor
+            self.HMask = tensor.exp( - (abs(tensor.argmax(self.gccNMF, axis=0).T - targetTDOAIndex) / targetTDOAEpsilon) ** targetTDOABeta ) / (1+targetTDOANoiseFloor) + targetTDOANoiseFloor
             
         self.recSource = tensor.dot( self.W, self.HMask )
-        self.recV = tensor.sum( self.W, axis=-1, keepdims=False )
         self.tfMask = ( self.recSource.T / self.recV ).T
-        self.getTFMask = function(inputs=[self.realGCC], outputs=[self.tfMask, self.HMask])  # 함수 정의
+        self.getTFMask = function(inputs=[realGCC, targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor],
+                                  outputs=[self.tfMask, self.HMask], on_unused_input='ignore')  # 함수 정의
 
     #kivy 슬라이딩 데이터에서 입력받은 값 update -> gccnmfProcess
     def setTargetTDOARange(self, targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor):
-        self.targetTDOAIndex.set_value( np.float32(targetTDOAIndex) )
-        self.targetTDOAEpsilon.set_value( np.float32(targetTDOAEpsilon) )
-        self.targetTDOABeta.set_value( np.float32(targetTDOABeta) )
-        self.targetTDOANoiseFloor.set_value( np.float32(targetTDOANoiseFloor) )
+        self.targetTDOAIndex = np.float32(targetTDOAIndex)
+        self.targetTDOAEpsilon = np.float32(targetTDOAEpsilon)
+        self.targetTDOABeta = np.float32(targetTDOABeta)
+        self.targetTDOANoiseFloor = np.float32(targetTDOANoiseFloor)
 
     def setTargetTDOAIndexes(self, targetTDOAIndexes):
-        self.targetTDOAIndex.set_value(np.float32(targetTDOAIndexes))
+        # the number of targets fixes the number of output channels (numTargets * numChannels) in TARGET_MODE_MULTIPLE
+        self.targetTDOAIndexes = np.array(targetTDOAIndexes, np.float32).reshape(-1)
+        self.targetTDOAIndex = self.targetTDOAIndexes[0]
+    
+    def getNumOutputStreams(self):
+        return len(self.targetTDOAIndexes) if self.targetMode == TARGET_MODE_MULTIPLE else 1
@@ -0,0 +1,248 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+from gccNMF.realtime.startupTiming import STARTUP_TIMER, logStartupReport
+import json
+import logging
+import argparse
+from collections import OrderedDict
+from os.path import join
+from multiprocessing import Event, Queue #다중프로세스간 동기화를 위한 이벤트 객체 / 객체전달
+
+from gccNMF.realtime.defs import DATA_DIR, DEFAULT_AUDIO_FILE, DEFAULT_CONFIG_FILE
+from gccNMF.realtime.utils import SharedMemoryCircularBuffer, SharedMemoryBlockRing, SharedMemoryParameterBlock, SharedMemoryDoubleBuffer, OverlapAddProcessor
+from gccNMF.realtime.config import getGCCNMFConfigParams
+from gccNMF.realtime.audioProcessor import AudioStreamProcessor
+from gccNMF.realtime.audioBackends import createAudioBackend, VirtualAudioBackend, AUDIO_BACKEND_VIRTUAL
+from gccNMF.realtime.gccNMFProcessor import GCCNMFProcess, TDOA_PARAMETERS
+from gccNMF.realtime.dictionaryAdaptation import DictionaryAdaptationProcess, getAdaptedDictionaryShapes
+from gccNMF.realtime.precomputationCache import PrecomputationCache
+from gccNMF.realtime.recorder import BlockRecorder
+from gccNMF.realtime.audioStats import SharedMemoryStats, AUDIO_CALLBACK_COUNTERS, AUDIO_CALLBACK_HISTOGRAMS, WORKER_COUNTERS, WORKER_HISTOGRAMS, \
+    UI_COUNTERS, UI_HISTOGRAMS
+
+STARTUP_TIMER.mark('imports')
+
+# The realtime separation processes and the shared state between them: the audio process (callback driven by an
+# audio backend), the GCCNMF worker process, the block rings connecting them, the history buffers read by the UI,
+# the parameter queues and the tdoa parameter block, and optionally the dictionary adaptation process.
+# Voiscope puts the kivy UI on top; without it the pipeline runs headless, e.g. driven by a VirtualAudioBackend
+# for load tests: python -m gccNMF.realtime.pipeline input.wav --fast
+class RealtimePipeline(object):
+    def __init__(self, params, audioBackend=None):
+        self.params = params
+        self.audioBackend = createAudioBackend(params) if audioBackend is None else audioBackend
+        
+        self.initQueuesAndEvents()
+        self.initSharedArrays(params)
+        self.initHistoryBuffers(params)
+        self.initProcesses(params)
+        STARTUP_TIMER.mark('pipelineCreated')
+
+    def initQueuesAndEvents(self):  #프로세스틀 핸들링하기 위한 변수
+        self.togglePlayAudioProcessQueue = Queue()
+        self.togglePlayAudioProcessAck = Event()
+        self.togglePlayGCCNMFProcessQueue = Queue()
+        self.togglePlayGCCNMFProcessAck = Event()
+        # self.toggleSeparationGCCNMFProcessQueue = Queue()
+        # self.toggleSeparationGCCNMFProcessAck = Event()
+        self.tdoaParamsGCCNMFProcessQueue = Queue()
+        self.tdoaParamsGCCNMFProcessAck = Event()
+
+        self.terminateEvent = Event()
+
+    def initSharedArrays(self, params):
+        # 공유 메모리, audio callback -> GCCNMF process -> audio callback
+        self.inputRing = SharedMemoryBlockRing(params.numRingBlocks, params.numChannels * params.blockSize)
+        self.outputRing = SharedMemoryBlockRing(params.numRingBlocks, params.numChannels * params.blockSize, wakeupEnabled=False)
+        # runtime statistics, readable while running with: python -m gccNMF.realtime.audioStats <name>
+        self.audioStats = SharedMemoryStats(AUDIO_CALLBACK_COUNTERS, AUDIO_CALLBACK_HISTOGRAMS)
+        self.workerStats = SharedMemoryStats(WORKER_COUNTERS, WORKER_HISTOGRAMS)
+        self.uiStats = SharedMemoryStats(UI_COUNTERS, UI_HISTOGRAMS)
+        logging.info( 'RealtimePipeline: audio/worker/ui stats in shared memory blocks %s, %s, %s' %
+                      (self.audioStats.name, self.workerStats.name, self.uiStats.name) )
+        # target and localization parameters, written by the UI without waiting for the worker
+        initialTDOAParameters = {'targetTDOAIndex': params.numTDOAs / 2.0, 'targetTDOAEpsilon': params.targetTDOAEpsilon,
+                                 'targetTDOABeta': params.targetTDOABeta, 'targetTDOANoiseFloor': params.targetTDOANoiseFloor,
+                                 'localizationEnabled': False, 'localizationWindowSize': params.localizationWindowSize}
+        self.tdoaParameterBlock = SharedMemoryParameterBlock( [ (parameterName, initialTDOAParameters[parameterName]) for parameterName in TDOA_PARAMETERS ] )
+        
+        self.adaptationRing = None
+        self.dictionarySlot = None
+        if params.dictionaryAdaptationEnabled:
+            self.adaptationRing = SharedMemoryBlockRing(params.adaptationQueueBlocks, params.numFreq * params.windowsPerBlock)
+            self.dictionarySlot = SharedMemoryDoubleBuffer( getAdaptedDictionaryShapes(params.numFreq, params.dictionarySize) )
+        
+        self.recorder = None
+        if params.recordingEnabled:
+            self.recorder = BlockRecorder(params.recordingTracks, params.numChannels, params.sampleRate, params.blockSize, join(DATA_DIR, params.recordingDir),
+                                          fileFormat=params.recordingFormat, numSlots=params.recordingQueueBlocks, rotateSeconds=params.recordingRotateSeconds,
+                                          rotateBytes=params.recordingRotateMegabytes * 1e6)
+
+    def initHistoryBuffers(self, params):
+        self.gccPHATHistory = SharedMemoryCircularBuffer((params.numTDOAs, params.numTDOAHistory))
+        self.tdoaHistory = SharedMemoryCircularBuffer((1, params.numTDOAHistory))
+        self.inputSpectrogramHistory = SharedMemoryCircularBuffer((params.numFreq, params.numSpectrogramHistory))
+        self.outputSpectrogramHistory = SharedMemoryCircularBuffer((params.numFreq, params.numSpectrogramHistory))
+        self.coefficientMaskHistories = {}
+        for size in params.dictionarySizes:
+            self.coefficientMaskHistories[size] = SharedMemoryCircularBuffer((size, params.numSpectrogramHistory))
+
+    def initProcesses(self, params):
+        self.audioProcess = AudioStreamProcessor(params.numChannels, params.sampleRate, params.windowSize,
+                                                 params.hopSize, params.blockSize, params.deviceIndex,
+                                                 self.togglePlayAudioProcessQueue, self.togglePlayAudioProcessAck,
+                                                 self.inputRing, self.outputRing, self.terminateEvent, self.audioStats,
+                                                 params.limiterCeiling, params.limiterLookAhead, params.limiterReleaseInSeconds, self.recorder,
+                                                 self.audioBackend, self.uiStats)
+        self.oladProcessor = OverlapAddProcessor(params.numChannels, params.windowSize, params.hopSize,
+                                                 params.blockSize, params.windowsPerBlock)
+
+        self.gccNMFProcess = GCCNMFProcess(self.oladProcessor, params.sampleRate, params.windowSize,
+                                           params.windowsPerBlock, params.dictionariesW, params.dictionaryType,
+                                           params.dictionarySize, params.numHUpdates,
+                                           params.microphoneSeparationInMetres, False,#params.localizationEnabled,
+                                           params.localizationWindowSize,
+                                           self.gccPHATHistory, self.tdoaHistory, self.inputSpectrogramHistory,
+                                           self.outputSpectrogramHistory, self.coefficientMaskHistories,
+                                           self.tdoaParamsGCCNMFProcessQueue, self.tdoaParamsGCCNMFProcessAck,
+                                           self.togglePlayGCCNMFProcessQueue, self.togglePlayGCCNMFProcessAck,
+                                           # self.toggleSeparationGCCNMFProcessQueue,
+                                           # self.toggleSeparationGCCNMFProcessAck,
+                                           self.inputRing, self.outputRing, self.terminateEvent,
+                                           params.computeBackend,
+                                           PrecomputationCache(params.precomputationCacheSize, params.precomputationDiskCacheEnabled),
+                                           self.workerStats, params.tdoaSearch, params.tdoaCoarseStride, params.tdoaNumCandidates,
+                                           params.gatingEnabled, params.gatingOnThresholdInDB, params.gatingOffThresholdInDB,
+                                           params.gatingHangoverBlocks, params.gatingAttenuationInDB, params.hotReconfigurationEnabled, self.tdoaParameterBlock,
+                                           self.adaptationRing, self.dictionarySlot)
+        self.adaptationProcess = None
+        if params.dictionaryAdaptationEnabled:
+            self.adaptationProcess = DictionaryAdaptationProcess(params.dictionariesW, params.dictionaryType, params.dictionarySize, params.numFreq,
+                                                                 self.adaptationRing, self.dictionarySlot, self.terminateEvent,
+                                                                 params.adaptationMinibatchSize, params.adaptationForgettingFactor,
+                                                                 params.adaptationNumHIterations, params.adaptationPublishIntervalInSeconds,
+                                                                 params.adaptationPriorWeight)
+
+    def start(self):
+        self.audioProcess.start() #audioProcess.run() 실행
+        logging.info('RealtimePipeline: audio process started')
+        self.gccNMFProcess.start()
+        if self.adaptationProcess:
+            self.adaptationProcess.start()
+        STARTUP_TIMER.mark('processesStarted')
+
+    def stop(self):
+        try:
+            self.terminateEvent.set()
+
+            self.audioProcess.join()
+            logging.info('Audio process joined')
+
+            self.gccNMFProcess.join()
+            logging.info('GCCNMF process joined')
+            
+            if self.adaptationProcess:
+                self.adaptationProcess.join()
+                logging.info('Dictionary adaptation process joined')
+        finally:
+            self.audioProcess.terminate()
+            self.gccNMFProcess.terminate()
+            if self.adaptationProcess:
+                self.adaptationProcess.terminate()
+            
+            for historyBuffer in [self.gccPHATHistory, self.tdoaHistory, self.inputSpectrogramHistory, self.outputSpectrogramHistory] + list(self.coefficientMaskHistories.values()):
+                historyBuffer.close()
+            self.audioStats.close()
+            self.workerStats.close()
+            self.uiStats.close()
+            self.tdoaParameterBlock.close()
+            if self.dictionarySlot:
+                self.dictionarySlot.close()
+    
+    # what the UI's play button sends, for running without the UI
+    def queueParams(self, queue, ack, params):
+        ack.clear()
+        queue.put(params)
+        ack.wait()
+    
+    def play(self, targetTDOAIndex=None, targetTDOAEpsilon=None, targetTDOABeta=2.0, targetTDOANoiseFloor=0.0):
+        numTDOAs = self.params.numTDOAs
+        self.tdoaParameterBlock.write(targetTDOAIndex=numTDOAs / 2.0 if targetTDOAIndex is None else targetTDOAIndex,
+                                      targetTDOAEpsilon=numTDOAs / 2.0 if targetTDOAEpsilon is None else targetTDOAEpsilon,
+                                      targetTDOABeta=targetTDOABeta, targetTDOANoiseFloor=targetTDOANoiseFloor)
+        self.queueParams(self.togglePlayGCCNMFProcessQueue, self.togglePlayGCCNMFProcessAck,
+                         {'numTDOAs': numTDOAs, 'dictionarySize': self.params.dictionarySize})
+        self.queueParams(self.togglePlayAudioProcessQueue, self.togglePlayAudioProcessAck, {'start': ''})
+    
+    def pause(self):
+        self.queueParams(self.togglePlayAudioProcessQueue, self.togglePlayAudioProcessAck, {'stop': ''})
+    
+    def getStats(self):
+        return {'audio': self.audioStats.getSummary(), 'worker': self.workerStats.getSummary(), 'ui': self.uiStats.getSummary()}
+    
+    def getStartupReport(self):
+        # seconds: milestones since startup, then the durations of the worker's last reset
+        audioStats = self.audioStats.getSummary()
+        workerStats = self.workerStats.getSummary()
+        report = OrderedDict( (name, STARTUP_TIMER.milestones.get(name)) for name in ['imports', 'config', 'pipelineCreated', 'processesStarted'] )
+        firstOutputWallTime = audioStats['firstOutputWallTime']
+        report['firstAudioBlock'] = STARTUP_TIMER.getElapsed(firstOutputWallTime / 1e6) if firstOutputWallTime else None
+        for timingName in ['dictionaryLoadTime', 'precomputationTime', 'graphBuildTime']:
+            report[timingName] = workerStats[timingName] / 1e6
+        return report
+
+def runHeadless(inputPath, capturePath=None, paced=True, configPath=DEFAULT_CONFIG_FILE, timeoutInSeconds=None, **playArguments):
+    # plays inputPath through the full multi-process pipeline on a virtual device, returns the runtime statistics
+    params = getGCCNMFConfigParams(inputPath, configPath)._replace(audioBackend=AUDIO_BACKEND_VIRTUAL)
+    STARTUP_TIMER.mark('config')
+    audioBackend = VirtualAudioBackend(inputPath, paced, capturePath)
+    pipeline = RealtimePipeline(params, audioBackend)
+    pipeline.start()
+    try:
+        pipeline.play(**playArguments)
+        if not audioBackend.finishedEvent.wait(timeoutInSeconds):
+            logging.warning('RealtimePipeline: virtual device did not finish within %s s' % timeoutInSeconds)
+        stats = pipeline.getStats()
+        stats['startup'] = pipeline.getStartupReport()
+        logStartupReport(stats['startup'])
+        return stats
+    finally:
+        pipeline.stop()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Run the realtime GCC-NMF pipeline headless on a virtual audio device')
+    parser.add_argument('inputPath', nargs='?', default=DEFAULT_AUDIO_FILE, help='16 bit stereo WAV file')
+    parser.add_argument('--capture', default=None, help='WAV file for the separated output')
+    parser.add_argument('--fast', action='store_true', help='run as fast as possible instead of in real time')
+    parser.add_argument('--targetTDOAIndex', type=float, default=None)
+    parser.add_argument('--timeout', type=float, default=None)
+    arguments = parser.parse_args()
+    
+    stats = runHeadless(arguments.inputPath, arguments.capture, not arguments.fast, timeoutInSeconds=arguments.timeout, targetTDOAIndex=arguments.targetTDOAIndex)
+    print( json.dumps(stats, indent=2) )
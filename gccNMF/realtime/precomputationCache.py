@@ -0,0 +1,122 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import logging
+import numpy as np
+from os.path import exists, join
+from collections import OrderedDict, namedtuple
+
+from gccNMF.realtime.defs import PRETRAINED_W_DIR
+from gccNMF.realtime.gccNMFKernels import getFrequenciesInHz, getHypothesisTDOAs, getExpJOmegaTau, getSteeringMatrix
+
+PRECOMPUTED_FILE_NAME_TEMPLATE = 'precomputed_%d_%d_%d_%g_%s.npy'
+STEERING_ARRAY_NAMES = ['frequenciesInHz', 'hypothesisTDOAs', 'expJOmegaTau', 'steeringMatrix']
+
+Precomputation = namedtuple('Precomputation', STEERING_ARRAY_NAMES + ['recV'])
+
+class LRUCache(object):
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.numHits = 0
+        self.numMisses = 0
+        
+    def get(self, key, computeFunction):
+        try:
+            value = self.entries.pop(key)
+            self.numHits += 1
+        except KeyError:
+            value = computeFunction()
+            self.numMisses += 1
+            
+        self.entries[key] = value
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+        return value
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def __len__(self):
+        return len(self.entries)
+
+# Steering matrices and dictionary-derived tensors, keyed by
+# (sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres, dictionaryType, dictionarySize).
+# The steering arrays do not depend on the dictionary and can also be persisted as .npy files;
+# recV is only cached in memory: it is a single sum over W, and a retrained W_<size>.npy would leave a stale copy on disk.
+class PrecomputationCache(object):
+    def __init__(self, maxEntries=8, useDiskCache=False, cacheDir=PRETRAINED_W_DIR):
+        self.cache = LRUCache(maxEntries)
+        self.useDiskCache = useDiskCache
+        self.cacheDir = cacheDir
+        
+    def get(self, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres, dictionaryType, dictionarySize, W):
+        key = (sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres, dictionaryType, dictionarySize)
+        return self.cache.get( key, lambda: self.compute(sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres, W) )
+    
+    def compute(self, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres, W):
+        steeringArrays = self.loadSteeringArrays(sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres)
+        if steeringArrays is None:
+            logging.info('PrecomputationCache: computing steering matrices (%d TDOAs, %g m)' % (numTDOAs, microphoneSeparationInMetres))
+            frequenciesInHz = getFrequenciesInHz(sampleRate, windowSize // 2 + 1)
+            hypothesisTDOAs = getHypothesisTDOAs(microphoneSeparationInMetres, numTDOAs)
+            expJOmegaTau = getExpJOmegaTau(frequenciesInHz, hypothesisTDOAs)
+            steeringArrays = [frequenciesInHz, hypothesisTDOAs, expJOmegaTau, getSteeringMatrix(expJOmegaTau)]
+            self.saveSteeringArrays(steeringArrays, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres)
+            
+        recV = np.sum(W, axis=-1)
+        return Precomputation(*(steeringArrays + [recV]))
+    
+    def getSteeringArrayPath(self, arrayName, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres):
+        fileName = PRECOMPUTED_FILE_NAME_TEMPLATE % (sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres, arrayName)
+        return join(self.cacheDir, fileName)
+        
+    def loadSteeringArrays(self, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres):
+        if not self.useDiskCache:
+            return None
+        
+        filePaths = [self.getSteeringArrayPath(arrayName, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres) for arrayName in STEERING_ARRAY_NAMES]
+        if not all( exists(filePath) for filePath in filePaths ):
+            return None
+        
+        logging.info('PrecomputationCache: loading steering matrices from %s' % self.cacheDir)
+        try:
+            return [np.load(filePath) for filePath in filePaths]
+        except (IOError, ValueError) as e:
+            logging.warning('PrecomputationCache: failed to load steering matrices: %s' % str(e))
+            return None
+    
+    def saveSteeringArrays(self, steeringArrays, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres):
+        if not self.useDiskCache:
+            return
+        
+        for arrayName, array in zip(STEERING_ARRAY_NAMES, steeringArrays):
+            filePath = self.getSteeringArrayPath(arrayName, sampleRate, windowSize, numTDOAs, microphoneSeparationInMetres)
+            try:
+                np.save(filePath, array)
+            except IOError as e:
+                logging.warning('PrecomputationCache: failed to save %s: %s' % (filePath, str(e)))
+                return
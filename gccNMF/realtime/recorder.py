@@ -0,0 +1,207 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import struct
+import logging
+import threading
+import numpy as np
+from os import makedirs
+from os.path import join, exists
+from time import sleep, strftime
+
+RECORDING_FORMAT_WAV = 'wav'
+RECORDING_FORMAT_RAW = 'raw'
+RECORDING_FORMATS = [RECORDING_FORMAT_WAV, RECORDING_FORMAT_RAW]
+
+WAV_HEADER_NUM_BYTES = 44
+WAV_MAX_DATA_BYTES = 0xFFFFFFFF - WAV_HEADER_NUM_BYTES
+WRITER_POLL_INTERVAL_SECONDS = 0.05
+
+# One recorded track (e.g. the microphone input or the separated output) as a sequence of 16 bit PCM files.
+# WAV headers are written with the current data size at every fixup, so an interrupted recording stays readable
+# up to the last fixup. A new file is started once the current one would exceed maxDataBytes.
+class RecordingFile(object):
+    def __init__(self, pathPrefix, fileFormat, numChannels, sampleRate, maxDataBytes):
+        self.pathPrefix = pathPrefix
+        self.fileFormat = fileFormat
+        self.numChannels = numChannels
+        self.sampleRate = sampleRate
+        self.maxDataBytes = maxDataBytes
+        self.fileIndex = 0
+        self.file = None
+        self.numDataBytes = 0
+        self.filePaths = []
+    
+    def open(self):
+        filePath = '%s_%03d.%s' % (self.pathPrefix, self.fileIndex, self.fileFormat)
+        self.file = open(filePath, 'wb')
+        self.fileIndex += 1
+        self.numDataBytes = 0
+        self.filePaths.append(filePath)
+        if self.fileFormat == RECORDING_FORMAT_WAV:
+            self.file.write( self.getWAVHeader() )
+        logging.info('RecordingFile: recording to %s' % filePath)
+    
+    def getWAVHeader(self):
+        bytesPerFrame = 2 * self.numChannels
+        return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', WAV_HEADER_NUM_BYTES - 8 + self.numDataBytes, b'WAVE', b'fmt ', 16, 1, self.numChannels,
+                           self.sampleRate, self.sampleRate * bytesPerFrame, bytesPerFrame, 16, b'data', self.numDataBytes)
+    
+    def write(self, data):
+        if self.file is None:
+            self.open()
+        elif self.numDataBytes + data.nbytes > self.maxDataBytes:
+            self.close()
+            self.open()
+        self.file.write(data)
+        self.numDataBytes += data.nbytes
+    
+    def fixupHeader(self):
+        if self.file is None:
+            return
+        if self.fileFormat == RECORDING_FORMAT_WAV:
+            position = self.file.tell()
+            self.file.seek(0)
+            self.file.write( self.getWAVHeader() )
+            self.file.seek(position)
+        self.file.flush()
+    
+    def close(self):
+        if self.file is None:
+            return
+        self.fixupHeader()
+        self.file.close()
+        self.file = None
+
+
+# Streams int16 audio blocks from the audio callback to disk on a background thread.
+# push() only copies the block into a preallocated slot of a fixed-size ring and never blocks or allocates;
+# when the writer falls behind the ring fills up and blocks are dropped and counted instead of growing memory.
+# The callback is the only producer and the writer thread the only consumer, so the sequence counters need no lock.
+class BlockRecorder(object):
+    def __init__(self, trackNames, numChannels, sampleRate, blockSize, outputDir, filePrefix='voiscope', fileFormat=RECORDING_FORMAT_WAV,
+                 numSlots=256, rotateSeconds=None, rotateBytes=None, headerFixupSeconds=1.0):
+        if fileFormat not in RECORDING_FORMATS:
+            raise ValueError('BlockRecorder: unknown format %s, expected one of %s' % (fileFormat, RECORDING_FORMATS))
+        self.trackNames = list(trackNames)
+        self.trackIndexes = dict( (trackName, trackIndex) for trackIndex, trackName in enumerate(self.trackNames) )
+        self.numChannels = numChannels
+        self.sampleRate = sampleRate
+        self.blockSize = blockSize
+        self.outputDir = outputDir
+        self.filePrefix = filePrefix
+        self.fileFormat = fileFormat
+        self.numSlots = numSlots
+        self.headerFixupSeconds = headerFixupSeconds
+        
+        maxDataBytes = WAV_MAX_DATA_BYTES if fileFormat == RECORDING_FORMAT_WAV else np.iinfo(np.int64).max
+        if rotateSeconds:
+            maxDataBytes = min(maxDataBytes, int(rotateSeconds * sampleRate) * numChannels * 2)
+        if rotateBytes:
+            maxDataBytes = min(maxDataBytes, int(rotateBytes))
+        self.maxDataBytes = max(maxDataBytes, blockSize * numChannels * 2)
+        
+        self.slots = np.zeros( (numSlots, blockSize * numChannels), '<i2' )
+        self.slotTrackIndexes = np.zeros(numSlots, np.int32)
+        self.writeSequence = 0
+        self.readSequence = 0
+        self.numDroppedBlocks = 0
+        self.numRecordedBlocks = 0
+        
+        self.recordingFiles = None
+        self.writerThread = None
+        self.running = False
+    
+    def getTrackIndex(self, trackName):
+        return self.trackIndexes.get(trackName)
+    
+    # producer side, called from the audio callback
+    def push(self, trackIndex, samples):
+        if self.writeSequence - self.readSequence >= self.numSlots:
+            self.numDroppedBlocks += 1
+            return False
+        slotIndex = self.writeSequence % self.numSlots
+        self.slots[slotIndex] = samples
+        self.slotTrackIndexes[slotIndex] = trackIndex
+        self.writeSequence += 1
+        return True
+    
+    def start(self):
+        if self.running:
+            return
+        if not exists(self.outputDir):
+            makedirs(self.outputDir)
+        sessionPrefix = join( self.outputDir, '%s_%s' % (self.filePrefix, strftime('%Y%m%d-%H%M%S')) )
+        self.recordingFiles = [ RecordingFile('%s_%s' % (sessionPrefix, trackName), self.fileFormat, self.numChannels, self.sampleRate, self.maxDataBytes)
+                                for trackName in self.trackNames ]
+        self.running = True
+        self.writerThread = threading.Thread(target=self.writeLoop, name='BlockRecorder')
+        self.writerThread.daemon = True
+        self.writerThread.start()
+    
+    def stop(self):
+        # writes out the queued blocks and finalizes the files
+        if not self.running:
+            return
+        self.running = False
+        self.writerThread.join()
+        self.writerThread = None
+    
+    # consumer side, on the writer thread
+    def writeLoop(self):
+        numReportedDroppedBlocks = self.numDroppedBlocks
+        secondsSinceFixup = 0
+        try:
+            while True:
+                running = self.running
+                self.writeAvailableBlocks()
+                
+                if self.numDroppedBlocks != numReportedDroppedBlocks:
+                    logging.warning( 'BlockRecorder: disk too slow, dropped %d blocks (%d in total)' % (self.numDroppedBlocks - numReportedDroppedBlocks, self.numDroppedBlocks) )
+                    numReportedDroppedBlocks = self.numDroppedBlocks
+                if not running:
+                    break
+                
+                secondsSinceFixup += WRITER_POLL_INTERVAL_SECONDS
+                if secondsSinceFixup >= self.headerFixupSeconds:
+                    for recordingFile in self.recordingFiles:
+                        recordingFile.fixupHeader()
+                    secondsSinceFixup = 0
+                sleep(WRITER_POLL_INTERVAL_SECONDS)
+        finally:
+            for recordingFile in self.recordingFiles:
+                recordingFile.close()
+            logging.info( 'BlockRecorder: recorded %d blocks, dropped %d' % (self.numRecordedBlocks, self.numDroppedBlocks) )
+    
+    def writeAvailableBlocks(self):
+        while self.readSequence < self.writeSequence:
+            slotIndex = self.readSequence % self.numSlots
+            self.recordingFiles[ self.slotTrackIndexes[slotIndex] ].write( self.slots[slotIndex] )
+            self.readSequence += 1
+            self.numRecordedBlocks += 1
+    
+    def getFilePaths(self):
+        return dict( (trackName, recordingFile.filePaths) for trackName, recordingFile in zip(self.trackNames, self.recordingFiles or []) )
@@ -0,0 +1,54 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import logging
+from time import time
+from collections import OrderedDict
+
+# Cold start milestones in seconds since this module was first imported. Entry points import it before anything
+# else, so the 'imports' milestone covers numpy, kivy and the gccNMF modules (but not the interpreter start).
+# Child processes report their milestones as wall-clock times through the shared stats, see
+# RealtimePipeline.getStartupReport.
+class StartupTimer(object):
+    def __init__(self, startTime=None):
+        self.startTime = time() if startTime is None else startTime
+        self.milestones = OrderedDict()
+    
+    def mark(self, name, markTime=None):
+        # later marks of the same milestone replace earlier ones, e.g. when several entry points mark 'imports'
+        self.milestones[name] = (time() if markTime is None else markTime) - self.startTime
+        return self.milestones[name]
+    
+    def getElapsed(self, wallTime):
+        return wallTime - self.startTime
+
+def formatStartupReport(report):
+    return ', '.join( '%s %s' % (name, 'n/a' if value is None else '%.1f ms' % (value * 1e3)) for name, value in report.items() )
+
+def logStartupReport(report):
+    logging.info( 'Startup: %s' % formatStartupReport(report) )
+
+STARTUP_TIMER = StartupTimer()
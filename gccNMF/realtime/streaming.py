@@ -0,0 +1,179 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import numpy as np
+from collections import namedtuple
+
+from gccNMF.realtime.defs import TARGET_MODE_BOXCAR, TARGET_MODE_MULTIPLE, COMPUTE_BACKEND_FUSED, TDOA_SEARCH_EXHAUSTIVE
+from gccNMF.realtime.utils import CircularBuffer, OverlapAddProcessor
+from gccNMF.realtime.gccNMFProcessor import GCCNMFProcessor
+from gccNMF.realtime.wavfile import pcm2float
+
+Localization = namedtuple('Localization', ['targetTDOAIndex', 'gccPHAT'])
+
+# In-process streaming front end for GCCNMFProcessor: the same OverlapAddProcessor and GCCNMFProcessor code
+# as the realtime app, without audio devices or worker processes, running as fast as the CPU allows.
+# With targetTDOAIndexes, K targets are separated at once (TARGET_MODE_MULTIPLE) and each output block has
+# K * numChannels channels, the stereo pair of target k in channels 2k and 2k+1 (see splitTargets).
+class GCCNMFStream(object):
+    def __init__(self, sampleRate=8000, windowSize=1024, hopSize=512, blockSize=512, numTDOAs=64, microphoneSeparationInMetres=0.05,
+                 dictionaryType='Pretrained', dictionarySize=256, dictionariesW=None, numHUpdates=0,
+                 targetMode=TARGET_MODE_BOXCAR, targetTDOAIndex=None, targetTDOAEpsilon=3.2, targetTDOABeta=2.0, targetTDOANoiseFloor=0.0,
+                 localizationEnabled=False, localizationWindowSize=6, numTDOAHistory=32, computeBackend=COMPUTE_BACKEND_FUSED,
+                 targetTDOAIndexes=None, tdoaSearch=TDOA_SEARCH_EXHAUSTIVE, tdoaCoarseStride=4, tdoaNumCandidates=1, gatingEnabled=False,
+                 gatingOnThresholdInDB=9.0, gatingOffThresholdInDB=4.0, gatingHangoverBlocks=8, gatingAttenuationInDB=-20.0):
+        self.numChannels = 2
+        if targetTDOAIndexes is not None:
+            targetMode = TARGET_MODE_MULTIPLE
+        self.numTargets = len(targetTDOAIndexes) if targetMode == TARGET_MODE_MULTIPLE else 1
+        self.numOutputChannels = self.numChannels * self.numTargets
+        self.sampleRate = sampleRate
+        self.blockSize = blockSize
+        self.windowsPerBlock = blockSize // hopSize
+        
+        if dictionariesW is None:
+            from gccNMF.realtime.gccNMFPretraining import getDictionariesW
+            dictionariesW = getDictionariesW(windowSize, [dictionarySize], ordered=True)
+        
+        self.gccPHATHistory = CircularBuffer( (numTDOAs, numTDOAHistory) )
+        self.tdoaHistory = CircularBuffer( (1, numTDOAHistory) )
+        self.oladProcessor = OverlapAddProcessor(self.numChannels, windowSize, hopSize, blockSize, self.windowsPerBlock, numOutputChannels=self.numOutputChannels)
+        self.gccNMFProcessor = GCCNMFProcessor(sampleRate, windowSize, self.windowsPerBlock, dictionariesW, dictionaryType, dictionarySize, numHUpdates,
+                                               microphoneSeparationInMetres, localizationEnabled, localizationWindowSize,
+                                               self.gccPHATHistory, self.tdoaHistory, computeBackend=computeBackend,
+                                               tdoaSearch=tdoaSearch, tdoaCoarseStride=tdoaCoarseStride, tdoaNumCandidates=tdoaNumCandidates,
+                                               gatingEnabled=gatingEnabled, gatingOnThresholdInDB=gatingOnThresholdInDB, gatingOffThresholdInDB=gatingOffThresholdInDB,
+                                               gatingHangoverBlocks=gatingHangoverBlocks, gatingAttenuationInDB=gatingAttenuationInDB)
+        self.gccNMFProcessor.numTDOAs = numTDOAs
+        self.gccNMFProcessor.targetMode = targetMode
+        self.gccNMFProcessor.reset()
+        self.setTargetTDOARange(numTDOAs / 2.0 if targetTDOAIndex is None else targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor)
+        if targetMode == TARGET_MODE_MULTIPLE:
+            self.gccNMFProcessor.setTargetTDOAIndexes(targetTDOAIndexes)
+        
+        # output block n holds the input from 2 blocks earlier (see OverlapAddProcessor)
+        self.latency = 2 * blockSize
+        self.inputSamples = np.zeros(self.numChannels * blockSize, np.float32)
+        self.outputSamples = np.zeros(self.numOutputChannels * blockSize, np.float32)
+    
+    @classmethod
+    def fromParams(cls, params, **kwargs):
+        # params: namedtuple returned by config.getGCCNMFConfigParams
+        streamArguments = dict(sampleRate=params.sampleRate, windowSize=params.windowSize, hopSize=params.hopSize, blockSize=params.blockSize,
+                               numTDOAs=params.numTDOAs, microphoneSeparationInMetres=params.microphoneSeparationInMetres,
+                               dictionaryType=params.dictionaryType, dictionarySize=params.dictionarySize, dictionariesW=params.dictionariesW,
+                               numHUpdates=params.numHUpdates, targetTDOAEpsilon=params.targetTDOAEpsilon, targetTDOABeta=params.targetTDOABeta,
+                               targetTDOANoiseFloor=params.targetTDOANoiseFloor, localizationEnabled=params.localizationEnabled,
+                               localizationWindowSize=params.localizationWindowSize, numTDOAHistory=params.numTDOAHistory,
+                               computeBackend=params.computeBackend, tdoaSearch=params.tdoaSearch, tdoaCoarseStride=params.tdoaCoarseStride,
+                               tdoaNumCandidates=params.tdoaNumCandidates, gatingEnabled=params.gatingEnabled,
+                               gatingOnThresholdInDB=params.gatingOnThresholdInDB, gatingOffThresholdInDB=params.gatingOffThresholdInDB,
+                               gatingHangoverBlocks=params.gatingHangoverBlocks, gatingAttenuationInDB=params.gatingAttenuationInDB)
+        streamArguments.update(kwargs)
+        return cls(**streamArguments)
+    
+    def setTargetTDOARange(self, targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor):
+        self.gccNMFProcessor.setTargetTDOARange(targetTDOAIndex, targetTDOAEpsilon, targetTDOABeta, targetTDOANoiseFloor)
+    
+    def process(self, frames):
+        # frames: (blockSize, numChannels) float32, returns the separated (blockSize, numOutputChannels) block (reused between calls)
+        self.inputSamples.reshape(-1, self.numChannels)[:] = frames
+        self.oladProcessor.processFrames(self.gccNMFProcessor.processFrames, self.inputSamples, self.outputSamples)
+        return self.outputSamples.reshape(-1, self.numOutputChannels)
+    
+    def splitTargets(self, outputFrames):
+        # (numFrames, numOutputChannels) -> list of numTargets (numFrames, numChannels) views
+        return [ outputFrames[:, targetIndex*self.numChannels:(targetIndex+1)*self.numChannels] for targetIndex in range(self.numTargets) ]
+    
+    def getLocalization(self):
+        return Localization( float(self.gccNMFProcessor.targetTDOAIndex), np.mean(self.gccNMFProcessor.gccPHAT, axis=-1) )
+    
+    def iterateBlocks(self, blocks):
+        # rebuffers arbitrarily sized blocks into (blockSize, numChannels) float32 frames, the last one zero padded
+        frames = np.zeros( (self.blockSize, self.numChannels), np.float32 )
+        numFrames = 0
+        for block in blocks:
+            block = toFloatFrames(block, self.numChannels)
+            blockIndex = 0
+            while blockIndex < block.shape[0]:
+                numToCopy = min(self.blockSize - numFrames, block.shape[0] - blockIndex)
+                frames[numFrames:numFrames+numToCopy] = block[blockIndex:blockIndex+numToCopy]
+                numFrames += numToCopy
+                blockIndex += numToCopy
+                if numFrames == self.blockSize:
+                    yield frames, numFrames
+                    numFrames = 0
+        if numFrames:
+            frames[numFrames:] = 0
+            yield frames, numFrames
+    
+    def separate(self, blocks, includeLocalization=False, compensateLatency=True):
+        '''Yields separated (numFrames, numOutputChannels) float32 blocks for an iterable of stereo blocks.
+        
+        Input blocks may be (numFrames, numChannels) float or integer PCM arrays, or interleaved int16 bytes.
+        With compensateLatency the output is aligned with the input and has the same total length;
+        otherwise every blockSize input frames produce one delayed blockSize output block.
+        With includeLocalization, (block, Localization) tuples are yielded instead.
+        '''
+        numInputFrames = 0
+        numOutputFrames = -self.latency if compensateLatency else 0
+        
+        for frames, numValidFrames in self.iterateBlocks(blocks):
+            numInputFrames += numValidFrames
+            outputFrames = self.process(frames)
+            for result in self.emit(outputFrames, numOutputFrames, numInputFrames, compensateLatency, includeLocalization):
+                yield result
+            numOutputFrames += self.blockSize
+        
+        if compensateLatency:
+            zeroFrames = np.zeros( (self.blockSize, self.numChannels), np.float32 )
+            while numOutputFrames < numInputFrames:
+                outputFrames = self.process(zeroFrames)
+                for result in self.emit(outputFrames, numOutputFrames, numInputFrames, compensateLatency, includeLocalization):
+                    yield result
+                numOutputFrames += self.blockSize
+    
+    def emit(self, outputFrames, numOutputFrames, numInputFrames, compensateLatency, includeLocalization):
+        startIndex = max(0, -numOutputFrames)
+        endIndex = min(self.blockSize, numInputFrames - numOutputFrames) if compensateLatency else self.blockSize
+        if endIndex <= startIndex:
+            return
+        
+        separatedBlock = outputFrames[startIndex:endIndex].copy()
+        yield (separatedBlock, self.getLocalization()) if includeLocalization else separatedBlock
+
+def toFloatFrames(block, numChannels):
+    if isinstance(block, (bytes, bytearray, memoryview)):
+        block = np.frombuffer(block, dtype='<i2').reshape(-1, numChannels)
+    block = np.asarray(block)
+    if block.dtype.kind in 'iu':
+        block = pcm2float(block)
+    if block.ndim != 2 or block.shape[1] != numChannels:
+        raise ValueError('GCCNMFStream: expected blocks of shape (numFrames, %d), got %s' % (numChannels, str(block.shape)))
+    return block
+
+def separate(blocks, includeLocalization=False, compensateLatency=True, **kwargs):
+    return GCCNMFStream(**kwargs).separate(blocks, includeLocalization, compensateLatency)
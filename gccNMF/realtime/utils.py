@@ -25,127 +25,566 @@ SOFTWARE.
 '''
 
 import ctypes
+from collections import OrderedDict
 import numpy as np
-from numpy import prod, frombuffer, concatenate, exp, abs
-from multiprocessing import Array, Value
+from numpy import prod, frombuffer, exp, abs, log10
+from numpy.lib.stride_tricks import as_strided
+from multiprocessing import RawArray, RawValue, Semaphore
 
-class SharedMemoryCircularBuffer():
-    def __init__(self, shape, initValue=0): # shape = (513, 128)
-        self.array = Array( ctypes.c_double, int(prod(shape)) )  # prod는 배열 안의 값 곱, 513 * 128
-                                                                 # Array는 공유메모리,
-        self.shape = shape
-        self.values = frombuffer(self.array.get_obj()).reshape(shape)
-        self.values[:] = initValue
-        
-        self.numValues = self.values.shape[-1]
-        
-        self.index = Value(ctypes.c_int)    
-        self.index.value = 0
-
-    def selfupdate(self, newValues, numNewValues, index):
-        # self.values[] 0 128, 256 ... 128 * (newValues.shape[0] - 1 -> 63)
-        # for i in range(newValues.shape[0]):
-        #     for j in range(numNewValues):
-        #         self.array[index + 128 * i] = self.values[i][j]
-        self.array[:] = np.array(self.values).flatten()
+# History buffer: a small int64 header followed by float32 values, in process memory (CircularBuffer)
+# or in a named shared memory block (SharedMemoryCircularBuffer).
+# A single writer updates columns in place under a sequence lock (sequence is odd while a write is in progress),
+# readers in other processes either apply a function to the live view and retry if a write intervened,
+# or copy a consistent snapshot. Other processes can attach to an existing shared buffer by name.
+HEADER_SEQUENCE, HEADER_INDEX, HEADER_NUM_DIMENSIONS, HEADER_SHAPE = 0, 1, 2, 3
+MAX_NUM_DIMENSIONS = 4
+HEADER_NUM_BYTES = (HEADER_SHAPE + MAX_NUM_DIMENSIONS + 1) * 8
 
-    def getupdatevalue(self):
-        self.values[:] = frombuffer(self.array.get_obj()).reshape(self.shape)
+def openSharedMemory(name, create=False, size=0):
+    from multiprocessing import shared_memory
+    if create:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    try:
+        # attaching processes must not unlink the block when they exit
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
 
+class CircularBuffer(object):
+    def __init__(self, shape, initValue=0):
+        shape = self.checkShape(shape)
+        storage = np.zeros(HEADER_NUM_BYTES + int(prod(shape)) * 4, np.uint8)
+        self.initViews(shape, storage)
+        self.initHeader(shape, initValue)
+    
+    def checkShape(self, shape):
+        shape = tuple(int(dimension) for dimension in shape)
+        if len(shape) > MAX_NUM_DIMENSIONS:
+            raise ValueError('%s: at most %d dimensions supported, got %s' % (type(self).__name__, MAX_NUM_DIMENSIONS, str(shape)))
+        return shape
+    
+    def initViews(self, shape, buffer):
+        self.shape = shape
+        self.header = np.ndarray( (HEADER_NUM_BYTES // 8,), np.int64, buffer=buffer )
+        self.values = np.ndarray( shape, np.float32, buffer=buffer, offset=HEADER_NUM_BYTES )
+        self.numValues = shape[-1]
+    
+    def initHeader(self, shape, initValue):
+        self.header[HEADER_NUM_DIMENSIONS] = len(shape)
+        self.header[HEADER_SHAPE:HEADER_SHAPE+len(shape)] = shape
+        self.header[HEADER_SEQUENCE] = 0
+        self.header[HEADER_INDEX] = 0
+        self.values[:] = initValue
+    
+    @property
+    def index(self):
+        return int(self.header[HEADER_INDEX])
+    
+    @property
+    def sequence(self):
+        # changes with every write, unlike index which wraps around
+        return int(self.header[HEADER_SEQUENCE])
+    
     def set(self, newValues, index=None):
-        index = self.index.value if index is None else index 
+        index = self.index if index is None else index
         numNewValues = newValues.shape[-1]
-        if index + numNewValues < self.numValues:
-            self.values[..., index:index+numNewValues] = newValues  # values 값을 업데이트, shape (64 X 1),
-            self.selfupdate(newValues, numNewValues, index)  # 업데이트 빠르게 다시 해야함
-            self.index.value = index + numNewValues
-            return self.index.value
-        else:
-            numAtEnd = self.numValues - index
-            numAtStart = numNewValues - numAtEnd
+        numAtEnd = min(numNewValues, self.numValues - index)
         
-            self.values[..., index:] = newValues[..., :numAtEnd]
-            self.values[..., :numAtStart] = newValues[..., numAtEnd:]
-            self.index.value = numAtStart
-            # self.selfupdate()
-            return self.index.value
+        self.header[HEADER_SEQUENCE] += 1
+        self.values[..., index:index+numAtEnd] = newValues[..., :numAtEnd]
+        self.values[..., :numNewValues-numAtEnd] = newValues[..., numAtEnd:]
+        self.header[HEADER_INDEX] = (index + numNewValues) % self.numValues
+        self.header[HEADER_SEQUENCE] += 1
+        return self.index
+    
+    def read(self, readFunction):
+        # readFunction(values, index) must not return views of values, they may change after the read is validated
+        while True:
+            sequence = self.header[HEADER_SEQUENCE]
+            if sequence % 2 == 0:
+                result = readFunction(self.values, int(self.header[HEADER_INDEX]))
+                if self.header[HEADER_SEQUENCE] == sequence:
+                    return result
+    
+    def snapshot(self, out=None):
+        out = np.empty(self.shape, np.float32) if out is None else out
+        def copy(values, index):
+            out[:] = values
+            return out
+        return self.read(copy)
     
     def get(self, index=None):
-        index = (self.index.value-1) % self.numValues if index is None else (index % self.numValues)
-        # logging.info(self.values)  # 여기서 values 가 전부 0
-        self.getupdatevalue()
-        return self.values[..., index]
+        if index is None:
+            return self.read( lambda values, writeIndex: values[..., (writeIndex-1) % self.numValues].copy() )
+        return self.read( lambda values, writeIndex: values[..., index % self.numValues].copy() )
 
-    def getUnraveledArray(self):
-        # logging.info(self.values)
-        return concatenate( [self.values[:, self.index.value:], self.values[:, :self.index.value]], axis=-1 ) 
+    def getUnraveledArray(self, out=None):
+        out = np.empty(self.shape, np.float32) if out is None else out
+        def unravel(values, index):
+            out[..., :self.numValues-index] = values[..., index:]
+            out[..., self.numValues-index:] = values[..., :index]
+            return out
+        return self.read(unravel)
         
     def size(self):
-        return self.values.shape[-1]
+        return self.numValues
+    
+    def close(self):
+        pass
+
+
+class SharedMemoryCircularBuffer(CircularBuffer):
+    def __init__(self, shape, initValue=0, name=None): # shape = (513, 128)
+        shape = self.checkShape(shape)
+        self.sharedMemory = openSharedMemory(name, create=True, size=HEADER_NUM_BYTES + int(prod(shape)) * 4)
+        self.isOwner = True
+        self.name = self.sharedMemory.name
+        self.initViews(shape, self.sharedMemory.buf)
+        self.initHeader(shape, initValue)
+    
+    @classmethod
+    def attach(cls, name):
+        buffer = cls.__new__(cls)
+        buffer.sharedMemory = openSharedMemory(name)
+        buffer.isOwner = False
+        buffer.name = name
+        header = np.ndarray( (HEADER_NUM_BYTES // 8,), np.int64, buffer=buffer.sharedMemory.buf )
+        buffer.initViews( tuple(int(dimension) for dimension in header[HEADER_SHAPE:HEADER_SHAPE+header[HEADER_NUM_DIMENSIONS]]), buffer.sharedMemory.buf )
+        return buffer
+    
+    def __getstate__(self):
+        return {'name': self.name}
+    
+    def __setstate__(self, state):
+        attached = SharedMemoryCircularBuffer.attach(state['name'])
+        self.__dict__.update(attached.__dict__)
+    
+    def close(self):
+        del self.header, self.values
+        self.sharedMemory.close()
+        if self.isOwner:
+            self.sharedMemory.unlink()
+
+
+# Single-producer/single-consumer ring of fixed-size float32 blocks in shared memory.
+# The producer only writes writeSequence and the consumer only writes readSequence, so no lock is needed;
+# the optional semaphore lets the consumer sleep until a block arrives instead of polling.
+class SharedMemoryBlockRing(object):
+    def __init__(self, numSlots, blockSize, wakeupEnabled=True):
+        self.numSlots = numSlots
+        self.blockSize = blockSize
+        self.array = RawArray(ctypes.c_float, numSlots * blockSize)
+        self.writeSequence = RawValue(ctypes.c_ulonglong, 0)
+        self.readSequence = RawValue(ctypes.c_ulonglong, 0)
+        self.wakeup = Semaphore(0) if wakeupEnabled else None
+        self.slots = frombuffer(self.array, dtype=np.float32).reshape(numSlots, blockSize)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['slots']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.slots = frombuffer(self.array, dtype=np.float32).reshape(self.numSlots, self.blockSize)
+    
+    def numAvailable(self):
+        return self.writeSequence.value - self.readSequence.value
+    
+    def numFree(self):
+        return self.numSlots - self.numAvailable()
+    
+    # producer side
+    def writeSlot(self):
+        return self.slots[self.writeSequence.value % self.numSlots]
+    
+    def commitWrite(self):
+        self.writeSequence.value += 1
+        if self.wakeup is not None:
+            self.wakeup.release()
+    
+    def push(self, values):
+        if self.numFree() == 0:
+            return False
+        self.writeSlot()[:] = values
+        self.commitWrite()
+        return True
+    
+    # consumer side
+    def wait(self, timeout=None):
+        return self.wakeup.acquire(timeout=timeout)
+    
+    def readSlot(self):
+        return self.slots[self.readSequence.value % self.numSlots]
+    
+    def commitRead(self):
+        self.readSequence.value += 1
+    
+    def pop(self, out):
+        if self.numAvailable() == 0:
+            return False
+        out[:] = self.readSlot()
+        self.commitRead()
+        return True
+    
+    def discard(self):
+        # drops every available block, e.g. those left from a previous session
+        numDiscarded = self.numAvailable()
+        self.readSequence.value += numDiscarded
+        if self.wakeup is not None:
+            for _ in range(numDiscarded):
+                self.wakeup.acquire(False)
+        return numDiscarded
+
+
+# Named float64 parameters in shared memory with a version counter, for control values a UI changes continuously.
+# A single writer process updates any subset of the values without blocking, under a sequence lock like the history
+# buffers, and bumps the version; the reader polls the version and copies all values when it has changed, so
+# intermediate writes between two polls are coalesced into the latest one.
+PARAMETERS_HEADER_SEQUENCE, PARAMETERS_HEADER_VERSION = 0, 1
+PARAMETERS_HEADER_NUM_BYTES = 2 * 8
+
+class SharedMemoryParameterBlock(object):
+    def __init__(self, initialValues, name=None):
+        # initialValues: ordered (name, value) pairs or an OrderedDict, fixing the parameters and their layout
+        initialValues = OrderedDict(initialValues)
+        self.sharedMemory = openSharedMemory(name, create=True, size=PARAMETERS_HEADER_NUM_BYTES + len(initialValues) * 8)
+        self.isOwner = True
+        self.name = self.sharedMemory.name
+        self.initViews( list(initialValues.keys()) )
+        self.header[:] = 0
+        self.values[:] = list(initialValues.values())
+    
+    @classmethod
+    def attach(cls, name, parameterNames):
+        parameterBlock = cls.__new__(cls)
+        parameterBlock.sharedMemory = openSharedMemory(name)
+        parameterBlock.isOwner = False
+        parameterBlock.name = name
+        parameterBlock.initViews(parameterNames)
+        return parameterBlock
+    
+    def initViews(self, parameterNames):
+        self.parameterNames = list(parameterNames)
+        self.parameterIndexes = dict( (parameterName, index) for index, parameterName in enumerate(self.parameterNames) )
+        self.header = np.ndarray( (PARAMETERS_HEADER_NUM_BYTES // 8,), np.int64, buffer=self.sharedMemory.buf )
+        self.values = np.ndarray( (len(self.parameterNames),), np.float64, buffer=self.sharedMemory.buf, offset=PARAMETERS_HEADER_NUM_BYTES )
+    
+    def __getstate__(self):
+        return {'name': self.name, 'parameterNames': self.parameterNames}
+    
+    def __setstate__(self, state):
+        attached = SharedMemoryParameterBlock.attach(state['name'], state['parameterNames'])
+        self.__dict__.update(attached.__dict__)
+    
+    @property
+    def version(self):
+        return int(self.header[PARAMETERS_HEADER_VERSION])
+    
+    # writer side
+    def write(self, **parameters):
+        indexes = [ self.parameterIndexes[parameterName] for parameterName in parameters ]
+        self.header[PARAMETERS_HEADER_SEQUENCE] += 1
+        self.values[indexes] = list(parameters.values())
+        self.header[PARAMETERS_HEADER_VERSION] += 1
+        self.header[PARAMETERS_HEADER_SEQUENCE] += 1
+        return self.version
+    
+    # reader side
+    def read(self):
+        # returns (version, {name: value}) from a consistent copy of all values
+        while True:
+            sequence = self.header[PARAMETERS_HEADER_SEQUENCE]
+            if sequence % 2 == 0:
+                version = int(self.header[PARAMETERS_HEADER_VERSION])
+                values = self.values.tolist()
+                if self.header[PARAMETERS_HEADER_SEQUENCE] == sequence:
+                    return version, OrderedDict( zip(self.parameterNames, values) )
+    
+    def readIfChanged(self, lastVersion):
+        # returns (version, {name: value}), or (lastVersion, None) if nothing was written since lastVersion
+        if self.header[PARAMETERS_HEADER_VERSION] == lastVersion:
+            return lastVersion, None
+        return self.read()
+    
+    def close(self):
+        del self.header, self.values
+        self.sharedMemory.close()
+        if self.isOwner:
+            self.sharedMemory.unlink()
+
+
+# Named float32 arrays published as a whole by a single writer process through two shared memory slots: the writer
+# fills the slot that is not published, then publishes it and bumps the version, so it never waits on readers.
+# Readers copy the published slot, and retry if the writer started refilling that slot during the copy
+# (each slot has its own sequence, odd while it is being written).
+DOUBLE_BUFFER_HEADER_VERSION, DOUBLE_BUFFER_HEADER_PUBLISHED_SLOT, DOUBLE_BUFFER_HEADER_SLOT_SEQUENCES = 0, 1, 2
+DOUBLE_BUFFER_HEADER_NUM_BYTES = 4 * 8
+
+class SharedMemoryDoubleBuffer(object):
+    def __init__(self, arrayShapes, name=None):
+        # arrayShapes: ordered (name, shape) pairs or an OrderedDict
+        arrayShapes = OrderedDict( (arrayName, tuple(int(dimension) for dimension in shape)) for arrayName, shape in OrderedDict(arrayShapes).items() )
+        slotNumValues = sum( int(prod(shape)) for shape in arrayShapes.values() )
+        self.sharedMemory = openSharedMemory(name, create=True, size=DOUBLE_BUFFER_HEADER_NUM_BYTES + 2 * slotNumValues * 4)
+        self.isOwner = True
+        self.name = self.sharedMemory.name
+        self.initViews(arrayShapes)
+        self.header[:] = 0
+        self.header[DOUBLE_BUFFER_HEADER_PUBLISHED_SLOT] = 1
+    
+    @classmethod
+    def attach(cls, name, arrayShapes):
+        doubleBuffer = cls.__new__(cls)
+        doubleBuffer.sharedMemory = openSharedMemory(name)
+        doubleBuffer.isOwner = False
+        doubleBuffer.name = name
+        doubleBuffer.initViews(arrayShapes)
+        return doubleBuffer
+    
+    def initViews(self, arrayShapes):
+        self.arrayShapes = OrderedDict(arrayShapes)
+        self.header = np.ndarray( (DOUBLE_BUFFER_HEADER_NUM_BYTES // 8,), np.int64, buffer=self.sharedMemory.buf )
+        slotNumValues = sum( int(prod(shape)) for shape in self.arrayShapes.values() )
+        self.slots = np.ndarray( (2, slotNumValues), np.float32, buffer=self.sharedMemory.buf, offset=DOUBLE_BUFFER_HEADER_NUM_BYTES )
+        # per slot, a view of each array
+        self.slotArrays = []
+        for slotValues in self.slots:
+            arrays, offset = OrderedDict(), 0
+            for arrayName, shape in self.arrayShapes.items():
+                arrays[arrayName] = slotValues[offset:offset+int(prod(shape))].reshape(shape)
+                offset += int(prod(shape))
+            self.slotArrays.append(arrays)
+    
+    def __getstate__(self):
+        return {'name': self.name, 'arrayShapes': list(self.arrayShapes.items())}
+    
+    def __setstate__(self, state):
+        attached = SharedMemoryDoubleBuffer.attach(state['name'], state['arrayShapes'])
+        self.__dict__.update(attached.__dict__)
+    
+    @property
+    def version(self):
+        return int(self.header[DOUBLE_BUFFER_HEADER_VERSION])
+    
+    # writer side
+    def publish(self, **arrays):
+        slotIndex = 1 - int(self.header[DOUBLE_BUFFER_HEADER_PUBLISHED_SLOT])
+        self.header[DOUBLE_BUFFER_HEADER_SLOT_SEQUENCES + slotIndex] += 1
+        for arrayName, slotArray in self.slotArrays[slotIndex].items():
+            slotArray[:] = arrays[arrayName]
+        self.header[DOUBLE_BUFFER_HEADER_SLOT_SEQUENCES + slotIndex] += 1
+        self.header[DOUBLE_BUFFER_HEADER_PUBLISHED_SLOT] = slotIndex
+        self.header[DOUBLE_BUFFER_HEADER_VERSION] += 1
+        return self.version
+    
+    # reader side
+    def read(self):
+        # returns (version, {name: array copy}), version 0 if nothing was published yet
+        while True:
+            version = int(self.header[DOUBLE_BUFFER_HEADER_VERSION])
+            slotIndex = int(self.header[DOUBLE_BUFFER_HEADER_PUBLISHED_SLOT])
+            sequence = self.header[DOUBLE_BUFFER_HEADER_SLOT_SEQUENCES + slotIndex]
+            if sequence % 2 == 0:
+                arrays = OrderedDict( (arrayName, slotArray.copy()) for arrayName, slotArray in self.slotArrays[slotIndex].items() )
+                if self.header[DOUBLE_BUFFER_HEADER_SLOT_SEQUENCES + slotIndex] == sequence:
+                    return version, arrays
+    
+    def readIfChanged(self, lastVersion):
+        # returns (version, {name: array copy}), or (lastVersion, None) if nothing was published since lastVersion
+        if self.header[DOUBLE_BUFFER_HEADER_VERSION] == lastVersion:
+            return lastVersion, None
+        return self.read()
+    
+    def close(self):
+        del self.header, self.slots, self.slotArrays
+        self.sharedMemory.close()
+        if self.isOwner:
+            self.sharedMemory.unlink()
 
 
 #공유메모리가 중첩되는 부분이다. 중간에 위치에 따른 변환 과정이 있다.
+# Input and output are circular buffers of numBlocksPerBuffer blocks with a moving head, so per-block memory traffic
+# does not depend on the buffer length. The input ring is mirrored (every sample is written at i and i+bufferSize),
+# so the windows ending at the head are always a contiguous strided view. Overlap-add adds each window into at most
+# two precomputed contiguous output views (two if it wraps around the end of the ring). All views are precomputed per
+# head position, making steady-state processing allocation-free apart from processFramesFunction.
+# processFramesFunction may return more channels than it is given (numOutputChannels, e.g. one stereo pair per target).
 class OverlapAddProcessor(object):
-    def __init__(self, numChannels, windowSize, hopSize, blockSize, windowsPerBlock, inputFrames, outputFrames, inputFramesArray, outputFramesArray):
+    def __init__(self, numChannels, windowSize, hopSize, blockSize, windowsPerBlock, numBlocksPerBuffer=8, numOutputChannels=None):
         super(OverlapAddProcessor, self).__init__()
         
         self.numChannels = numChannels
+        self.numOutputChannels = numChannels if numOutputChannels is None else numOutputChannels
         self.windowSize = windowSize
         self.hopSize = hopSize
         self.blockSize = blockSize
         self.windowsPerBlock = windowsPerBlock
         
-        # IPC
-
-        self.inputFrames = inputFrames
-        self.inputFramesArray = inputFramesArray
-        self.outputFrames = outputFrames
-        self.outputFramesArray = outputFramesArray
-        
         # Buffers        
-        self.numBlocksPerBuffer = 8  # 8
-        
-        self.inputBufferIndex = 0
-        self.inputBufferSize = self.blockSize * self.numBlocksPerBuffer
-        self.inputBuffer = np.zeros( (self.numChannels, self.inputBufferSize), np.float32 ) 
-
-        self.outputBufferIndex = 0
-        self.outputBufferSize = self.blockSize * self.numBlocksPerBuffer
-        self.outputBuffer = np.zeros( (self.numChannels, self.outputBufferSize), np.float32 )        
-        
-        self.windowedSamples = np.zeros( (self.numChannels, self.windowSize, self.windowsPerBlock), np.float32 )
-    
-    def processFrames(self, processFramesFunction):  # processFramesFunction은 함수
-        ## 뭔가 공유 메모리에 값이 안넘어가고 공유 메모리 가리키는 변수의 reference를 넘기려 해도 다른 메모리 위치를 가리키고 있음
-        #startTime = time()
-        # inputFrames는 float 값이 들어감
-        self.inputBuffer[:, :-self.blockSize] = self.inputBuffer[:, self.blockSize:]  # (numchannels, inputBufferSize)
-        # logging.info(self.inputFramesArray.get_obj())
-        ########
-        # self.inputFrames[:] = pcm2float(self.inputFramesArray).reshape(-1, self.numChannels).T  # 이걸 공유 메모리로 갱신해야 한다
-        # self.inputFrames[:] = pcm2float(inputIntArray).reshape(-1, self.numChannels).T inputIntArray는 버퍼값으로 읽어온 것
-        # inputBuffer에 inputFrames가 들어감
-        ########
-        # self.inputBuffer[:, -self.blockSize:] = np.array(self.inputFramesArray).reshape(self.numChannels, -1)
-        self.inputBuffer[:, -self.blockSize:] = np.array(self.inputFramesArray).reshape(-1, self.numChannels).T
+        self.numBlocksPerBuffer = numBlocksPerBuffer  # 8
+        self.bufferSize = self.blockSize * self.numBlocksPerBuffer
+        self.framesSize = self.windowSize + (self.windowsPerBlock-1)*self.hopSize
+        if self.bufferSize < max(self.framesSize, 3*self.blockSize):
+            raise ValueError('OverlapAddProcessor: buffer of %d samples too small for %d windows of %d samples' % (self.bufferSize, self.windowsPerBlock, self.windowSize))
+        
+        self.inputBuffer = np.zeros( (self.numChannels, 2*self.bufferSize), np.float32 )
+        self.outputBuffer = np.zeros( (self.numOutputChannels, self.bufferSize), np.float32 )
+        self.headBlockIndex = 0
+        
+        self.inputBlockViews = []
+        self.inputMirrorBlockViews = []
+        self.windowedSampleViews = []
+        self.outputNewBlockViews = []
+        self.outputBlockViews = []
+        self.overlapAddSegments = []
+        for blockIndex in range(self.numBlocksPerBuffer):
+            blockStart = blockIndex * self.blockSize
+            head = blockStart + self.blockSize
+            framesStart = (head - self.framesSize) % self.bufferSize
+            self.inputBlockViews.append( self.inputBuffer[:, blockStart:head] )
+            self.inputMirrorBlockViews.append( self.inputBuffer[:, self.bufferSize+blockStart:self.bufferSize+head] )
+            self.windowedSampleViews.append( as_strided(self.inputBuffer[:, framesStart:], shape=(self.numChannels, self.windowSize, self.windowsPerBlock),
+                                                        strides=(self.inputBuffer.strides[0], self.inputBuffer.itemsize, self.hopSize*self.inputBuffer.itemsize), writeable=False) )
+            outputStart = (head - 3*self.blockSize) % self.bufferSize
+            self.outputNewBlockViews.append( self.outputBuffer[:, blockStart:head] )
+            self.outputBlockViews.append( self.outputBuffer[:, outputStart:outputStart+self.blockSize] )
+            self.overlapAddSegments.append( self.getOverlapAddSegments(framesStart) )
+    
+    def getOverlapAddSegments(self, framesStart):
+        segments = []
+        for windowIndex in range(self.windowsPerBlock):
+            windowStart = (framesStart + windowIndex*self.hopSize) % self.bufferSize
+            numBeforeWrap = min(self.windowSize, self.bufferSize - windowStart)
+            segments.append( (self.outputBuffer[:, windowStart:windowStart+numBeforeWrap], windowIndex, slice(0, numBeforeWrap)) )
+            if numBeforeWrap < self.windowSize:
+                segments.append( (self.outputBuffer[:, :self.windowSize-numBeforeWrap], windowIndex, slice(numBeforeWrap, self.windowSize)) )
+        return segments
+    
+    def processFrames(self, processFramesFunction, inputSamples, outputSamples):  # processFramesFunction은 함수, samples는 interleaved
+        blockIndex = self.headBlockIndex
+        
         # inputBuffer의 마지막 block에 inputFrames 값을 넣는다.
+        inputBlock = inputSamples.reshape(-1, self.numChannels).T
+        self.inputBlockViews[blockIndex][:] = inputBlock
+        self.inputMirrorBlockViews[blockIndex][:] = inputBlock
+        self.outputNewBlockViews[blockIndex][:] = 0
         
-        self.outputBuffer[:, :-self.blockSize] = self.outputBuffer[:, self.blockSize:]
-        self.outputBuffer[:, -self.blockSize:] = 0
+        processedFrames = processFramesFunction(self.windowedSampleViews[blockIndex])
+        for outputView, windowIndex, frameSlice in self.overlapAddSegments[blockIndex]:
+            np.add(outputView, processedFrames[:, frameSlice, windowIndex], out=outputView, casting='same_kind')
         
-        windowIndexes = np.arange(self.inputBufferSize - self.windowSize - (self.windowsPerBlock-1)*self.hopSize, self.inputBufferSize-self.windowSize +1, self.hopSize)
-        for i, windowIndex in enumerate(windowIndexes):
-            self.windowedSamples[..., i] = self.inputBuffer[:, windowIndex:windowIndex+self.windowSize]
+        outputSamples.reshape(-1, self.numOutputChannels)[:] = self.outputBlockViews[blockIndex].T
+        self.headBlockIndex = (blockIndex + 1) % self.numBlocksPerBuffer
 
-        processedFrames = processFramesFunction(self.windowedSamples)
-        
-        for i, windowIndex in enumerate(windowIndexes):
-            self.outputBuffer[:, windowIndex:windowIndex+self.windowSize] += processedFrames[..., i]
 
-        # outputBuffer에는 제대로 값이 나온다
-        self.outputFrames[:] = self.outputBuffer[:, -3*self.blockSize:-2*self.blockSize]
-        self.outputFramesArray[:] = self.outputFrames.T.flatten()
-        '''outputFramesArray에 값을 넣을 때 무언가 잘못됨, 저장 방식? --> 제대로 저장됨(float형)'''
+# Look-ahead peak limiter for interleaved float32 blocks, replacing per-block peak renormalization with a gain that
+# carries over between blocks. Output is delayed by lookAhead frames: each lookAhead-frame segment is scaled by a gain
+# ramp that reaches the segment's required gain (ceiling / peak) before the segment plays, and recovers towards 1
+# with the release time constant. Peaks never exceed the ceiling, and all buffers are preallocated.
+class LookAheadLimiter(object):
+    def __init__(self, numChannels, blockSize, sampleRate, ceiling=0.99, lookAhead=64, releaseInSeconds=0.2):
+        if blockSize % lookAhead != 0:
+            raise ValueError('LookAheadLimiter: blockSize %d must be a multiple of lookAhead %d' % (blockSize, lookAhead))
+        self.numChannels = numChannels
+        self.blockSize = blockSize
+        self.ceiling = np.float32(ceiling)
+        self.lookAhead = lookAhead
+        self.latency = lookAhead
+        self.numSegments = blockSize // lookAhead
+        self.releaseFactor = 1 - exp( -lookAhead / (releaseInSeconds * sampleRate) )
+        
+        self.delayLine = np.zeros( (lookAhead + blockSize, numChannels), np.float32 )
+        self.delayLineHistory = self.delayLine[:lookAhead]
+        self.delayLineTail = self.delayLine[blockSize:]
+        self.delayLineInput = self.delayLine[lookAhead:].reshape(-1)
+        self.delayedFrames = self.delayLine[:blockSize]
+        
+        self.absoluteSamples = np.zeros(blockSize * numChannels, np.float32)
+        self.absoluteSegments = self.absoluteSamples.reshape(self.numSegments, lookAhead * numChannels)
+        self.segmentPeaks = np.zeros(self.numSegments, np.float32)
+        # segmentGains[0] is the required gain of the last segment of the previous block
+        self.segmentGains = np.ones(self.numSegments + 1, np.float32)
+        self.ramp = np.arange(1, lookAhead + 1, dtype=np.float32) / lookAhead
+        self.gains = np.ones(blockSize, np.float32)
+        self.gainSegments = self.gains.reshape(self.numSegments, lookAhead)
+        self.gainColumn = self.gains[:, np.newaxis]
+        self.gain = 1.0
+        
+        self.outputSamples = np.zeros(blockSize * numChannels, np.float32)
+        self.outputFrames = self.outputSamples.reshape(blockSize, numChannels)
+    
+    def process(self, inputSamples):
+        # inputSamples: interleaved (blockSize * numChannels,), returns the interleaved limited block (reused between calls)
+        self.delayLineInput[:] = inputSamples
+        np.abs(inputSamples, out=self.absoluteSamples)
+        np.max(self.absoluteSegments, axis=1, out=self.segmentPeaks)
+        np.maximum(self.segmentPeaks, self.ceiling, out=self.segmentPeaks)
+        np.divide(self.ceiling, self.segmentPeaks, out=self.segmentGains[1:])
+        
+        # output segment i holds input segment i-1, so it may use at most segmentGains[i] and must reach segmentGains[i+1]
+        gain = self.gain
+        for segmentIndex in range(self.numSegments):
+            targetGain = min( float(self.segmentGains[segmentIndex]), float(self.segmentGains[segmentIndex+1]), gain + (1 - gain) * self.releaseFactor )
+            gainSegment = self.gainSegments[segmentIndex]
+            np.multiply(self.ramp, targetGain - gain, out=gainSegment)
+            np.add(gainSegment, gain, out=gainSegment)
+            gain = targetGain
+        self.gain = gain
+        self.segmentGains[0] = self.segmentGains[-1]
+        
+        np.multiply(self.delayedFrames, self.gainColumn, out=self.outputFrames)
+        self.delayLineHistory[:] = self.delayLineTail
+        return self.outputSamples
+    
+    def reset(self):
+        self.delayLine[:] = 0
+        self.segmentGains[:] = 1
+        self.gain = 1.0
 
-        #totalTime = time() - startTime
-        #logging.info('processFrames took %f' % totalTime)
\ No newline at end of file
+# Block activity detector with hysteresis, on the (channel, freq, time) mixture spectrogram. The block level is the
+# loudest frame's mean power in dB, compared to a noise floor that follows drops immediately and rises by at most
+# noiseFloorRiseInDBPerSecond, so silence and stationary noise both sit close to the floor. The detector opens when
+# the level exceeds the floor by onThresholdInDB, and closes once it has stayed below offThresholdInDB for
+# hangoverBlocks consecutive blocks.
+class ActivityDetector(object):
+    def __init__(self, blockDurationInSeconds, onThresholdInDB=9.0, offThresholdInDB=4.0, hangoverBlocks=8, noiseFloorRiseInDBPerSecond=2.0):
+        if offThresholdInDB > onThresholdInDB:
+            raise ValueError('ActivityDetector: offThresholdInDB %.1f must not exceed onThresholdInDB %.1f' % (offThresholdInDB, onThresholdInDB))
+        self.onThresholdInDB = onThresholdInDB
+        self.offThresholdInDB = offThresholdInDB
+        self.hangoverBlocks = hangoverBlocks
+        self.noiseFloorRiseInDB = noiseFloorRiseInDBPerSecond * blockDurationInSeconds
+        self.reset()
+    
+    def update(self, complexSpectrogram):
+        # returns True if the block should be processed
+        # the complex64 spectrogram viewed as (real, imag) float32 pairs: the mean of squares per frame is half its mean power
+        numTime = complexSpectrogram.shape[-1]
+        framePowers = np.mean( np.square( complexSpectrogram.view(np.float32).reshape(-1, numTime, 2) ), axis=(0, 2) )
+        self.levelInDB = 10 * log10( float(np.max(framePowers)) * 2 + 1e-20 )
+        if self.noiseFloorInDB is None:
+            self.noiseFloorInDB = self.levelInDB
+        self.noiseFloorInDB = min(self.levelInDB, self.noiseFloorInDB + self.noiseFloorRiseInDB)
+        
+        levelAboveFloor = self.levelInDB - self.noiseFloorInDB
+        if self.active:
+            self.numQuietBlocks = self.numQuietBlocks + 1 if levelAboveFloor < self.offThresholdInDB else 0
+            self.active = self.numQuietBlocks <= self.hangoverBlocks
+        else:
+            self.active = levelAboveFloor > self.onThresholdInDB
+            self.numQuietBlocks = 0
+        
+        self.numBlocks += 1
+        if not self.active:
+            self.numGatedBlocks += 1
+        return self.active
+    
+    def reset(self):
+        # starts open, so the first blocks are processed while the noise floor settles
+        self.active = True
+        self.numQuietBlocks = 0
+        self.noiseFloorInDB = None
+        self.levelInDB = None
+        self.numBlocks = 0
+        self.numGatedBlocks = 0
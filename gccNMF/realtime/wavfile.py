@@ -26,12 +26,13 @@ SOFTWARE.
 
 import numpy as np
 import contextlib
-from scipy.io import wavfile
 import logging
 
 CLIP_PROTECTION_MAX_SAMPLE_VALUE = 0.99
 
+# scipy is only imported for file I/O, the realtime path only uses the PCM conversions
 def wavread(filePath):
+    from scipy.io import wavfile
     sampleRate, samples_pcm = wavfile.read(filePath)
     samples_float32 = pcm2float(samples_pcm)
     return samples_float32.T, sampleRate
@@ -45,6 +46,7 @@ def wavwrite(samples_float32, filePath, sampleRate, clipProtection=True):
         else:
             raise ValueError('wavwrite: max abs signal value exceeds 1')
     samples_pcm = float2pcm( samples_float32.astype(np.float32) )
+    from scipy.io import wavfile
     wavfile.write( filePath, sampleRate, samples_pcm.T )
     
 """
@@ -54,7 +56,7 @@ Taken from:
 https://raw.githubusercontent.com/mgeier/python-audio/master/audio-files/utility.py
 """
 
-def pcm2float(sig, dtype='float32'):
+def pcm2float(sig, dtype='float32', out=None):
     """Convert PCM signal to floating point with a range from -1 to 1.
 
     Use dtype='float32' for single precision.
@@ -65,6 +67,9 @@ def pcm2float(sig, dtype='float32'):
         Input array, must have integral type.
     dtype : data type, optional
         Desired (floating point) data type.
+    out : numpy.ndarray, optional
+        Preallocated floating point output of the same size as *sig*,
+        written in place (*dtype* is then ignored).
 
     Returns
     -------
@@ -79,17 +84,21 @@ def pcm2float(sig, dtype='float32'):
     sig = np.asarray(sig)
     if sig.dtype.kind not in 'iu':
         raise TypeError("'sig' must be an array of integers")
-    dtype = np.dtype(dtype)
+    dtype = np.dtype(dtype) if out is None else out.dtype
     if dtype.kind != 'f':
         raise TypeError("'dtype' must be a floating point type")
 
     i = np.iinfo(sig.dtype)  # 데이터 타입의 max, min 범위 등 데이터 타입의 성질값들 반환
     abs_max = 2 ** (i.bits - 1)
     offset = i.min + abs_max
+    if out is not None:
+        np.subtract(sig, offset, out=out, dtype=dtype)
+        np.multiply(out, dtype.type(1.0 / abs_max), out=out)
+        return out
     return (sig.astype(dtype) - offset) / abs_max
 
 
-def float2pcm(sig, dtype='int16'):
+def float2pcm(sig, dtype='int16', out=None):
     """Convert floating point signal with a range from -1 to 1 to PCM.
 
     Any signal values outside the interval [-1.0, 1.0) are clipped.
@@ -106,6 +115,10 @@ def float2pcm(sig, dtype='int16'):
         Input array, must have floating point type.
     dtype : data type, optional
         Desired (integer) data type.
+    out : numpy.ndarray, optional
+        Preallocated integer output of the same size as *sig*, written
+        in place (*dtype* is then ignored). *sig* is used as scratch
+        space and overwritten.
 
     Returns
     -------
@@ -121,13 +134,19 @@ def float2pcm(sig, dtype='int16'):
     sig = np.asarray(sig)
     if sig.dtype.kind != 'f':
         raise TypeError("'sig' must be a float array")
-    dtype = np.dtype(dtype)
+    dtype = np.dtype(dtype) if out is None else out.dtype
     if dtype.kind not in 'iu':
         raise TypeError("'dtype' must be an integer type")
 
     i = np.iinfo(dtype)
     abs_max = 2 ** (i.bits - 1)
     offset = i.min + abs_max
+    if out is not None:
+        np.multiply(sig, abs_max, out=sig)
+        np.add(sig, offset, out=sig)
+        np.clip(sig, i.min, i.max, out=sig)
+        np.copyto(out, sig, casting='unsafe')
+        return out
     return (sig * abs_max + offset).clip(i.min, i.max).astype(dtype)
 
 
@@ -0,0 +1,129 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import tracemalloc
+import numpy as np
+import pytest
+
+from gccNMF.realtime.utils import OverlapAddProcessor
+
+# (numChannels, windowSize, hopSize, blockSize, windowsPerBlock)
+OVERLAP_ADD_CONFIGS = [(2, 1024, 512, 512, 1), (2, 1024, 512, 1024, 2), (2, 512, 128, 512, 4), (1, 512, 128, 512, 2), (2, 1024, 256, 1024, 4)]
+NUM_WARMUP_BLOCKS = 24
+NUM_BLOCKS = 64
+
+# The OverlapAddProcessor before the ring buffer rewrite: buffers shifted by blockSize and windows copied every block.
+class ShiftingOverlapAddProcessor(object):
+    def __init__(self, numChannels, windowSize, hopSize, blockSize, windowsPerBlock, numBlocksPerBuffer=8):
+        self.numChannels = numChannels
+        self.windowSize = windowSize
+        self.hopSize = hopSize
+        self.blockSize = blockSize
+        self.windowsPerBlock = windowsPerBlock
+        
+        self.inputBufferSize = self.blockSize * numBlocksPerBuffer
+        self.inputBuffer = np.zeros( (self.numChannels, self.inputBufferSize), np.float32 )
+        self.outputBufferSize = self.blockSize * numBlocksPerBuffer
+        self.outputBuffer = np.zeros( (self.numChannels, self.outputBufferSize), np.float32 )
+        self.windowedSamples = np.zeros( (self.numChannels, self.windowSize, self.windowsPerBlock), np.float32 )
+    
+    def processFrames(self, processFramesFunction, inputSamples, outputSamples):
+        self.inputBuffer[:, :-self.blockSize] = self.inputBuffer[:, self.blockSize:]
+        self.inputBuffer[:, -self.blockSize:] = inputSamples.reshape(-1, self.numChannels).T
+        
+        self.outputBuffer[:, :-self.blockSize] = self.outputBuffer[:, self.blockSize:]
+        self.outputBuffer[:, -self.blockSize:] = 0
+        
+        windowIndexes = np.arange(self.inputBufferSize - self.windowSize - (self.windowsPerBlock-1)*self.hopSize, self.inputBufferSize-self.windowSize +1, self.hopSize)
+        for i, windowIndex in enumerate(windowIndexes):
+            self.windowedSamples[..., i] = self.inputBuffer[:, windowIndex:windowIndex+self.windowSize]
+        
+        processedFrames = processFramesFunction(self.windowedSamples)
+        
+        for i, windowIndex in enumerate(windowIndexes):
+            self.outputBuffer[:, windowIndex:windowIndex+self.windowSize] += processedFrames[..., i]
+        
+        outputSamples.reshape(-1, self.numChannels)[:] = self.outputBuffer[:, -3*self.blockSize:-2*self.blockSize].T
+
+def getWindowingFunction(windowSize):
+    window = np.hanning(windowSize).astype(np.float32)[:, np.newaxis]
+    return lambda windowedSamples: windowedSamples * window
+
+def getInputBlocks(numChannels, blockSize, numBlocks, seedValue=0):
+    return np.random.RandomState(seedValue).randn(numBlocks, numChannels * blockSize).astype(np.float32)
+
+@pytest.mark.parametrize('numChannels, windowSize, hopSize, blockSize, windowsPerBlock', OVERLAP_ADD_CONFIGS)
+def test_outputMatchesShiftingImplementation(numChannels, windowSize, hopSize, blockSize, windowsPerBlock):
+    processFramesFunction = getWindowingFunction(windowSize)
+    processor = OverlapAddProcessor(numChannels, windowSize, hopSize, blockSize, windowsPerBlock)
+    referenceProcessor = ShiftingOverlapAddProcessor(numChannels, windowSize, hopSize, blockSize, windowsPerBlock)
+    outputSamples = np.zeros(numChannels * blockSize, np.float32)
+    referenceOutputSamples = np.zeros(numChannels * blockSize, np.float32)
+    
+    for blockIndex, inputSamples in enumerate( getInputBlocks(numChannels, blockSize, NUM_BLOCKS) ):
+        processor.processFrames(processFramesFunction, inputSamples, outputSamples)
+        referenceProcessor.processFrames(processFramesFunction, inputSamples, referenceOutputSamples)
+        assert np.array_equal(outputSamples, referenceOutputSamples), 'output differs at block %d' % blockIndex
+    assert np.any(outputSamples)
+
+def getPeakBlockAllocation(processor, numChannels, windowSize, windowsPerBlock, blockSize):
+    # largest traced memory peak of a steady-state block, and the numpy array data left allocated afterwards;
+    # processFramesFunction writes into a preallocated buffer, so only the overlap-add itself is measured
+    processedFrames = np.ones( (numChannels, windowSize, windowsPerBlock), np.float32 )
+    processFramesFunction = lambda windowedSamples: processedFrames
+    inputBlocks = getInputBlocks(numChannels, blockSize, NUM_WARMUP_BLOCKS + NUM_BLOCKS)
+    outputSamples = np.zeros(numChannels * blockSize, np.float32)
+    for inputSamples in inputBlocks[:NUM_WARMUP_BLOCKS]:
+        processor.processFrames(processFramesFunction, inputSamples, outputSamples)
+    
+    peakAllocation = 0
+    tracemalloc.start()
+    try:
+        for inputSamples in inputBlocks[NUM_WARMUP_BLOCKS:]:
+            currentSize, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            processor.processFrames(processFramesFunction, inputSamples, outputSamples)
+            peakAllocation = max(peakAllocation, tracemalloc.get_traced_memory()[1] - currentSize)
+        arrayDataSnapshot = tracemalloc.take_snapshot().filter_traces( [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)] )
+    finally:
+        tracemalloc.stop()
+    return peakAllocation, sum( statistic.size for statistic in arrayDataSnapshot.statistics('filename') )
+
+@pytest.mark.parametrize('numChannels, windowSize, hopSize, blockSize, windowsPerBlock', OVERLAP_ADD_CONFIGS)
+def test_steadyStateAllocatesNoArrayData(numChannels, windowSize, hopSize, blockSize, windowsPerBlock):
+    # the only allocations left are the small view objects of reshape and transpose; any array data, even one
+    # channel of one block, would take the traced peak above blockSize float32 samples
+    processor = OverlapAddProcessor(numChannels, windowSize, hopSize, blockSize, windowsPerBlock)
+    peakAllocation, remainingArrayData = getPeakBlockAllocation(processor, numChannels, windowSize, windowsPerBlock, blockSize)
+    assert remainingArrayData == 0
+    assert peakAllocation < blockSize * np.dtype(np.float32).itemsize
+
+def test_allocationCheckDetectsBufferShifts():
+    # the shifting implementation copies its overlapping buffer slices through temporaries every block
+    numChannels, windowSize, hopSize, blockSize, windowsPerBlock = OVERLAP_ADD_CONFIGS[1]
+    processor = ShiftingOverlapAddProcessor(numChannels, windowSize, hopSize, blockSize, windowsPerBlock)
+    peakAllocation, _ = getPeakBlockAllocation(processor, numChannels, windowSize, windowsPerBlock, blockSize)
+    assert peakAllocation >= blockSize * np.dtype(np.float32).itemsize
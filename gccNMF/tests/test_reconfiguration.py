@@ -0,0 +1,118 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2017 Sean UN Wood
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+@author: Sean UN Wood
+'''
+
+import numpy as np
+
+from gccNMF.realtime.defs import TARGET_MODE_WINDOW_FUNCTION, TARGET_MODE_MULTIPLE
+from gccNMF.realtime.utils import SharedMemoryBlockRing
+from gccNMF.benchmarks.reconfigurationBenchmark import runReconfigurations, createProcess
+
+# Deadline misses of GCCNMFProcess reconfiguration on the virtual clock of reconfigurationBenchmark: processFrames
+# costs 0.3 and reset() 8 block durations of the thread running them, independent of the speed of the machine.
+
+NUM_BLOCKS = 120
+SAMPLE_RATE = 16000
+WINDOW_SIZE = 1024
+BLOCK_SIZE = 512
+PROCESSING_COST = 0.3
+RESET_COST = 8.0
+RECONFIGURATIONS = { 20: {'numTDOAs': 128}, 50: {'dictionarySize': 512}, 51: {'numTDOAs': 32, 'dictionarySize': 256},
+                     80: {'targetMode': TARGET_MODE_WINDOW_FUNCTION} }
+
+def runVirtualClockReconfigurations(hotReconfigurationEnabled):
+    return runReconfigurations(hotReconfigurationEnabled, RECONFIGURATIONS, NUM_BLOCKS, SAMPLE_RATE, WINDOW_SIZE, BLOCK_SIZE, PROCESSING_COST, RESET_COST)
+
+def test_hotReconfigurationMissesNoDeadlines():
+    result = runVirtualClockReconfigurations(hotReconfigurationEnabled=True)
+    assert result['deadlineMisses'] == 0
+    assert result['maxLatenessInBlocks'] < 0
+    assert result['swapBlocks']
+    assert dict(result['finalConfig']) == {'numTDOAs': 32, 'dictionarySize': 256}
+
+def test_synchronousReconfigurationMissesDeadlines():
+    # the same schedule with the reset on the worker loop, so the check above can fail
+    result = runVirtualClockReconfigurations(hotReconfigurationEnabled=False)
+    assert result['deadlineMisses'] > 0
+    assert dict(result['finalConfig']) == {'numTDOAs': 32, 'dictionarySize': 256}
+
+def test_multipleTargetsAreClampedToTheDeviceOutput():
+    # the device path's overlap-add and output ring carry a single stereo target
+    process = createProcess(SAMPLE_RATE, WINDOW_SIZE, BLOCK_SIZE, [256], hotReconfigurationEnabled=False)
+    process.togglePlayQueue.put( {'numTDOAs': 64, 'targetMode': TARGET_MODE_MULTIPLE} )
+    process.tdoaParametersQueue.put( {'targetTDOAIndexes': [10, 40]} )
+    process.step(timeout=0)
+    assert list(process.gccNMFProcessor.targetTDOAIndexes) == [10]
+    
+    process.inputRing.writeSlot()[:] = np.random.RandomState(0).randn(2 * BLOCK_SIZE).astype(np.float32)
+    process.inputRing.commitWrite()
+    process.step(timeout=0)
+    assert process.outputRing.numAvailable() == 1
+    assert np.isfinite(process.outputRing.readSlot()).all()
+
+def test_failedReconfigurationDoesNotBlockLaterOnes():
+    process = createProcess(SAMPLE_RATE, WINDOW_SIZE, BLOCK_SIZE, [256], hotReconfigurationEnabled=True)
+    process.togglePlayQueue.put( {'numTDOAs': 64, 'dictionarySize': 256} )
+    process.step(timeout=0)
+    
+    # no dictionary of size 999, the build fails on the builder thread
+    for parameters in [ {'dictionarySize': 999}, {'numTDOAs': 32, 'dictionarySize': 256} ]:
+        process.togglePlayQueue.put(parameters)
+        process.step(timeout=0)
+        builderThread = process.builderThread
+        if builderThread is not None:
+            builderThread.join()
+    
+    process.step(timeout=0)
+    assert not process.isReconfiguring()
+    assert not process.pendingParameters
+    assert process.gccNMFProcessor.numTDOAs == 32
+    assert process.gccNMFProcessor.dictionarySize == 256
+
+def test_dictionaryAdaptationPausesForAnotherDictionary():
+    # the adaptation process keeps learning the 256 atom dictionary the process was created with
+    process = createProcess(SAMPLE_RATE, WINDOW_SIZE, BLOCK_SIZE, [256, 512], hotReconfigurationEnabled=False)
+    process.togglePlayQueue.put( {'numTDOAs': 64} )
+    process.step(timeout=0)
+    process.adaptationRing = SharedMemoryBlockRing(8, process.gccNMFProcessor.numFrequencies * BLOCK_SIZE // (WINDOW_SIZE // 2), wakeupEnabled=False)
+    samples = np.random.RandomState(0).randn(2 * BLOCK_SIZE).astype(np.float32)
+    
+    def processBlock():
+        process.inputRing.writeSlot()[:] = samples
+        process.inputRing.commitWrite()
+        process.step(timeout=0)
+    
+    processBlock()
+    assert process.adaptationRing.numAvailable() == 1
+    
+    process.togglePlayQueue.put( {'dictionarySize': 512} )
+    processBlock()
+    assert process.adaptationPaused
+    assert process.adaptationRing.numAvailable() == 1
+    
+    process.togglePlayQueue.put( {'dictionarySize': 256} )
+    processBlock()
+    assert not process.adaptationPaused
+    assert process.adaptationRing.numAvailable() == 2